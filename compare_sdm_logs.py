@@ -1,18 +1,30 @@
-"""Compare metrics from 2 SDM logs."""
+"""Compare metrics from 2 SDM logs.
+
+To compare one DUT and one REF log:
+  python compare_sdm_logs.py <DUT log folder> <REF log folder>
+To compare every DUT log folder with every REF log folder, without prompts:
+  python compare_sdm_logs.py --batch "<DUT folder glob>" "<REF folder glob>"
+  python compare_sdm_logs.py --batch <manifest.csv with dut,ref columns of log folders>
+DUT and REF samples are compared at the same time of day. To compare logs that were not recorded at the
+same time, timing each from its own first sample, add --relative-time.
+"""
 
 import re
 import os
 import csv
 import sys
+import glob
 import logging
-import matplotlib.pyplot as plt
-import matplotlib.dates as md
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from datetime import datetime, timedelta
-from matplotlib.backends.backend_pdf import PdfPages
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from parsers.lassen_parser import (get_unique_log_files_capinfo_from_log_folder,
-                                   get_metrics_log_from_sdm_file)
+                                   set_default_export_workers)
+from parsers.metrics_table import get_metrics_table
+from parsers.metrics_store import MetricsStore, get_metrics_table_from_sdm_file
+from plotting.figure_renderer import FigureRenderer, FigureSpec
 
 # set up the get_log_metrics logger
 Path(os.getcwd() + '/logs/').mkdir(parents=True, exist_ok=True)
@@ -25,65 +37,68 @@ log = logging.getLogger('compare_sdm_metrics')
 
 
 PDF_NAME = 'Log_File_Analysis_' + datetime.now().strftime('%H-%M-%S') + '.pdf'
+# The e.l1_ca metrics are logged every 50 ms
+LTE_CA_SAMPLE_PERIOD = np.timedelta64(50, 'ms')
+# DUT and REF samples further apart than this are not compared when aligning without bins
+ALIGN_TOLERANCE = pd.Timedelta(milliseconds=100)
+COMPARISON_BIN_SIZE = pd.Timedelta(seconds=1)
+BATCH_RESULTS_NAME = 'Batch_Comparison_' + datetime.now().strftime('%H-%M-%S') + '.csv'
 
 def get_nr_state(parsed_log):
-  """."""
-  output_csv = [['Time', 'DL TP', 'UL TP']]
+  """Gets the NR throughput from a metrics log.
 
-  for line in parsed_log:
-    if 'n.L2_NR_MacThroughput' in line:
-      tmp_line = line.replace('\t', ' ')
-      tmp_line = line.split()
-      time = datetime.strptime(tmp_line[2], '%H:%M:%S.%f')
-      ultp = float(tmp_line[3].split(':')[-1]) / 1000
-      dltp = float(tmp_line[5].split(':')[-1]) / 1000
-      output_csv.append([time, dltp, ultp])
+  Args:
+    parsed_log (MetricsTable or iterable): The metrics log, as a MetricsTable or its lines
+  Returns:
+    nr_state (pd.DataFrame): columns 'Time', 'DL TP', 'UL TP'
+  """
+  nr_metrics = get_metrics_table(parsed_log)['n.L2_NR_MacThroughput']
+  if not len(nr_metrics):
+    return pd.DataFrame(columns=['Time', 'DL TP', 'UL TP'])
 
-  return output_csv
+  return pd.DataFrame({'Time': nr_metrics.get_time(),
+                       'DL TP': nr_metrics.get_position_column(2) / 1000,
+                       'UL TP': nr_metrics.get_position_column(0) / 1000})
 
 
 def get_lte_ca_state(parsed_log):
-  """Gets plottable graph data of throughput from metrics log."""
-  output_csv = [['Time', 'DL TP', 'UL TP', 'DL BW', 'UL BW', 'LTE Bands']]
-
-  tmp_time = '0'
-  dltp = '0'
-  ultp = '0'
-  total_dl_bw = 0
-  total_ul_bw = 0
-  lte_bands = ''
-  lte_ca_combos = []
-
-  for line in parsed_log:
-    if 'e.l1_ca' in line:
-      tmp_line = line.replace('\t', ' ')
-      tmp_line = tmp_line.split()
-      tmp_time = datetime.strptime(tmp_line[2], '%H:%M:%S.%f')
-      dltp = float(tmp_line[4].split(':')[-1]) / 1000
-      ultp = float(tmp_line[5].split(':')[-1]) / 1000
-      total_dl_bw = 0
-      total_ul_bw = 0
-      for tmp in tmp_line:
-        if '.bw' in tmp:
-          total_dl_bw = total_dl_bw + float(tmp.split(':')[-1])
-      for tmp in tmp_line:
-        if '.ulbw' in tmp:
-          total_ul_bw = total_ul_bw + float(tmp.split(':')[-1])
-      lte_bands = 'LTE Bands: '
-      for tmp in tmp_line:
-        if '.band' in tmp:
-          lte_bands = lte_bands + 'B{}_'.format(tmp.split(':')[-1])
-      lte_bands = lte_bands[:-1]
-      log.info(lte_bands)
-      if lte_bands not in lte_ca_combos:
-        lte_ca_combos.append(lte_bands)
-
-      #if 'Deact' not in line:
-      output_csv.append([tmp_time, dltp, ultp, total_dl_bw, total_ul_bw, lte_bands.split()[-1]])
-
-  log.info(output_csv[-6:-1])
-  log.info(lte_ca_combos)
-  return output_csv
+  """Gets plottable graph data of throughput from metrics log.
+
+  Args:
+    parsed_log (MetricsTable or iterable): The metrics log, as a MetricsTable or its lines
+  Returns:
+    lte_state (pd.DataFrame): columns 'Time', 'DL TP', 'UL TP', 'DL BW', 'UL BW', 'LTE Bands'
+  """
+  lte_metrics = get_metrics_table(parsed_log)['e.l1_ca']
+  if not len(lte_metrics):
+    return pd.DataFrame(columns=['Time', 'DL TP', 'UL TP', 'DL BW', 'UL BW', 'LTE Bands'])
+
+  lte_state = pd.DataFrame({'Time': lte_metrics.get_time(),
+                            'DL TP': lte_metrics.get_position_column(1) / 1000,
+                            'UL TP': lte_metrics.get_position_column(2) / 1000,
+                            'DL BW': np.nan_to_num(lte_metrics.get_metric_column('.bw', addative=True)),
+                            'UL BW': np.nan_to_num(lte_metrics.get_metric_column('.ulbw', addative=True)),
+                            'LTE Bands': lte_metrics.get_joined_metric('.band', prefix='B')})
+
+  log.info(lte_state[-6:-1])
+  log.info(list(lte_state['LTE Bands'].unique()))
+  return lte_state
+
+
+def get_data_state(parsed_log):
+  """Gets the total throughput and BLER from a metrics log.
+
+  Args:
+    parsed_log (MetricsTable or iterable): The metrics log, as a MetricsTable or its lines
+  Returns:
+    data_state (pd.DataFrame): columns 'Time', 'DLTP', 'ULTP', 'DLBLER', 'ULBLER'
+  """
+  data_metrics = get_metrics_table(parsed_log)['c.data']
+  return pd.DataFrame({'Time': data_metrics.get_time(),
+                       'DLTP': data_metrics.get_metric_column('dltp'),
+                       'ULTP': data_metrics.get_metric_column('ultp'),
+                       'DLBLER': data_metrics.get_metric_column('dlbler'),
+                       'ULBLER': data_metrics.get_metric_column('ulbler')})
 
 
 def get_time_of_metrics(parsed_log, category):
@@ -100,214 +115,353 @@ def get_time_of_metrics(parsed_log, category):
 
 
 def get_list_of_metrics(parsed_log, category, metric, addative=False):
-  """Take in the psrsed log and extract a list of the metrics"""
-  metric_list = []
-  time_list = []
-
-  for line in parsed_log:
-    if category in line:
-      tmp_metric = ''
-      # Get the line as separated by spaces
-      line = line.replace('\t', ' ')
-      tmp_line = line.split()
-      tmp_time = tmp_line[2]
-      tmp_time = datetime.strptime(tmp_time, '%H:%M:%S.%f')
-      if addative:
-        tmp_value = 0.0
-        for tmp in tmp_line[3:]:
-          if metric in tmp:
-            log.info('{} line: {}'.format(str(tmp_value), tmp))
-            tmp_value = tmp_value + float(tmp.split(':')[-1])
-        tmp_metric = tmp_value
-
-      else:
-        for tmp in tmp_line[3:]:
-          if metric in tmp:
-            tmp_metric = tmp.split(':')[-1]
-            tmp_metric_is_number = True
-            if tmp_metric_is_number:
-              try:
-                tmp_metric = float(tmp_metric)
-              except ValueError:
-                tmp_metric_is_number = False
-                log.info('value is not a float {}'.format(tmp_metric))
-            break
-
-      if not tmp_metric:
-        log.info('{} is not present in line {}'.format(metric, line))
-      else:
-        metric_list.append(tmp_metric)
-        time_list.append(tmp_time)
-
-  return (time_list, metric_list)
+  """Take in the psrsed log and extract a list of the metrics
+
+  Args:
+    parsed_log (MetricsTable or iterable): The metrics log, as a MetricsTable or its lines
+    category (str): The metric category, e.g. 'e.l1_ca'
+    metric (str): A string the metric key contains, e.g. 'dltp'
+    addative (bool): If True all of the keys containing metric are added together
+  Returns:
+    time_list (np.ndarray), metric_list (np.ndarray)
+  """
+  return get_metrics_table(parsed_log, [category])[category].get_metric(metric, addative)
+
+
+def get_datetime64(time):
+  """Returns the times of a series as a datetime64[ns] array."""
+  return pd.to_datetime(pd.Series(time)).to_numpy(dtype='datetime64[ns]')
+
+
+def get_elapsed_time(time):
+  """Returns the time since the first sample of a series as a timedelta64 array."""
+  time = get_datetime64(time)
+  if not len(time):
+    return time.astype('timedelta64[ns]')
+  return time - time[0]
+
+
+def align_metric_series(dut_time, dut_values, ref_time, ref_values, bin_size=None, tolerance=ALIGN_TOLERANCE,
+                        relative_time=False):
+  """Puts a DUT and a REF metric on a common time grid so they can be compared sample by sample.
+
+  The samples are joined on their absolute times, so DUT and REF samples logged at the same moment are
+  compared. With relative_time both series are instead timed from their own first sample, for logs that
+  were recorded at different times.
+
+  Args:
+    dut_time (array): The times of the DUT samples
+    dut_values (array): The DUT samples
+    ref_time (array): The times of the REF samples
+    ref_values (array): The REF samples
+    bin_size (pd.Timedelta): If set both series are averaged into bins of this size and the bins are
+      joined. If None each DUT sample is joined to the nearest REF sample within tolerance
+    tolerance (pd.Timedelta): The furthest apart a DUT and REF sample can be to be joined
+    relative_time (bool): If True each series is timed from its own first sample
+  Returns:
+    aligned (pd.DataFrame): columns 'Time' (absolute times, left out with relative_time), 'Elapsed' (the
+      time since the first aligned sample), 'DUT', 'REF', 'Delta' (DUT - REF). 'REF' and 'Delta' are NaN
+      where there was nothing to join
+  """
+  if relative_time:
+    on = 'Elapsed'
+    dut_key = get_elapsed_time(dut_time)
+    ref_key = get_elapsed_time(ref_time)
+  else:
+    on = 'Time'
+    dut_key = get_datetime64(dut_time)
+    ref_key = get_datetime64(ref_time)
+  dut = pd.DataFrame({on: dut_key, 'DUT': np.asarray(dut_values, dtype=np.float64)})
+  ref = pd.DataFrame({on: ref_key, 'REF': np.asarray(ref_values, dtype=np.float64)})
+
+  if bin_size is not None:
+    dut = dut.groupby(dut[on].dt.floor(bin_size))['DUT'].mean()
+    ref = ref.groupby(ref[on].dt.floor(bin_size))['REF'].mean()
+    aligned = pd.concat([dut, ref], axis=1, join='outer').sort_index()
+    aligned.index.name = on
+    aligned = aligned.reset_index()
+  else:
+    aligned = pd.merge_asof(dut.sort_values(on), ref.sort_values(on), on=on,
+                            direction='nearest', tolerance=tolerance)
+
+  if not relative_time:
+    aligned.insert(1, 'Elapsed', aligned['Time'] - aligned['Time'].min())
+  aligned['Delta'] = aligned['DUT'] - aligned['REF']
+  return aligned
+
+
+def get_comparison_statistics(aligned):
+  """Summarises an aligned DUT and REF metric from align_metric_series().
+
+  Returns:
+    statistics (pd.Series): the number of compared samples, the DUT and REF means and the mean, median,
+      standard deviation, minimum, maximum and RMS of the delta
+  """
+  compared = aligned.dropna(subset=['DUT', 'REF'])
+  delta = compared['Delta'].to_numpy()
+  return pd.Series({
+      'Compared Samples': len(compared),
+      'DUT Mean': compared['DUT'].mean(),
+      'REF Mean': compared['REF'].mean(),
+      'Mean Delta': delta.mean() if len(delta) else np.nan,
+      'Median Delta': np.median(delta) if len(delta) else np.nan,
+      'Delta Std': delta.std() if len(delta) else np.nan,
+      'Min Delta': delta.min() if len(delta) else np.nan,
+      'Max Delta': delta.max() if len(delta) else np.nan,
+      'RMS Delta': np.sqrt(np.mean(delta ** 2)) if len(delta) else np.nan,
+  })
 
 
 # def get_comparisson_graph(dut_parsed_log, ref_parsed_log, )
 
 
-def get_graph_of_full_data_rate(dut_parsed_log, ref_parsed_log, output_pdf):
-  """gets a graph of the DUT v REF total data, bler"""
-  def get_metric(line):
-    """."""
-    metric = line.split(':')[-1]
-    try:
-      metric = metric.replace(',', '')
-      return float(metric)
-    except ValueError:
-      return metric
-
-  dut_dltp = []
-  dut_ultp = []
-  dut_dlbler = []
-  dut_ulbler = []
-  dut_time = []
-  output_csv = [['Time', 'DLTP', 'ULTP', 'DLBLER', 'ULBLER']]
-
-  for line in dut_parsed_log:
-    if 'c.data' in line:
-      tmp_line = line.split()
-      # dut_time.append(tmp_line[1])
-      time = datetime.strptime(tmp_line[1], '%H:%M:%S.%f')
-      dut_time.append(md.date2num(time))
-      # time = tmp_line[1]
-
-      for tmp in tmp_line:
-        if 'dltp' in tmp:
-          dltp = get_metric(tmp)
-          dut_dltp.append(get_metric(tmp))
-        if 'ultp' in tmp:
-          ultp = get_metric(tmp)
-          dut_ultp.append(get_metric(tmp))
-        if 'dlbler' in tmp:
-          dlbler = get_metric(tmp)
-          dut_dlbler.append(get_metric(tmp))
-        if 'ulbler' in tmp:
-          ulbler = get_metric(tmp)
-          dut_ulbler.append(get_metric(tmp))
-      output_csv.append([time, dltp, ultp, dlbler, ulbler])
-
-  with open(Path(str(Path.cwd() / 'last_output_tp_dut.csv')), mode='w') as output_file:
-    writer = csv.writer(output_file)
-    for line in output_csv:
-      writer.writerow(line)
-  
-  ref_dltp = []
-  ref_ultp = []
-  ref_dlbler = []
-  ref_ulbler = []
-  ref_time = []
-  output_csv = [['Time', 'DLTP', 'ULTP', 'DLBLER', 'ULBLER']]
-
-  for line in ref_parsed_log:
-    if 'c.data' in line:
-      tmp_line = line.split()
-      time = datetime.strptime(tmp_line[1], '%H:%M:%S.%f')
-      ref_time.append(md.date2num(time))
-
-      for tmp in tmp_line:
-        if 'dltp' in tmp:
-          dltp = get_metric(tmp)
-          ref_dltp.append(get_metric(tmp))
-        if 'ultp' in tmp:
-          ultp = get_metric(tmp)
-          ref_ultp.append(get_metric(tmp))
-        if 'dlbler' in tmp:
-          dlbler = get_metric(tmp)
-          ref_dlbler.append(get_metric(tmp))
-        if 'ulbler' in tmp:
-          ulbler = get_metric(tmp)
-          ref_ulbler.append(get_metric(tmp))
-      output_csv.append([time, dltp, ultp, dlbler, ulbler])
-
-  #TODO: Merge the lists so the time is a persistent value
-
-  with open (Path(str(Path.cwd() / 'last_output_tp_ref.csv')), mode='w') as output_file:
-    writer = csv.writer(output_file)
-    for line in output_csv:
-      writer.writerow(line)
-
-  fig = plt.figure()
-  fig, ax1 = plt.subplots()
-  ax1.plot(dut_time, dut_dltp, 'b-', label='DUT DL TP')
-  # ax1.plot(dut_time, dut_ultp, label='DUT UL TP')
-  ax1.xaxis.set_major_formatter(md.DateFormatter('%H:%M:%S'))
-  ax2 = ax1.twiny()
-  ax2.plot(ref_time, ref_dltp, 'r-', label='REF DL TP')
-  ax2.xaxis.set_major_formatter(md.DateFormatter('%H:%M:%S'))
-  #ax2.plot(ref_time, ref_ultp, label='REF DL TP')
-  #ax2.plot(ref_time, ref_ultp, label='REF UL TP')
-  ax1.set_xlabel('Time')
-  ax1.set_ylabel('TP (Gbps)')
-  ax1.set_title('DUT v REF Total DL TP')
-  plt.legend(loc='best')
-  fig.savefig('DUT-v-REF_Full_DL_Data_Rate.png')
-  output_pdf.savefig(fig)
-
-  fig = plt.figure()
-  fig, ax1 = plt.subplots()
-  ax1.plot(dut_time, dut_dltp, 'b-', label='DUT UL TP')
-  # ax1.plot(dut_time, dut_ultp, label='DUT UL TP')
-  ax1.xaxis.set_major_formatter(md.DateFormatter('%H:%M:%S'))
-  ax2 = ax1.twiny()
-  ax2.plot(ref_time, ref_dltp, 'r-', label='REF UL TP')
-  ax2.xaxis.set_major_formatter(md.DateFormatter('%H:%M:%S'))
-  #ax2.plot(ref_time, ref_ultp, label='REF DL TP')
-  #ax2.plot(ref_time, ref_ultp, label='REF UL TP')
-  ax1.set_xlabel('Time')
-  ax1.set_ylabel('TP (Gbps)')
-  ax1.set_title('DUT v REF Total UL TP')
-  plt.legend(loc='best')
-  fig.savefig('DUT-v-REF_Full_UL_Data_Rate.png')
-  output_pdf.savefig(fig)
-  return output_pdf
+def get_graph_of_full_data_rate(dut_parsed_log, ref_parsed_log):
+  """gets a graph of the DUT v REF total data, bler
+
+  Returns:
+    figure_specs (list): the FigureSpecs of the DL and UL graphs
+  """
+  dut_data = get_data_state(dut_parsed_log)
+  dut_data.to_csv(Path(str(Path.cwd() / 'last_output_tp_dut.csv')), index=False)
+
+  ref_data = get_data_state(ref_parsed_log)
+  ref_data.to_csv(Path(str(Path.cwd() / 'last_output_tp_ref.csv')), index=False)
+
+  figure_specs = []
+  for direction, metric in (('DL', 'DLTP'), ('UL', 'ULTP')):
+    figure_spec = FigureSpec('DUT-v-REF_Full_{}_Data_Rate.png'.format(direction),
+                             title='DUT v REF Total {} TP'.format(direction), xlabel='Time',
+                             ylabels={'main': 'TP (Gbps)'}, date_format='%H:%M:%S')
+    figure_spec.add_series(dut_data['Time'], dut_data[metric], 'b-', label='DUT {} TP'.format(direction))
+    figure_spec.add_series(ref_data['Time'], ref_data[metric], 'r-', label='REF {} TP'.format(direction),
+                           axis='twiny')
+    figure_specs.append(figure_spec)
+  return figure_specs
+
+
+def get_graph_of_aligned_metric(dut_time, dut_values, ref_time, ref_values, title, file_name,
+                                bin_size=COMPARISON_BIN_SIZE, relative_time=False):
+  """Graphs a DUT and REF metric on one time axis with their difference, and gets the comparison statistics.
+
+  Args:
+    relative_time (bool): If True each series is timed from its own first sample, see align_metric_series()
+  Returns:
+    statistics (pd.Series): see get_comparison_statistics()
+    figure_spec (FigureSpec): the graph
+  """
+  aligned = align_metric_series(dut_time, dut_values, ref_time, ref_values, bin_size=bin_size,
+                                relative_time=relative_time)
+  if relative_time:
+    time = aligned['Elapsed'].dt.total_seconds()
+    figure_spec = FigureSpec(file_name, title=title, rows=2, xlabel='Time since the first sample (s)')
+  else:
+    time = aligned['Time']
+    figure_spec = FigureSpec(file_name, title=title, rows=2, xlabel='Time', date_format='%H:%M:%S')
+  figure_spec.add_series(time, aligned['DUT'], 'b-', label='DUT')
+  figure_spec.add_series(time, aligned['REF'], 'r-', label='REF')
+  figure_spec.add_series(time, aligned['Delta'], 'k-', label='DUT - REF', row=1)
+  figure_spec.add_horizontal_line(0, row=1)
+
+  statistics = get_comparison_statistics(aligned)
+  log.info('{}:\n{}'.format(title, statistics))
+  return statistics, figure_spec
+
+
+def get_lte_ca_band_statistics(lte_dataframe):
+  """Gets how long the UE spent in each LTE CA combo and how it moved between them.
+
+  Args:
+    lte_dataframe (pd.DataFrame): An LTE CA state from get_lte_ca_state(), in time order
+  Returns:
+    dwell_time (pd.Series): the time spent in each combo, in the order the combos first appear. The first
+      sample of a combo counts as one sample period, every later sample adds the time since the sample
+      before it
+    transitions (pd.DataFrame): the number of times the UE moved from the combo of the row to the combo
+      of the column
+    visits (pd.DataFrame): columns 'LTE Bands', 'Start', 'Duration' of each unbroken run of a combo. A
+      visit lasts until the next visit starts, the last one for one sample period after its last sample
+  """
+  time = lte_dataframe['Time'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+  codes, combos = pd.factorize(lte_dataframe['LTE Bands'].to_numpy())
+  num_combos = len(combos)
+  sample_period = LTE_CA_SAMPLE_PERIOD.astype('timedelta64[ns]').astype(np.int64)
+
+  time_since_last_sample = np.diff(time, prepend=time[:1])
+  first_samples = np.unique(codes, return_index=True)[1]
+  time_since_last_sample[first_samples] = sample_period
+  dwell_time = np.zeros(num_combos, dtype=np.int64)
+  np.add.at(dwell_time, codes, time_since_last_sample)
+  dwell_time = pd.Series(dwell_time.astype('timedelta64[ns]'), index=combos, name='Dwell Time')
+
+  visit_starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.array([], dtype=int)
+  visit_ends = np.append(time[visit_starts[1:]], time[-1:] + sample_period)
+  visits = pd.DataFrame({'LTE Bands': combos[codes[visit_starts]],
+                         'Start': time[visit_starts].astype('datetime64[ns]'),
+                         'Duration': (visit_ends - time[visit_starts]).astype('timedelta64[ns]')})
+
+  transitions = np.zeros((num_combos, num_combos), dtype=np.int64)
+  np.add.at(transitions, (codes[visit_starts[:-1]], codes[visit_starts[1:]]), 1)
+  transitions = pd.DataFrame(transitions, index=combos, columns=combos)
+
+  return dwell_time, transitions, visits
 
 
 def get_time_spent_in_lte_ca_bands(lte_dataframe):
-  """."""
-  # get the duration of LTE CA state
-  time_in_bands = []
-  # get the initial line for comparisson
-  for index, line in lte_dataframe.iterrows():
-    log.info(line['LTE Bands'])
-    first_ca_band = line['LTE Bands']
-    last_time = line['Time']
-    log.info(type(last_time))
-    time_in_bands.append([first_ca_band, last_time - last_time + timedelta(milliseconds=50)])
-    break
-  log.info(time_in_bands)
-  for index, line in lte_dataframe.iterrows():
-    band_present = False
-    for row in time_in_bands:
-      if line['LTE Bands'] in row:
-        band_present = True
-        break
-
-    if not band_present:
-      time_in_bands.append([line['LTE Bands'], timedelta(milliseconds=50)])
-    else:
-      for num, combo in enumerate(time_in_bands):
-        log.info(time_in_bands)
-        log.info(time_in_bands[num][1])
-        if line['LTE Bands'] in combo:
-          log.info(line['Time'])
-          log.info(last_time)
-          dif = line['Time'].to_pydatetime() - last_time
-          log.info(dif)
-          time_in_bands[num][1] = time_in_bands[num][1] + line['Time'].to_pydatetime() - last_time
-          break
-    last_time = line['Time'].to_pydatetime()
+  """Gets the time spent in each LTE CA combo.
 
+  Returns:
+    time_in_bands (list): [combo, timedelta] of each combo, in the order the combos first appear
+  """
+  dwell_time = get_lte_ca_band_statistics(lte_dataframe)[0]
+  time_in_bands = [[combo, dwell.to_pytimedelta()] for combo, dwell in dwell_time.items()]
   log.info(time_in_bands)
-
   return time_in_bands
 
 
+def get_batch_pairings(batch_args):
+  """Gets the DUT and REF log folder pairings of a batch comparison.
+
+  Args:
+    batch_args (list): Either the path of a csv manifest with 'dut' and 'ref' columns of log folders, or
+      a glob of DUT log folders and a glob of REF log folders, which are paired every DUT with every REF
+  Returns:
+    pairings (list): (dut_log_folder, ref_log_folder) of every comparison
+  """
+  if len(batch_args) == 1:
+    with open(batch_args[0], newline='') as manifest_file:
+      return [(Path(row['dut']), Path(row['ref'])) for row in csv.DictReader(manifest_file)]
+  if len(batch_args) == 2:
+    dut_log_folders = sorted(Path(folder) for folder in glob.glob(batch_args[0]) if Path(folder).is_dir())
+    ref_log_folders = sorted(Path(folder) for folder in glob.glob(batch_args[1]) if Path(folder).is_dir())
+    return [(dut_log_folder, ref_log_folder) for dut_log_folder in dut_log_folders
+            for ref_log_folder in ref_log_folders]
+  raise ValueError('--batch needs a manifest csv, or a DUT folder glob and a REF folder glob')
+
+
+def store_batch_log_metrics(log_file):
+  """Parses the metrics of one log into its metrics store, so every pairing it is in can load it.
+
+  Returns:
+    error (str): None if the metrics were stored, otherwise why they were not
+  """
+  try:
+    get_metrics_table_from_sdm_file(log_file, overwrite=False)
+  except Exception as error:  # one bad log should not stop the rest of the batch
+    log.exception('could not parse the metrics of {}'.format(str(log_file)))
+    return repr(error)
+  return None
+
+
+def compare_batch_pair(dut_log_file, ref_log_file, relative_time=False):
+  """Compares the stored metrics of a DUT and a REF log.
+
+  Args:
+    dut_log_file (Path): The DUT log
+    ref_log_file (Path): The REF log
+    relative_time (bool): If True each log is timed from its own first sample, see align_metric_series()
+  Returns:
+    result (dict): the DUT and REF logs and the comparison statistics of each metric
+  """
+  result = {'DUT': str(dut_log_file), 'REF': str(ref_log_file)}
+  dut_log_metrics = MetricsStore(dut_log_file).load()
+  ref_log_metrics = MetricsStore(ref_log_file).load()
+  if dut_log_metrics is None or ref_log_metrics is None:
+    result['Error'] = 'metrics not stored'
+    return result
+
+  dut_data = get_data_state(dut_log_metrics)
+  ref_data = get_data_state(ref_log_metrics)
+  dut_lte_state = get_lte_ca_state(dut_log_metrics)
+  ref_lte_state = get_lte_ca_state(ref_log_metrics)
+  dut_nr_state = get_nr_state(dut_log_metrics)
+  ref_nr_state = get_nr_state(ref_log_metrics)
+  metrics = {
+      'Total DL TP': (dut_data['Time'], dut_data['DLTP'], ref_data['Time'], ref_data['DLTP']),
+      'LTE DL TP': (dut_lte_state['Time'], dut_lte_state['DL TP'], ref_lte_state['Time'], ref_lte_state['DL TP']),
+      'NR DL TP': (dut_nr_state['Time'], dut_nr_state['DL TP'], ref_nr_state['Time'], ref_nr_state['DL TP']),
+  }
+  for metric, series in metrics.items():
+    aligned = align_metric_series(*series, bin_size=COMPARISON_BIN_SIZE, relative_time=relative_time)
+    for statistic, value in get_comparison_statistics(aligned).items():
+      result['{} {}'.format(metric, statistic)] = value
+  return result
+
+
+def run_batch(batch_args, output_csv=BATCH_RESULTS_NAME, workers=None, relative_time=False):
+  """Compares every DUT and REF pairing of a batch and writes the results to one csv.
+
+  Each log is parsed once, however many pairings it is in, and both the parsing and the comparisons
+  are run in a process pool. The CPUs are shared out between the processes for their DMConsole exports,
+  so the pool never runs more exports at once than there are CPUs. A pairing with a folder that has no
+  logs gets a row with the error, and the rest of the batch goes on.
+
+  Args:
+    batch_args (list): See get_batch_pairings()
+    output_csv (str): The consolidated results file
+    workers (int): The number of processes. Defaults to the number of CPUs
+    relative_time (bool): If True each log is timed from its own first sample, see align_metric_series()
+  Returns:
+    results (pd.DataFrame): one row per pairing
+  """
+  folder_pairings = get_batch_pairings(batch_args)
+  log_files = {}
+  folder_errors = {}
+  pairings = []
+  for dut_log_folder, ref_log_folder in folder_pairings:
+    for log_folder in (dut_log_folder, ref_log_folder):
+      if log_folder not in log_files and log_folder not in folder_errors:
+        try:
+          log_files[log_folder] = get_unique_log_files_capinfo_from_log_folder(log_folder)[0]
+        except LookupError as error:  # a folder without logs should not stop the rest of the batch
+          log.info('skipping log folder {}: {!r}'.format(log_folder, error))
+          folder_errors[log_folder] = repr(error)
+    if dut_log_folder in log_files and ref_log_folder in log_files:
+      pairings.append((log_files[dut_log_folder], log_files[ref_log_folder]))
+  print('Comparing {} pairings of {} logs'.format(len(pairings), len(log_files)))
+  if folder_errors:
+    print('Skipping {} log folders: {}'.format(len(folder_errors), folder_errors))
+
+  unique_log_files = list(dict.fromkeys(log_files.values()))
+  workers = workers or os.cpu_count() or 1
+  export_workers = max(1, (os.cpu_count() or 1) // workers)
+  with ProcessPoolExecutor(max_workers=workers, initializer=set_default_export_workers,
+                           initargs=(export_workers,)) as executor:
+    parse_errors = dict(zip(unique_log_files, executor.map(store_batch_log_metrics, unique_log_files)))
+    compared = iter(list(executor.map(compare_batch_pair, *zip(*pairings), [relative_time] * len(pairings)))
+                    if pairings else [])
+
+  # the results keep the order of the batch, a pairing with a folder that had no logs is a row with its error
+  results = []
+  for dut_log_folder, ref_log_folder in folder_pairings:
+    errors = [folder_errors[log_folder] for log_folder in (dut_log_folder, ref_log_folder)
+              if log_folder in folder_errors]
+    if errors:
+      results.append({'DUT': str(dut_log_folder), 'REF': str(ref_log_folder), 'Error': '; '.join(errors)})
+      continue
+    result = next(compared)
+    errors = [parse_errors[log_files[log_folder]] for log_folder in (dut_log_folder, ref_log_folder)
+              if parse_errors[log_files[log_folder]]]
+    if errors:
+      result['Error'] = '; '.join(errors)
+    results.append(result)
+
+  results = pd.DataFrame(results)
+  results.to_csv(output_csv, index=False)
+  print('Batch results written to {}'.format(output_csv))
+  return results
+
+
 def main():
   """Main function to compare SDM metrics."""
   #TODO: allow the main function to receive either one or two CLI inputs with the directories of log files
 
   # If there are 2 command line entries we can use those as log paths
   args = sys.argv[1:]
+  relative_time = '--relative-time' in args
+  args = [arg for arg in args if arg != '--relative-time']
+  if args and args[0] == '--batch':
+    run_batch(args[1:], relative_time=relative_time)
+    return
   if len(args) > 1:
     dut_log_folder = args[0]
     dut_log_file = get_unique_log_files_capinfo_from_log_folder(dut_log_folder)[0]
@@ -343,8 +497,8 @@ def main():
   print('DUT log file: {}'.format(str(dut_log_file)))
   print('REF log file: {}'.format(str(ref_log_file)))
 
-  dut_log_metrics = get_metrics_log_from_sdm_file(dut_log_file, overwrite=False)
-  ref_log_metrics = get_metrics_log_from_sdm_file(ref_log_file, overwrite=False)
+  dut_log_metrics = get_metrics_table_from_sdm_file(dut_log_file, overwrite=False)
+  ref_log_metrics = get_metrics_table_from_sdm_file(ref_log_file, overwrite=False)
 
   dut_time, dut_log_metrics_lte_dltp = get_list_of_metrics(dut_log_metrics, 'e.l1_ca', 'dltp')
   ref_time, ref_log_metrics_lte_dltp = get_list_of_metrics(ref_log_metrics, 'e.l1_ca', 'dltp')
@@ -355,83 +509,65 @@ def main():
   log.info(len(dut_log_metrics_lte_dltp))
   log.info(len(ref_log_metrics_lte_dltp))
 
-  output_pdf = PdfPages(PDF_NAME)
-
-  fig = plt.figure()
-  fig, ax1 = plt.subplots()
-
-  ax1.plot(dut_time, dut_log_metrics_lte_dltp, label='Downlink TP DUT')
-  ax2 = ax1.twiny()
-  ax3 = ax1.twinx()
-  #ax4 = ax1.twinx()
-  ax2.plot(ref_time, ref_log_metrics_lte_dltp, 'g', label='Downlink TP REF')
-  ax3.plot(dut_time2, dut_log_metrics_lte_dlbw, 'o--', label='DL BW')
-  ax3.plot(ref_time2, ref_log_metrics_lte_dlbw, 'g--', label='Ref BW')
-  ax1.set_xlabel('Time')
-  ax1.set_ylabel('TP (kbps)')
-  ax3.set_ylabel('Bandwidth (MHz)')
-  ax1.set_title('LTE DL TP DUTvREF')
-  fig.show()
-  fig.savefig('dut-ref-BW.png')
-  output_pdf.savefig(fig)
-
-  get_graph_of_full_data_rate(dut_log_metrics, ref_log_metrics, output_pdf)
-
-  dut_lte_state = pd.DataFrame(get_lte_ca_state(dut_log_metrics)[1:], columns=['Time', 'DL TP', 'UL TP', 'DL BW', 'UL BW', 'LTE Bands'])
-  ref_lte_state = pd.DataFrame(get_lte_ca_state(ref_log_metrics)[1:], columns=['Time', 'DL TP', 'UL TP', 'DL BW', 'UL BW', 'LTE Bands'])
+  figure_specs = []
+  figure_spec = FigureSpec('dut-ref-BW.png', title='LTE DL TP DUTvREF', xlabel='Time',
+                           ylabels={'main': 'TP (kbps)', 'twinx': 'Bandwidth (MHz)'})
+  figure_spec.add_series(dut_time, dut_log_metrics_lte_dltp, label='Downlink TP DUT')
+  figure_spec.add_series(ref_time, ref_log_metrics_lte_dltp, 'g', label='Downlink TP REF', axis='twiny')
+  figure_spec.add_series(dut_time2, dut_log_metrics_lte_dlbw, 'o--', label='DL BW', axis='twinx')
+  figure_spec.add_series(ref_time2, ref_log_metrics_lte_dlbw, 'g--', label='Ref BW', axis='twinx')
+  figure_specs.append(figure_spec)
+
+  figure_specs.extend(get_graph_of_full_data_rate(dut_log_metrics, ref_log_metrics))
+
+  dut_data = get_data_state(dut_log_metrics)
+  ref_data = get_data_state(ref_log_metrics)
+  comparisons = {}
+  comparisons['Total DL TP'], figure_spec = get_graph_of_aligned_metric(
+      dut_data['Time'], dut_data['DLTP'], ref_data['Time'], ref_data['DLTP'], 'DUT v REF Total DL TP (aligned)',
+      'dut-v-ref-total-dltp-aligned.png', relative_time=relative_time)
+  figure_specs.append(figure_spec)
+  comparisons['LTE DL TP'], figure_spec = get_graph_of_aligned_metric(
+      dut_time, dut_log_metrics_lte_dltp, ref_time, ref_log_metrics_lte_dltp, 'DUT v REF LTE DL TP (aligned)',
+      'dut-v-ref-lte-dltp-aligned.png', relative_time=relative_time)
+  figure_specs.append(figure_spec)
+
+  dut_lte_state = get_lte_ca_state(dut_log_metrics)
+  ref_lte_state = get_lte_ca_state(ref_log_metrics)
 
   log.info(str(dut_lte_state[0:5]))
   log.info(str(ref_lte_state[0:5]))
 
-  fig = plt.figure()
-  fig, ax1 = plt.subplots()
-
-  ax1.plot(dut_lte_state["Time"], dut_lte_state["DL TP"], label='DUT Downlink TP')
-  ax4 = ax1.twinx()
-  ax4.plot(dut_lte_state["Time"], dut_lte_state["DL BW"], 'r--', label='DUT DL Bandwidth')
-  ax2 = ax1.twiny()
-  ax2.plot(ref_lte_state["Time"], ref_lte_state["DL TP"], 'g-', label='REF Downlink TP')
-  ax5 = ax2.twinx()
-  ax5.plot(ref_lte_state["Time"], ref_lte_state["DL BW"], 'y--', label='REF DL Bandwidth')
-  ax1.set_ylabel('LTE DL TP (Mbps)')
-  ax2.set_ylabel('Bandwidth (MHz)')
-  ax1.set_title('DUT v REF LTE TP and BW')
-  plt.legend(loc='best')
-  fig.show()
-  fig.savefig('dut-v-ref-lte-dltp-bw.png')
-  output_pdf.savefig(fig)
-
-  fig = plt.figure()
-  fig, ax1 = plt.subplots()
-
-  ax1.plot(dut_lte_state["Time"], dut_lte_state["UL TP"], label='Downlink TP')
-  ax1.plot(dut_lte_state["Time"], dut_lte_state["UL BW"], 'b--', label='DL Bandwidth')
-  ax2 = ax1.twiny()
-  ax2.plot(ref_lte_state["Time"], ref_lte_state["UL TP"], 'g-', label='Downlink TP')
-  ax2.plot(ref_lte_state["Time"], ref_lte_state["UL BW"], 'g--', label='DL Bandwidth')
-  ax1.set_ylabel('LTE DL TP (Mbps)')
-  ax2.set_ylabel('Bandwidth (MHz)')
-  ax1.set_title('DUT v REF LTE UL TP and BW')
-  plt.legend(loc='best')
-  fig.show()
-  fig.savefig('dut-v-ref-lte-ultp-bw.png')
-  output_pdf.savefig(fig)
-
-  fig = plt.figure()
-  fig, ax1 = plt.subplots()
-
-  ax1.plot(dut_lte_state["Time"], dut_lte_state["DL TP"], label='Downlink TP')
-  ax1.plot(dut_lte_state["Time"], dut_lte_state["LTE Bands"], 'b--', label='DL Bandwidth')
-  ax2 = ax1.twiny()
-  ax2.plot(ref_lte_state["Time"], ref_lte_state["DL TP"], 'g-', label='Downlink TP')
-  ax2.plot(ref_lte_state["Time"], ref_lte_state["LTE Bands"], 'g--', label='DL Bandwidth')
-  ax1.set_ylabel('LTE DL TP (Mbps)')
-  ax2.set_ylabel('Bandwidth (MHz)')
-  ax1.set_title('DUT v REF LTE UL TP and BW')
-  plt.legend(loc='best')
-  fig.show()
-  fig.savefig('dut-v-ref-lte-dltp-bands.png')
-  output_pdf.savefig(fig)
+  figure_spec = FigureSpec('dut-v-ref-lte-dltp-bw.png', title='DUT v REF LTE TP and BW',
+                           ylabels={'main': 'LTE DL TP (Mbps)', 'twiny_twinx': 'Bandwidth (MHz)'})
+  figure_spec.add_series(dut_lte_state["Time"], dut_lte_state["DL TP"], label='DUT Downlink TP')
+  figure_spec.add_series(dut_lte_state["Time"], dut_lte_state["DL BW"], 'r--', label='DUT DL Bandwidth',
+                         axis='twinx')
+  figure_spec.add_series(ref_lte_state["Time"], ref_lte_state["DL TP"], 'g-', label='REF Downlink TP',
+                         axis='twiny')
+  figure_spec.add_series(ref_lte_state["Time"], ref_lte_state["DL BW"], 'y--', label='REF DL Bandwidth',
+                         axis='twiny_twinx')
+  figure_specs.append(figure_spec)
+
+  figure_spec = FigureSpec('dut-v-ref-lte-ultp-bw.png', title='DUT v REF LTE UL TP and BW',
+                           ylabels={'main': 'LTE UL TP (Mbps)', 'twiny': 'Bandwidth (MHz)'})
+  figure_spec.add_series(dut_lte_state["Time"], dut_lte_state["UL TP"], label='DUT Uplink TP')
+  figure_spec.add_series(dut_lte_state["Time"], dut_lte_state["UL BW"], 'b--', label='DUT UL Bandwidth')
+  figure_spec.add_series(ref_lte_state["Time"], ref_lte_state["UL TP"], 'g-', label='REF Uplink TP',
+                         axis='twiny')
+  figure_spec.add_series(ref_lte_state["Time"], ref_lte_state["UL BW"], 'g--', label='REF UL Bandwidth',
+                         axis='twiny')
+  figure_specs.append(figure_spec)
+
+  figure_spec = FigureSpec('dut-v-ref-lte-dltp-bands.png', title='DUT v REF LTE DL TP and Bands',
+                           ylabels={'main': 'LTE DL TP (Mbps)', 'twiny': 'LTE Bands'})
+  figure_spec.add_series(dut_lte_state["Time"], dut_lte_state["DL TP"], label='DUT Downlink TP')
+  figure_spec.add_series(dut_lte_state["Time"], dut_lte_state["LTE Bands"], 'b--', label='DUT LTE Bands')
+  figure_spec.add_series(ref_lte_state["Time"], ref_lte_state["DL TP"], 'g-', label='REF Downlink TP',
+                         axis='twiny')
+  figure_spec.add_series(ref_lte_state["Time"], ref_lte_state["LTE Bands"], 'g--', label='REF LTE Bands',
+                         axis='twiny')
+  figure_specs.append(figure_spec)
 
   analysis = []
   # analysis.append('DUT has average DLTP {}'.format(str(dut_lte_state[dut_lte_state["DL TP"] > 5].mean(1))))
@@ -457,33 +593,25 @@ def main():
   tmp_df = ref_lte_state[ref_lte_state["DL TP"] > 10.0]["DL TP"]
   analysis.append('Reference has average LTE DLTP: {}'.format(str(int(tmp_df.mean()))))
 
-  dut_nr_state = pd.DataFrame(get_nr_state(dut_log_metrics)[1:], columns=['Time', 'DL TP', 'UL TP'])
-  ref_nr_state = pd.DataFrame(get_nr_state(ref_log_metrics)[1:], columns=['Time', 'DL TP', 'UL TP'])
-
-  fig = plt.figure()
-  fig, ax1 = plt.subplots()
-
-  ax1.plot(dut_nr_state['Time'], dut_nr_state['DL TP'], label='DUT NR DL TP')
-  ax1.set_title('NR DL TP DUT v REF')
-  ax2 = ax1.twiny()
-  ax2.plot(ref_nr_state['Time'], ref_nr_state['DL TP'], 'g', label='REF NR DL TP')
-
-  plt.legend(loc='best')
-  fig.savefig('dut-v-ref-nr-dl-stats.png')
-  output_pdf.savefig(fig)
-
-  fig = plt.figure()
-  fig, ax1 = plt.subplots()
-
-  ax1.plot(dut_nr_state['Time'], dut_nr_state['UL TP'], label='DUT NR UL TP')
-  ax1.set_title('NR UL TP DUT v REF')
-  ax2 = ax1.twiny()
-  ax2.plot(ref_nr_state['Time'], ref_nr_state['UL TP'], 'r', label='REF NR UL TP')
-  plt.legend(loc='best')
-  fig.savefig('dut-v-ref-nr-ul-stats.png')
-  output_pdf.savefig(fig)
-
-  output_pdf.close()
+  for metric, statistics in comparisons.items():
+    analysis.append('{} DUT - REF over {} aligned seconds: mean {:.1f}, median {:.1f}, min {:.1f}, '
+                    'max {:.1f}'.format(metric, statistics['Compared Samples'], statistics['Mean Delta'],
+                                        statistics['Median Delta'], statistics['Min Delta'],
+                                        statistics['Max Delta']))
+
+  dut_nr_state = get_nr_state(dut_log_metrics)
+  ref_nr_state = get_nr_state(ref_log_metrics)
+
+  for direction in ('DL', 'UL'):
+    figure_spec = FigureSpec('dut-v-ref-nr-{}-stats.png'.format(direction.lower()),
+                             title='NR {} TP DUT v REF'.format(direction))
+    figure_spec.add_series(dut_nr_state['Time'], dut_nr_state['{} TP'.format(direction)],
+                           label='DUT NR {} TP'.format(direction))
+    figure_spec.add_series(ref_nr_state['Time'], ref_nr_state['{} TP'.format(direction)], 'g',
+                           label='REF NR {} TP'.format(direction), axis='twiny')
+    figure_specs.append(figure_spec)
+
+  FigureRenderer().render_to_pdf(figure_specs, PDF_NAME)
 
   for line in analysis:
     print(line)
@@ -2,11 +2,26 @@
 
 The class gives the developer or tester an adb interface where they can send
 commands to all connected devices and also monitor and control the state of
-those devices."""
+those devices.
+
+To find the connected devices, querying them all at once:
+>>>devices = AdbInterface().discover_connected_devices(max_concurrency=8)
+To read several telephony registry values with one dumpsys:
+>>>snapshot = AdbInterface().get_registry_snapshot(device_id)
+>>>snapshot.get_value('Mcc'), snapshot.get_value('Mnc'), snapshot.signal_strength['LTE']
+Shell commands run in a long lived adb shell per device, see adb_session. To run every command as its
+own adb process instead, with a different adb:
+>>>adb = AdbInterface(adb_path='/path/to/adb', use_shell_sessions=False)
+"""
+import asyncio
 import logging
+import re
 import subprocess
+import time
 from pathlib import Path
 
+from constructors.adb_session import AdbShellSessionPool
+
 
 # set up the AdbInterface logger
 Path('./logs/').mkdir(parents=True, exist_ok=True)
@@ -17,11 +32,71 @@ logging.basicConfig(level=logging.DEBUG,
                     filemode='w')
 log = logging.getLogger('adb_interface_logger')
 
+# Seconds an adb command may take during device discovery before it is killed
+COMMAND_TIMEOUT = 30
+# The most devices queried at the same time during device discovery
+DISCOVERY_CONCURRENCY = 8
+# Seconds a telephony registry snapshot is reused before dumpsys is run again
+REGISTRY_TTL = 2.0
+# The CellSignalStrength objects of mSignalStrength and the RAT they are reported under
+SIGNAL_STRENGTH_RATS = {
+    'CellSignalStrengthNr': 'NR',
+    'CellSignalStrengthGsm': 'GSM',
+    'CellSignalStrengthWcdma': 'WCDMA',
+    'CellSignalStrengthLte': 'LTE',
+}
+# A key=value item of a CellSignalStrength object. NR writes them as key = value
+SIGNAL_STRENGTH_ITEM_PATTERN = re.compile(r'(\w+)\s*=\s*([^\s,{}]+)')
+
 
 class AdbDevice:
   pass
 
 
+class TelephonyRegistrySnapshot:
+  """
+  The telephony registry of a device at one point in time, parsed once from dumpsys telephony.registry.
+
+  Attributes:
+    registry: each registry key to its first non empty value
+    signal_strength: RAT ('NR', 'GSM', 'WCDMA' or 'LTE') to the items of its CellSignalStrength object
+    time: the time.monotonic() the snapshot was taken
+  """
+  def __init__(self, registry_output, snapshot_time=None):
+    """
+    Args:
+      registry_output: the stdout of dumpsys telephony.registry, as bytes
+      snapshot_time: the time.monotonic() of the dump. Defaults to now
+    """
+    self.time = time.monotonic() if snapshot_time is None else snapshot_time
+    self.registry = get_registry(registry_output)
+    self.values = {}
+    self.signal_strength = get_signal_strength_from_registry(registry_output)
+
+  def __repr__(self):
+    return 'TelephonyRegistrySnapshot({} keys)'.format(len(self.registry))
+
+  def get_age(self):
+    """Returns the seconds since the snapshot was taken."""
+    return time.monotonic() - self.time
+
+  def get_value(self, register_item):
+    """Gets the value of a register item like AdbInterface.get_telephony_parameter(), from the parsed
+    registry. An item that is not a whole key matches the first key ending with it, e.g. 'DataRegState'
+    matches 'mDataRegState', and the match is remembered.
+
+    Returns:
+      None if the register item is not present, or the value if it is there
+    """
+    value = self.registry.get(register_item)
+    if value is not None:
+      return value
+    if register_item not in self.values:
+      self.values[register_item] = next((value for key, value in self.registry.items()
+                                         if key.endswith(register_item)), None)
+    return self.values[register_item]
+
+
 class AdbInterface:
   """Class AdbInterface provides a platform for managing connected adb devices.
 
@@ -36,32 +111,138 @@ class AdbInterface:
   to be authorised by the end user
   """
 
-  def __init__(self):
+  def __init__(self, registry_ttl=REGISTRY_TTL, adb_path='adb', use_shell_sessions=True):
+    """
+    Args:
+      registry_ttl: seconds a telephony registry snapshot is reused. 0 dumps the registry for every read
+      adb_path: the adb executable
+      use_shell_sessions: if True shell commands are run in a long lived adb shell per device
+    """
     self.log = logging.getLogger('adb_interface_logger')
     self.log.info('adb interface initiated')
+    self.registry_ttl = registry_ttl
+    self.registry_snapshots = {}
+    self.adb_path = str(adb_path)
+    self.rooted_devices = set()
+    self.shell_sessions = None
+    if use_shell_sessions:
+      self.shell_sessions = AdbShellSessionPool(self.adb_path, on_reconnect=self.rooted_devices.discard)
 
   def run(self, command, device_id=None, shell=False):
-    """."""
-    command = command.split()
-    if shell:
-      if 'shell' not in command:
-        command.insert(0, 'shell')
-    if 'adb' not in command:
-      command.insert(0, 'adb')
-
-    if device_id is not None:
-      command.insert(1, '-s')
-      command.insert(2, device_id)
+    """Runs an adb command and returns its subprocess.CompletedProcess.
 
+    Shell commands are run in the shell session of the device if shell sessions are used.
+    """
+    command = get_adb_command(command, device_id, shell, self.adb_path)
+    shell_index = command.index('shell') if 'shell' in command else None
+    if self.shell_sessions is not None and shell_index is not None and shell_index + 1 < len(command):
+      return self.shell_sessions.run(command[shell_index + 1:], device_id)
     output = subprocess.run(command, capture_output=True)
     return output
 
+  def root(self, device_id=None):
+    """Restarts adbd as root on a device, unless it was already done since the device last dropped.
+
+    Returns:
+      the output of adb root, or None if the device is already rooted
+    """
+    if device_id in self.rooted_devices:
+      return None
+    output = self.run('root', device_id)
+    self.log.debug(output)
+    if output.returncode == 0:
+      if b'restarting' in output.stdout:
+        # adbd restarting ends the shell session, and the device is gone until it is back up
+        if self.shell_sessions is not None:
+          self.shell_sessions.close(device_id)
+        self.wait_for_device(device_id)
+      self.rooted_devices.add(device_id)
+    return output
+
+  def close(self):
+    """Ends the shell sessions."""
+    if self.shell_sessions is not None:
+      self.shell_sessions.close_all()
+
+  async def run_async(self, command, device_id=None, shell=False, timeout=COMMAND_TIMEOUT):
+    """Runs an adb command without blocking the event loop.
+
+    Args:
+      command: the adb command, as for run()
+      device_id: the serial number of the device to run it on
+      shell: if True the command is run in adb shell
+      timeout: seconds before the command is killed
+    Returns:
+      a subprocess.CompletedProcess like run(). A command that timed out has an empty stdout and a
+      non zero returncode
+    """
+    command = get_adb_command(command, device_id, shell, self.adb_path)
+    process = await asyncio.create_subprocess_exec(*command, stdout=subprocess.PIPE,
+                                                   stderr=subprocess.PIPE)
+    try:
+      stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+      process.kill()
+      await process.communicate()
+      self.log.debug('adb command timed out after {} s: {}'.format(timeout, command))
+      return subprocess.CompletedProcess(command, process.returncode or -1, b'', b'timed out')
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+  async def root_async(self, device_id=None, timeout=COMMAND_TIMEOUT):
+    """Does root() without blocking the event loop, waiting for adbd to come back if it restarted.
+
+    Returns:
+      the output of adb root, or None if the device is already rooted
+    """
+    if device_id in self.rooted_devices:
+      return None
+    output = await self.run_async('root', device_id, timeout=timeout)
+    self.log.debug(output)
+    if output.returncode == 0:
+      if b'restarting' in output.stdout:
+        if self.shell_sessions is not None:
+          self.shell_sessions.close(device_id)
+        await self.run_async('wait-for-device', device_id, timeout=timeout)
+      self.rooted_devices.add(device_id)
+    return output
+
   def wait_for_device(self, device_id=None):
     """Wait for any adb device, or the specific one in the argument device_id."""
     command = 'wait-for-device'
     output = self.run(command, device_id)
     return output
 
+  def get_registry_snapshot(self, device_id, max_age=None):
+    """Gets a snapshot of the telephony registry of a device, reusing the last one while it is fresh.
+
+    Args:
+      device_id: the serial number of the device
+      max_age: seconds the cached snapshot may be old. Defaults to registry_ttl
+    Returns:
+      a TelephonyRegistrySnapshot, or None if dumpsys failed
+    """
+    max_age = self.registry_ttl if max_age is None else max_age
+    snapshot = self.registry_snapshots.get(device_id)
+    if snapshot is not None and snapshot.get_age() < max_age:
+      return snapshot
+
+    self.root(device_id)
+    output = self.run('dumpsys telephony.registry', device_id, True)
+    if output.returncode != 0:
+      self.log.debug('Error in ADB command. source: {}'.format(str(output)))
+      self.registry_snapshots.pop(device_id, None)
+      return None
+    snapshot = TelephonyRegistrySnapshot(output.stdout)
+    self.registry_snapshots[device_id] = snapshot
+    return snapshot
+
+  def clear_registry_snapshots(self, device_id=None):
+    """Drops the cached telephony registry snapshot of a device, or of every device if device_id is None."""
+    if device_id is None:
+      self.registry_snapshots.clear()
+    else:
+      self.registry_snapshots.pop(device_id, None)
+
   def get_telephony_parameter(self, register_item, device_id):
     """Take the string and check if it is present in the telephony registry of the chosen device.
 
@@ -71,110 +252,24 @@ class AdbInterface:
     Returns:
       None if the register item is not present, or the value if it is there
     """
-    register = ''
-    register_item = str(register_item)
-    output = self.run('root', device_id)
-    self.log.debug(output)
-    output = self.run('dumpsys telephony.registry', device_id, True)
-    if output.returncode == 0:
-      output = str(output.stdout)
-      output = output.split()
-      for registry in output:
-        if register_item in registry:
-          sub_registers = registry.split()
-          for sub_register in sub_registers:
-            if register_item + '=' in sub_register:
-              index = sub_register.find('=')
-              register = sub_register[index + 1 :]
-              self.log.debug('Register item: {}:, index: {}, register value: {}'.format(sub_register,
-                                                                                        str(index),
-                                                                                        register))
-              if len(register) > 0:
-                return register
-
-      if not register:
-        self.log.debug('No register item with {} is found'.format(register_item))
-
-    else:
+    snapshot = self.get_registry_snapshot(device_id)
+    if snapshot is None:
       self.log.debug('Error in ADB command. Returning None')
       return None
+    return snapshot.get_value(str(register_item))
 
   def get_current_rat(self, device_id):
     """Gets the current attached RAT and returns the string representation."""
-    current_rat = 'unknown'
     rat_id = self.get_telephony_parameter('getRilDataRadioTechnology', device_id)
-    if rat_id:
-      current_rat = rat_id[ rat_id.find('(') + 1 : rat_id.find(')') ]
-
-    return current_rat
+    return get_rat_name(rat_id)
 
   def get_signal_strength(self, device_id):
-    """Gets a string representing the signal strength"""
-    signal_strength_registry = ''
-    signal_strength_dict = {}
-    output = self.run('root', device_id)
-    self.log.debug(output)
-    output = self.run('dumpsys telephony.registry', device_id, True)
-    if output.returncode == 0:
-      output = str(output.stdout)
-      output = output.readlines()
-
-      for line in output:
-        if 'mSignalStrength' in line:
-          signal_strength_registry = line
-          break
-
-      self.log.debug('Signal Strength_registry: {}'.format(signal_strength_registry))
-
-      # Get the individual signal strength objects from the "mSingalStrength" telephony registry
-      signal_strength_objects = signal_strength_registry.split(',')
-
-      for signal_strength_object in signal_strength_objects:
-        if 'primary' in signal_strength_objects:
-          continue
-        if 'CellSignalStrengthNr' in signal_strength_object:
-          # Add NR signal strength to the SignalStrength dictionary
-          signal_strength_dict['NR'] = {}
-          signal_strength_object_items = signal_strength_object.split()
-          index = 0
-          for item in signal_strength_object_items:
-            if '=' in item:
-              signal_strength_dict['NR'][signal_strength_object_items[index - 1]] = signal_strength_object_items[index + 1]
-        if 'CellSignalStrengthGsm' in signal_strength_object:
-          # Add GSM signal strength to SignalStrength dictionary
-          signal_strength_dict['GSM'] = {}
-          signal_strength_object_items = signal_strength_object.split()
-          for item in signal_strength_object_items:
-            if 'CellSignalStrength' in item:
-              continue
-
-            item_values = item.split('=')
-            signal_strength_dict['GSM'][item_values[0]] = item_values[-1]
-        if 'CellSignalStrengthWcdma' in signal_strength_object:
-          # Add GSM signal strength to SignalStrength dictionary
-          signal_strength_dict['WCDMA'] = {}
-          signal_strength_object_items = signal_strength_object.split()
-          for item in signal_strength_object_items:
-            if 'CellSignalStrength' in item:
-              continue
-
-            item_values = item.split('=')
-            signal_strength_dict['WCDMA'][item_values[0]] = item_values[-1]
-        if 'CellSignalStrengthLte' in signal_strength_object:
-          # Add GSM signal strength to SignalStrength dictionary
-          signal_strength_dict['LTE'] = {}
-          signal_strength_object_items = signal_strength_object.split()
-          for item in signal_strength_object_items:
-            if 'CellSignalStrength' in item:
-              continue
-
-            item_values = item.split('=')
-            signal_strength_dict['LTE'][item_values[0]] = item_values[-1]
-    else:
+    """Gets the signal strength of each RAT, e.g. {'LTE': {'rsrp': '-90', ...}}"""
+    snapshot = self.get_registry_snapshot(device_id)
+    if snapshot is None:
       print('signal strength object not available')
-      self.log.debug('signal strength object not available. source: {}'.format(str(output)))
-
-    return signal_strength_dict
+      return {}
+    return {rat: dict(items) for rat, items in snapshot.signal_strength.items()}
 
 
   def fastboot_command(self, command, device_id=None):
@@ -201,69 +296,29 @@ class AdbInterface:
     :return:
     """
     output = self.run('adb devices')
-    response = str(output.stdout)
-    response = response.split('\\n')
+    devices = get_adb_device_entries(output.stdout)
 
-    if len(response) > 3:
+    if devices:
       connected_devices_detail = []
       self.log.debug('some devices are connected. getting relevant lines')
-      response.pop(0)
-      response.pop()
-      response.pop()
 
-      for device in response:
+      for device in devices:
         # Getting device serial number
         self.log.debug('adb device return: %s', device)
-        current_device_detail = {}
-        device = device.split('\\t')
         device_serial_number = device[0]
-        current_device_detail['serial_no'] = device_serial_number
-        self.log.debug('serial number = %s', current_device_detail['serial_no'])
 
-        # Get the product name of the current device being checked
+        # Get the product name and software of the current device being checked
         name = self.run('getprop ro.product.name', device_serial_number, True)
-        name = name.stdout.decode('utf-8')
-        name = name.strip()
-        self.log.debug('name: %s', name)
-        current_device_detail['name'] = name
-
-        # Get the software
         software = self.run('getprop ro.build.id ', device_serial_number, True)
-        software = software.stdout.decode('utf-8')
-        software = software.strip()
-        software = software.replace('.', '-')
-        current_device_detail['software'] = software
-
-        # Get the MCC
-        mcc = self.get_telephony_parameter('Mcc',
-                                           current_device_detail['serial_no'])
-        current_device_detail['mcc'] = mcc
-
-        # Get the MNC
-        mnc = self.get_telephony_parameter('Mnc',
-                                           current_device_detail['serial_no'])
-        current_device_detail['mnc'] = mnc
-
-        # Get the current RAT
-        current_rat = self.get_current_rat(current_device_detail['serial_no'])
-        current_device_detail['rat'] = current_rat
-
-        # Get the NW name
-        current_nw_name = self.get_telephony_parameter('mOperatorAlphaShort', current_device_detail['serial_no'])
-        if not current_nw_name:
-          current_nw_name = 'UNKNOWN'
-        current_nw_name = current_nw_name.replace(',', '')
-        current_nw_name = current_nw_name.split('.')
-        current_nw_name = current_nw_name[0]
-        current_device_detail['nw'] = current_nw_name
-
-        if 'unauthorized' in device:
-          self.log.debug('the following device is not authorised')
-          print(device_serial_number + ' is not authorised')
-        if 'disconnected' in device_serial_number:
-          print(device_serial_number + ' is not connected')
-
-        connected_devices_detail.append(current_device_detail)
+
+        # Get the MCC, MNC, current RAT and NW name
+        mcc = self.get_telephony_parameter('Mcc', device_serial_number)
+        mnc = self.get_telephony_parameter('Mnc', device_serial_number)
+        current_rat = self.get_current_rat(device_serial_number)
+        current_nw_name = self.get_telephony_parameter('mOperatorAlphaShort', device_serial_number)
+
+        connected_devices_detail.append(get_device_detail(device, name.stdout, software.stdout, mcc, mnc,
+                                                          current_rat, current_nw_name))
 
       self.log.debug('Connected device detail: %s',
                      str(connected_devices_detail))
@@ -273,6 +328,64 @@ class AdbInterface:
       self.log.debug('No devices connected')
       return None
 
+  async def get_device_detail_async(self, device, semaphore, timeout=COMMAND_TIMEOUT):
+    """Gets the detail of one device, as in get_connected_devices(), with one telephony registry dump.
+
+    Args:
+      device: the fields of the device's line of adb devices, see get_adb_device_entries()
+      semaphore: an asyncio.Semaphore bounding the devices queried at the same time
+      timeout: seconds each adb command may take
+    """
+    device_serial_number = device[0]
+    async with semaphore:
+      name, software = await asyncio.gather(
+          self.run_async('getprop ro.product.name', device_serial_number, True, timeout),
+          self.run_async('getprop ro.build.id', device_serial_number, True, timeout))
+      await self.root_async(device_serial_number, timeout)
+      registry = await self.run_async('dumpsys telephony.registry', device_serial_number, True, timeout)
+
+    mcc = mnc = rat_id = current_nw_name = None
+    if registry.returncode == 0:
+      snapshot = TelephonyRegistrySnapshot(registry.stdout)
+      self.registry_snapshots[device_serial_number] = snapshot
+      mcc = snapshot.get_value('Mcc')
+      mnc = snapshot.get_value('Mnc')
+      rat_id = snapshot.get_value('getRilDataRadioTechnology')
+      current_nw_name = snapshot.get_value('mOperatorAlphaShort')
+    else:
+      self.log.debug('Error in ADB command for {}: {}'.format(device_serial_number, registry))
+    return get_device_detail(device, name.stdout, software.stdout, mcc, mnc, get_rat_name(rat_id),
+                             current_nw_name)
+
+  async def get_connected_devices_async(self, max_concurrency=DISCOVERY_CONCURRENCY,
+                                        timeout=COMMAND_TIMEOUT):
+    """Returns the same list as get_connected_devices(), querying the devices concurrently.
+
+    Args:
+      max_concurrency: the most devices queried at the same time
+      timeout: seconds each adb command may take
+    """
+    output = await self.run_async('adb devices', timeout=timeout)
+    devices = get_adb_device_entries(output.stdout)
+    if not devices:
+      self.log.debug('No devices connected')
+      return None
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    connected_devices_detail = await asyncio.gather(
+        *[self.get_device_detail_async(device, semaphore, timeout) for device in devices])
+    connected_devices_detail = list(connected_devices_detail)
+    self.log.debug('Connected device detail: %s', str(connected_devices_detail))
+    return connected_devices_detail
+
+  def discover_connected_devices(self, max_concurrency=DISCOVERY_CONCURRENCY, timeout=COMMAND_TIMEOUT):
+    """Runs get_connected_devices_async() to completion, for callers that are not async.
+
+    Returns:
+      a list of the device detail dicts of get_connected_devices(), or None if no devices are connected
+    """
+    return asyncio.run(self.get_connected_devices_async(max_concurrency, timeout))
+
   def wait_for_authorised_devices(self):
     """Wait for all connected devices to be authorised by the user.
 
@@ -306,5 +419,168 @@ class AdbInterface:
     return devices
 
 
+def get_adb_command(command, device_id=None, shell=False, adb_path='adb'):
+  """Builds the argument list of an adb command.
+
+  Args:
+    command: the adb command, with or without the leading 'adb'
+    device_id: the serial number of the device to run it on
+    shell: if True the command is run in adb shell
+    adb_path: the adb executable
+  """
+  command = command.split()
+  if shell:
+    if 'shell' not in command:
+      command.insert(0, 'shell')
+  if 'adb' not in command:
+    command.insert(0, 'adb')
+
+  if device_id is not None:
+    command.insert(1, '-s')
+    command.insert(2, device_id)
+  if command[0] == 'adb':
+    command[0] = adb_path
+  return command
+
+
+def get_adb_device_entries(adb_devices_output):
+  """Gets the lines of the devices in the output of adb devices.
+
+  Args:
+    adb_devices_output: the stdout of adb devices, as bytes
+  Returns:
+    a list with the fields of each device line, e.g. [['serial number', 'device']]. Empty if no
+    devices are connected
+  """
+  response = str(adb_devices_output)
+  response = response.split('\\n')
+  if len(response) <= 3:
+    return []
+  # drop the 'List of devices attached' header and the empty line and quote at the end
+  return [device.split('\\t') for device in response[1:-2]]
+
+
+def get_registry_tokens(registry_output):
+  """Splits the output of dumpsys telephony.registry, bytes or text, into its whitespace separated tokens."""
+  if isinstance(registry_output, bytes):
+    registry_output = registry_output.decode('utf-8', errors='replace')
+  return str(registry_output).split()
+
+
+def get_registry(registry_output):
+  """Parses the key=value tokens of dumpsys telephony.registry.
+
+  Args:
+    registry_output: the stdout of dumpsys telephony.registry, as bytes
+  Returns:
+    each registry key to its first non empty value
+  """
+  registry = {}
+  for token in get_registry_tokens(registry_output):
+    key, separator, value = token.partition('=')
+    if separator and value and key not in registry:
+      registry[key] = value
+  return registry
+
+
+def get_registry_value(registry_output, register_item):
+  """Finds the value of a register item in the output of dumpsys telephony.registry.
+
+  Args:
+    registry_output: the stdout of dumpsys telephony.registry as bytes, or its whitespace separated tokens
+    register_item: a string to search the registry
+  Returns:
+    None if the register item is not present, or the value if it is there
+  """
+  register_item = str(register_item)
+  if not isinstance(registry_output, list):
+    registry_output = get_registry_tokens(registry_output)
+  for registry in registry_output:
+    if register_item + '=' in registry:
+      index = registry.find('=')
+      register = registry[index + 1 :]
+      log.debug('Register item: {}:, index: {}, register value: {}'.format(registry, str(index), register))
+      if len(register) > 0:
+        return register
+
+  log.debug('No register item with {} is found'.format(register_item))
+  return None
+
+
+def get_signal_strength_from_registry(registry_output):
+  """Parses the CellSignalStrength objects of the mSignalStrength line of dumpsys telephony.registry.
+
+  Args:
+    registry_output: the stdout of dumpsys telephony.registry, as bytes
+  Returns:
+    RAT ('NR', 'GSM', 'WCDMA' or 'LTE') to a dict of the items of its object, e.g. {'rsrp': '-90'}
+  """
+  signal_strength_registry = ''
+  for line in registry_output.decode('utf-8', errors='replace').splitlines():
+    if 'mSignalStrength' in line:
+      signal_strength_registry = line
+      break
+  log.debug('Signal Strength_registry: {}'.format(signal_strength_registry))
+
+  signal_strength_dict = {}
+  # Get the individual signal strength objects from the "mSignalStrength" telephony registry
+  for signal_strength_object in signal_strength_registry.split(','):
+    # primary= only names the object of the serving RAT
+    if 'primary' in signal_strength_object:
+      continue
+    for object_name, rat in SIGNAL_STRENGTH_RATS.items():
+      if object_name in signal_strength_object:
+        signal_strength_dict[rat] = {key: value for key, value in
+                                     SIGNAL_STRENGTH_ITEM_PATTERN.findall(signal_strength_object)
+                                     if 'SignalStrength' not in value}
+  return signal_strength_dict
+
+
+def get_rat_name(rat_id):
+  """Gets the name of a RAT from a getRilDataRadioTechnology value such as 14(LTE), or 'unknown'."""
+  current_rat = 'unknown'
+  if rat_id:
+    current_rat = rat_id[ rat_id.find('(') + 1 : rat_id.find(')') ]
+  return current_rat
+
+
+def get_device_detail(device, name, software, mcc, mnc, current_rat, current_nw_name):
+  """Builds the device detail dict of get_connected_devices().
+
+  Args:
+    device: the fields of the device's line of adb devices
+    name: the stdout of getprop ro.product.name, as bytes
+    software: the stdout of getprop ro.build.id, as bytes
+    mcc, mnc: the registry values, or None
+    current_rat: the name of the RAT
+    current_nw_name: the mOperatorAlphaShort registry value, or None
+  """
+  device_serial_number = device[0]
+  current_device_detail = {}
+  current_device_detail['serial_no'] = device_serial_number
+  log.debug('serial number = %s', current_device_detail['serial_no'])
+
+  name = name.decode('utf-8').strip()
+  log.debug('name: %s', name)
+  current_device_detail['name'] = name
+  current_device_detail['software'] = software.decode('utf-8').strip().replace('.', '-')
+  current_device_detail['mcc'] = mcc
+  current_device_detail['mnc'] = mnc
+  current_device_detail['rat'] = current_rat
+
+  if not current_nw_name:
+    current_nw_name = 'UNKNOWN'
+  current_nw_name = current_nw_name.replace(',', '')
+  current_nw_name = current_nw_name.split('.')
+  current_device_detail['nw'] = current_nw_name[0]
+
+  if 'unauthorized' in device:
+    log.debug('the following device is not authorised')
+    print(device_serial_number + ' is not authorised')
+  if 'disconnected' in device_serial_number:
+    print(device_serial_number + ' is not connected')
+  return current_device_detail
+
+
 if __name__ == '__main__':
   pass
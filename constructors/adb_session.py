@@ -0,0 +1,238 @@
+"""The adb_session module keeps one long lived adb shell open per device.
+
+Starting adb for every command costs a process spawn and an adb handshake. An AdbShellSession starts
+'adb shell' once and writes each command to its stdin. After each command it echoes a marker with the
+exit status, to both stdout and stderr, so the output of each command can be cut out of the streams.
+If the device drops, the session is started again the next time it is used.
+
+To use:
+>>>sessions = AdbShellSessionPool(adb_path='adb')
+>>>output = sessions.run('getprop ro.product.name', device_id)
+>>>output.returncode, output.stdout
+>>>sessions.close_all()
+"""
+import logging
+import queue
+import subprocess
+import threading
+import time
+import uuid
+from pathlib import Path
+
+
+# set up the adb_session logger
+Path('./logs/').mkdir(parents=True, exist_ok=True)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                    datefmt='%m-%d %H:%M',
+                    filename='./logs/tool_log.log',
+                    filemode='w')
+log = logging.getLogger('adb_session_logger')
+
+# Seconds a command may run in a shell session before the session is closed
+SESSION_COMMAND_TIMEOUT = 30
+# The returncode of a command whose session dropped and could not be started again
+SESSION_FAILED_RETURNCODE = 255
+
+
+class CommandNotSentError(ConnectionError):
+  """The session closed before a command was written to it, so the command did not run."""
+
+
+def read_lines(stream, lines):
+  """Puts every line of a stream on a queue, then None once the stream closes. Run in a thread."""
+  for line in iter(stream.readline, b''):
+    lines.put(line)
+  stream.close()
+  lines.put(None)
+
+
+class AdbShellSession:
+  """One long lived adb shell on a device, running one command at a time."""
+
+  def __init__(self, device_id=None, adb_path='adb', timeout=SESSION_COMMAND_TIMEOUT):
+    """
+    Args:
+      device_id: the serial number of the device. None uses the only connected device
+      adb_path: the adb executable
+      timeout: seconds a command may run before the session is closed
+    """
+    self.device_id = device_id
+    self.adb_path = str(adb_path)
+    self.timeout = timeout
+    self.process = None
+    self.stdout_lines = None
+    self.stderr_lines = None
+    self.connections = 0
+    self.lock = threading.Lock()
+
+  def __repr__(self):
+    return 'AdbShellSession({}, {})'.format(self.device_id, 'open' if self.is_alive() else 'closed')
+
+  def is_alive(self):
+    """Returns True if the adb shell is running."""
+    return self.process is not None and self.process.poll() is None
+
+  def connect(self):
+    """Starts the adb shell, closing the last one first."""
+    self.close()
+    command = [self.adb_path]
+    if self.device_id is not None:
+      command.extend(['-s', self.device_id])
+    command.append('shell')
+    self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+    self.stdout_lines = queue.Queue()
+    self.stderr_lines = queue.Queue()
+    for stream, lines in ((self.process.stdout, self.stdout_lines), (self.process.stderr, self.stderr_lines)):
+      threading.Thread(target=read_lines, args=(stream, lines), daemon=True).start()
+    self.connections += 1
+    log.debug('adb shell session {} started for {}'.format(self.connections, self.device_id))
+
+  def close(self):
+    """Ends the adb shell, if it is running."""
+    if self.process is None:
+      return
+    try:
+      self.process.stdin.close()
+      self.process.wait(timeout=1)
+    except (OSError, subprocess.TimeoutExpired):
+      self.process.kill()
+      self.process.wait()
+    self.process = None
+    log.debug('adb shell session closed for {}'.format(self.device_id))
+
+  def read_frame(self, lines, marker, deadline):
+    """Reads the lines of one stream up to the marker.
+
+    Returns:
+      output (bytes), status (bytes): the output of the command, and what followed the marker
+    """
+    output = []
+    while True:
+      try:
+        line = lines.get(timeout=max(0, deadline - time.monotonic()))
+      except queue.Empty:
+        raise TimeoutError('adb shell command on {} timed out after {} s'.format(self.device_id, self.timeout))
+      if line is None:
+        raise ConnectionError('adb shell session to {} closed'.format(self.device_id))
+      index = line.find(marker)
+      if index >= 0:
+        # output that does not end with a line break is on the same line as the marker
+        output.append(line[:index])
+        return b''.join(output), line[index + len(marker):].strip()
+      output.append(line)
+
+  def run(self, command):
+    """Runs a shell command in the session, starting the session if it is not running.
+
+    The command must not read stdin, it would read the commands that follow it.
+
+    Args:
+      command: the shell command, a string or a list of its words
+    Returns:
+      a subprocess.CompletedProcess with the exit status, stdout and stderr of the command
+    Raises:
+      CommandNotSentError: the session closed before the command was written, so it did not run
+      ConnectionError: the session closed while the command ran, e.g. the device dropped. The command
+        may have run. The next run() starts the session again
+      TimeoutError: the command took longer than timeout. The session is closed
+    """
+    if not isinstance(command, str):
+      command = ' '.join(command)
+    with self.lock:
+      if not self.is_alive():
+        self.connect()
+      marker = '__adb_session_{}__'.format(uuid.uuid4().hex)
+      # the marker is written in two quoted halves, so a shell that echoes its input never shows it whole
+      split_marker = '{}""{}'.format(marker[:8], marker[8:])
+      script = '{}\necho "{} $?"\necho "{}" >&2\n'.format(command, split_marker, split_marker)
+      try:
+        self.process.stdin.write(script.encode('utf-8'))
+        self.process.stdin.flush()
+      except OSError as error:
+        self.close()
+        raise CommandNotSentError('adb shell session to {} closed: {}'.format(self.device_id, error))
+      try:
+        deadline = time.monotonic() + self.timeout
+        stdout, status = self.read_frame(self.stdout_lines, marker.encode('utf-8'), deadline)
+        stderr, _ = self.read_frame(self.stderr_lines, marker.encode('utf-8'), deadline)
+      except (OSError, TimeoutError):
+        self.close()
+        raise
+    returncode = int(status) if status.isdigit() else SESSION_FAILED_RETURNCODE
+    return subprocess.CompletedProcess(command, returncode, stdout, stderr)
+
+
+class AdbShellSessionPool:
+  """An AdbShellSession per device, started when the device is first used."""
+
+  def __init__(self, adb_path='adb', timeout=SESSION_COMMAND_TIMEOUT, on_reconnect=None):
+    """
+    Args:
+      adb_path: the adb executable
+      timeout: seconds a command may run before its session is closed
+      on_reconnect: called with the device_id when a session dropped and is started again
+    """
+    self.adb_path = adb_path
+    self.timeout = timeout
+    self.on_reconnect = on_reconnect
+    self.sessions = {}
+    self.lock = threading.Lock()
+
+  def __repr__(self):
+    return 'AdbShellSessionPool({})'.format(list(self.sessions.values()))
+
+  def get_session(self, device_id=None):
+    """Gets the session of a device, creating it if there is none."""
+    with self.lock:
+      if device_id not in self.sessions:
+        self.sessions[device_id] = AdbShellSession(device_id, self.adb_path, self.timeout)
+      return self.sessions[device_id]
+
+  def run(self, command, device_id=None):
+    """Runs a shell command on a device, starting the session again if the device dropped.
+
+    The command is only sent again if the session closed before it was written. A session that
+    closes while the command runs may have run it, e.g. a reboot, so the failure is returned instead.
+
+    Args:
+      command: the shell command, a string or a list of its words
+      device_id: the serial number of the device
+    Returns:
+      a subprocess.CompletedProcess. If the command timed out or the session could not be started again
+      the stdout is empty, the stderr says why and the returncode is not 0
+    """
+    if not isinstance(command, str):
+      command = ' '.join(command)
+    session = self.get_session(device_id)
+    if session.process is not None and not session.is_alive():
+      log.debug('adb shell session to {} dropped, starting it again'.format(device_id))
+      if self.on_reconnect:
+        self.on_reconnect(device_id)
+    try:
+      try:
+        return session.run(command)
+      except CommandNotSentError as error:
+        log.debug('{}, starting it again'.format(error))
+        if self.on_reconnect:
+          self.on_reconnect(device_id)
+        return session.run(command)
+    except (ConnectionError, TimeoutError) as error:
+      log.debug(error)
+      # the session is started again by the next command
+      if isinstance(error, ConnectionError) and self.on_reconnect:
+        self.on_reconnect(device_id)
+      return subprocess.CompletedProcess(command, SESSION_FAILED_RETURNCODE, b'', str(error).encode('utf-8'))
+
+  def close(self, device_id=None):
+    """Ends the session of a device. It is started again the next time the device is used."""
+    session = self.sessions.get(device_id)
+    if session is not None:
+      with session.lock:
+        session.close()
+
+  def close_all(self):
+    """Ends every session."""
+    for device_id in list(self.sessions):
+      self.close(device_id)
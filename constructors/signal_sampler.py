@@ -0,0 +1,281 @@
+"""The signal_sampler module records the signal strength of every device on a rack through a drive.
+
+A SignalSampler polls the telephony registry of each device about once a second. The devices are polled
+concurrently, and each sample goes into a fixed size ring buffer for its device. The buffers are flushed
+to .npz chunks of float32 columns. Each chunk has int64 epoch nanosecond timestamps, so it lines up with
+the modem metrics in a MetricsTable.
+
+To use:
+>>>sampler = SignalSampler(AdbInterface(), output_folder=Path('signal_traces'))
+>>>sampler.start()
+>>>...
+>>>sampler.stop()
+>>>trace = load_signal_trace(Path('signal_traces'), device_id)
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from parsers.metrics_table import datetime_to_epoch_ns
+
+
+# set up the signal_sampler logger
+Path('./logs/').mkdir(parents=True, exist_ok=True)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                    datefmt='%m-%d %H:%M',
+                    filename='./logs/tool_log.log',
+                    filemode='w')
+log = logging.getLogger('signal_sampler_logger')
+
+SAMPLE_PERIOD = 1.0
+# Samples kept per device between flushes, an hour at SAMPLE_PERIOD
+BUFFER_CAPACITY = 3600
+# Seconds between flushes
+FLUSH_INTERVAL = 60.0
+# A buffer this full is flushed straight away, before it starts dropping samples
+FLUSH_THRESHOLD = 0.75
+# Column name to the RAT and item of get_signal_strength() it is read from
+SIGNAL_FIELDS = {
+    'lte_rsrp': ('LTE', 'rsrp'),
+    'lte_rsrq': ('LTE', 'rsrq'),
+    'lte_sinr': ('LTE', 'rssnr'),
+    'nr_ss_rsrp': ('NR', 'ssRsrp'),
+    'nr_ss_rsrq': ('NR', 'ssRsrq'),
+    'nr_ss_sinr': ('NR', 'ssSinr'),
+}
+# The value Android reports for an item that is not available
+UNAVAILABLE = 2147483647
+
+
+class SignalRingBuffer:
+  """
+  A fixed size buffer of timestamped signal samples. When it is full the oldest sample is overwritten.
+
+  Attributes:
+    timestamps: int64 epoch nanoseconds of each slot
+    columns: column name to the float32 values of each slot, NaN where there was no value
+    dropped: the number of samples overwritten before they were drained
+  """
+  def __init__(self, capacity=BUFFER_CAPACITY, fields=tuple(SIGNAL_FIELDS)):
+    self.capacity = capacity
+    self.timestamps = np.zeros(capacity, dtype=np.int64)
+    self.columns = {field: np.full(capacity, np.nan, dtype=np.float32) for field in fields}
+    self.start = 0
+    self.count = 0
+    self.dropped = 0
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    return self.count
+
+  def __repr__(self):
+    return 'SignalRingBuffer({}/{} samples, {} dropped)'.format(self.count, self.capacity, self.dropped)
+
+  def get_fill(self):
+    """Returns how full the buffer is, from 0 to 1."""
+    return self.count / self.capacity
+
+  def append(self, timestamp, values):
+    """Adds a sample, overwriting the oldest one if the buffer is full.
+
+    Args:
+      timestamp (int): epoch nanoseconds
+      values (dict): column name to value. Missing columns are NaN
+    """
+    with self.lock:
+      if self.count == self.capacity:
+        self.start = (self.start + 1) % self.capacity
+        self.count -= 1
+        self.dropped += 1
+      slot = (self.start + self.count) % self.capacity
+      self.timestamps[slot] = timestamp
+      for field, column in self.columns.items():
+        column[slot] = values.get(field, np.nan)
+      self.count += 1
+
+  def drain(self):
+    """Takes every sample out of the buffer, oldest first.
+
+    Returns:
+      timestamps (np.ndarray), columns (dict): copies of the samples
+    """
+    with self.lock:
+      slots = (self.start + np.arange(self.count)) % self.capacity
+      timestamps = self.timestamps[slots]
+      columns = {field: column[slots] for field, column in self.columns.items()}
+      self.start = 0
+      self.count = 0
+    return timestamps, columns
+
+
+def get_signal_values(signal_strength):
+  """Picks the SIGNAL_FIELDS out of the dict of AdbInterface.get_signal_strength().
+
+  Returns:
+    values (dict): column name to float. Items that are missing or unavailable are left out
+  """
+  values = {}
+  for field, (rat, item) in SIGNAL_FIELDS.items():
+    try:
+      value = float(signal_strength[rat][item])
+    except (KeyError, ValueError):
+      continue
+    if value != UNAVAILABLE:
+      values[field] = value
+  return values
+
+
+def get_timestamp():
+  """Returns the time now as epoch nanoseconds of the local wall clock, like the modem metrics timestamps."""
+  return datetime_to_epoch_ns(datetime.now())
+
+
+class SignalSampler:
+  """Samples the signal strength of several devices concurrently into a ring buffer per device."""
+
+  def __init__(self, adb_interface, device_ids=None, output_folder=None, period=SAMPLE_PERIOD,
+               capacity=BUFFER_CAPACITY, flush_interval=FLUSH_INTERVAL, workers=None):
+    """
+    Args:
+      adb_interface (AdbInterface): The interface the devices are polled through
+      device_ids (list): The serial numbers of the devices. Defaults to every connected device
+      output_folder (Path): The folder the traces are flushed to. Defaults to signal_traces in the working
+        directory
+      period (float): Seconds between samples of a device
+      capacity (int): Samples kept per device between flushes
+      flush_interval (float): Seconds between flushes
+      workers (int): Devices polled at the same time. Defaults to one per device
+    """
+    self.adb_interface = adb_interface
+    if device_ids is None:
+      device_ids = [device['serial_no'] for device in adb_interface.discover_connected_devices() or []]
+    self.device_ids = list(device_ids)
+    self.output_folder = Path(output_folder or Path.cwd() / 'signal_traces')
+    self.period = period
+    self.flush_interval = flush_interval
+    self.workers = workers or max(1, len(self.device_ids))
+
+    self.buffers = {device_id: SignalRingBuffer(capacity) for device_id in self.device_ids}
+    # samples taken, polls that failed, and ticks skipped because the last poll had not finished
+    self.counters = {device_id: {'samples': 0, 'failed': 0, 'missed': 0} for device_id in self.device_ids}
+    # chunks of an earlier run in the same folder are kept, new ones are numbered after them
+    self.chunks = {device_id: len(list((self.output_folder / device_id).glob('signal_*.npz')))
+                   for device_id in self.device_ids}
+    self.in_flight = set()
+    self.lock = threading.Lock()
+    self.stop_event = threading.Event()
+    self.thread = None
+
+  def __repr__(self):
+    return 'SignalSampler({} devices, {})'.format(len(self.device_ids), 'running' if self.is_running() else 'stopped')
+
+  def is_running(self):
+    """Returns True while the sampling thread is running."""
+    return self.thread is not None and self.thread.is_alive()
+
+  def sample(self, device_id):
+    """Takes one sample of a device into its buffer. Run in the worker threads."""
+    try:
+      snapshot = self.adb_interface.get_registry_snapshot(device_id, max_age=0)
+      if snapshot is None:
+        self.counters[device_id]['failed'] += 1
+        return
+      self.buffers[device_id].append(get_timestamp(), get_signal_values(snapshot.signal_strength))
+      self.counters[device_id]['samples'] += 1
+    except Exception as error:
+      log.debug('sampling {} failed: {}'.format(device_id, error))
+      self.counters[device_id]['failed'] += 1
+    finally:
+      with self.lock:
+        self.in_flight.discard(device_id)
+
+  def flush(self, device_id=None):
+    """Writes the buffered samples of a device, or of every device, to a new chunk of its trace.
+
+    Returns:
+      chunk_files (list): the chunks written. Buffers without samples write nothing
+    """
+    chunk_files = []
+    for device_id in [device_id] if device_id is not None else self.device_ids:
+      timestamps, columns = self.buffers[device_id].drain()
+      if not len(timestamps):
+        continue
+      device_folder = self.output_folder / device_id
+      device_folder.mkdir(parents=True, exist_ok=True)
+      chunk_file = device_folder / 'signal_{:05d}.npz'.format(self.chunks[device_id])
+      np.savez(chunk_file, timestamps=timestamps, **columns)
+      self.chunks[device_id] += 1
+      chunk_files.append(chunk_file)
+      log.debug('flushed {} samples of {} to {}'.format(len(timestamps), device_id, str(chunk_file)))
+    return chunk_files
+
+  def run(self):
+    """Samples every device each period until stop() is called, flushing as it goes."""
+    last_flush = time.monotonic()
+    next_tick = time.monotonic()
+    with ThreadPoolExecutor(max_workers=self.workers) as executor:
+      while not self.stop_event.is_set():
+        for device_id in self.device_ids:
+          with self.lock:
+            # a device that is slower than the period skips ticks instead of queuing polls up
+            if device_id in self.in_flight:
+              self.counters[device_id]['missed'] += 1
+              continue
+            self.in_flight.add(device_id)
+          executor.submit(self.sample, device_id)
+
+        for device_id, buffer in self.buffers.items():
+          if buffer.get_fill() >= FLUSH_THRESHOLD:
+            self.flush(device_id)
+        if time.monotonic() - last_flush >= self.flush_interval:
+          self.flush()
+          last_flush = time.monotonic()
+
+        next_tick += self.period
+        # after a stall the next tick is taken now rather than catching up with a burst
+        next_tick = max(next_tick, time.monotonic())
+        self.stop_event.wait(next_tick - time.monotonic())
+    self.flush()
+
+  def start(self):
+    """Starts sampling in a background thread."""
+    if self.is_running():
+      return
+    self.stop_event.clear()
+    self.thread = threading.Thread(target=self.run, daemon=True)
+    self.thread.start()
+    log.info('sampling the signal strength of {}'.format(self.device_ids))
+
+  def stop(self):
+    """Stops sampling and flushes what is left in the buffers."""
+    self.stop_event.set()
+    if self.thread is not None:
+      self.thread.join()
+      self.thread = None
+
+  def get_counters(self):
+    """Returns each device's counts of samples taken, dropped, failed and missed."""
+    return {device_id: dict(counters, dropped=self.buffers[device_id].dropped)
+            for device_id, counters in self.counters.items()}
+
+
+def load_signal_trace(output_folder, device_id):
+  """Reads every flushed chunk of a device's trace back in order.
+
+  Returns:
+    trace (dict): 'timestamps' to int64 epoch nanoseconds and each column name to its float32 values
+  """
+  chunk_files = sorted((Path(output_folder) / device_id).glob('signal_*.npz'))
+  trace = {'timestamps': np.array([], dtype=np.int64)}
+  trace.update({field: np.array([], dtype=np.float32) for field in SIGNAL_FIELDS})
+  for chunk_file in chunk_files:
+    with np.load(chunk_file) as chunk:
+      for name in trace:
+        trace[name] = np.concatenate((trace[name], chunk[name]))
+  return trace
@@ -7,7 +7,8 @@ import logging
 import matplotlib.pyplot as plt
 from pathlib import Path
 from datetime import datetime
-from parsers.lassen_parser import LassenParser, get_signalling_log_from_sdm_file
+from parsers.lassen_parser import (LassenParser, get_signalling_log_from_sdm_file,
+                                   get_logging_time_from_infoexport)
 
 
 # set up the get_log_metrics logger
@@ -52,12 +53,10 @@ def get_log_metadata(infoexport, parsed_signalling_log, log_file):
             tmp_date = datetime.strptime(tmp[0:9], '%Y-%m-%d')
             log_metadata['sw_build_date'] = tmp_date
             break
-    for line in infoexport:
-        line = line.decode('ascii')
-        if 'Logging Time' in line:
-            tmp = line.split()
-            log_metadata['log_start_time'] = datetime.strptime(tmp[-5] + ' ' + tmp[-4] + '000', '%Y-%m-%d %H:%M:%S.%f')
-            log_metadata['log_end_time'] = datetime.strptime(tmp[-2] + ' ' + tmp[-1] + '000', '%Y-%m-%d %H:%M:%S.%f')
+    log_start_time, log_end_time = get_logging_time_from_infoexport(infoexport)
+    if log_start_time:
+        log_metadata['log_start_time'] = log_start_time
+        log_metadata['log_end_time'] = log_end_time
 
     # get the camped MCC and MNC
     for line in parsed_signalling_log:
@@ -91,7 +90,8 @@ def main():
     infoexport = infoexport.stdout.splitlines()
 
     parsed_signaling_log = get_signalling_log_from_sdm_file(log_file, False,
-                                                            str(PARSED_LOG_TEMPORARY_STORAGE) + '/signaling.txt')
+                                                            str(PARSED_LOG_TEMPORARY_STORAGE) + '/signaling.txt',
+                                                            stream=True)
 
     log_metadata = get_log_metadata(infoexport, parsed_signaling_log, log_file)
     print(log_metadata)
@@ -11,8 +11,8 @@ from pathlib import Path
 from parsers.lassen_parser import (get_unique_log_files_capinfo_from_log_folder,
                                    get_signalling_log_from_sdm_file,
                                    get_instances_of_log_by_print_from_lines,
-                                   get_list_of_enclosed_ie,
                                    get_ie_info_from_name_lassen)
+from parsers.ie_tree import get_ie_tree
 
 
 UE_CAPINFO_JSON = Path('fta_selectors/UECapinfo_parameters.json')
@@ -60,6 +60,18 @@ def get_combos_from_string(endc_combo_string):
   return lte_bands_in_combo, nr_bands_in_combo
 
 
+def get_band_combination_lists(ota_log):
+  """Gets the supportedBandCombinationList IEs of a capinfo, with the lists named after it such as
+  supportedBandCombinationList-v1540 and supportedBandCombinationListNEDC-Only. A list enclosed by
+  another one found is left out."""
+  band_combination_lists = []
+  for ie in get_ie_tree(ota_log).find('**/supportedBandCombinationList*'):
+    # the IEs are in message order, so an enclosed list comes straight after the list enclosing it
+    if not band_combination_lists or ie.start >= band_combination_lists[-1].end:
+      band_combination_lists.append(ie)
+  return band_combination_lists
+
+
 def get_endc_combos_from_capinfo_lines(capinfo_lines):
   """Get a list of ENDC combos from a capinfo."""
   instances_of_cap_info_endc = get_instances_of_log_by_print_from_lines(capinfo_lines,
@@ -71,21 +83,22 @@ def get_endc_combos_from_capinfo_lines(capinfo_lines):
   log.info('instances of frequency bands in log length: {}: {}'.format(str(len(instances_of_cap_info_endc)),
                                                                        instances_of_cap_info_endc))
   capinfo_lists = []
+  band_combination_lines = []
   for ota_log in instances_of_cap_info_endc:
-    tmp = get_ie_info_from_name_lassen(ota_log, 'supportedBandCombinationList')
-    if not tmp:
+    band_combination_lists = get_band_combination_lists(ota_log)
+    if not band_combination_lists:
       print('There is no supportedBandCombinationList indicated in the log. Please get a new log with 5G attach')
       exit()
-    # print(tmp[0])
-    log.info(tmp[0])
-    if tmp[0] not in capinfo_lists:
-      capinfo_lists.append(tmp[0])
+    for band_combination_list in band_combination_lists:
+      if band_combination_list.get_lines() not in band_combination_lines:
+        band_combination_lines.append(band_combination_list.get_lines())
+        capinfo_lists.append(band_combination_list)
 
-  log.info('capinfo logs: {}'.format(capinfo_lists))
+  log.info('capinfo logs: {}'.format(band_combination_lines))
   # Search for all the ENDC combos listed in all of the entries of UECapinfo and write them to 3GPP format
   endc_combo_strings  = []
   for capinfo in capinfo_lists:
-    combo_lists = get_list_of_enclosed_ie(capinfo)
+    combo_lists = [combo.get_lines() for combo in capinfo.find('*')]
     log.info('Band strings: {}'.format(combo_lists))
 
     for endc_combo in combo_lists:
@@ -107,6 +120,9 @@ def get_endc_combos_from_capinfo_lines(capinfo_lines):
           endc_combo_string = endc_combo_string + tmp[-2].capitalize() + '-'
         current_line += 1
 
+      # the entries of extension lists such as supportedBandCombinationList-v1540 have no bands
+      if endc_combo_string == 'DC_':
+        continue
       endc_combo_string = endc_combo_string[ : -1]
       log.info(endc_combo_string)
       endc_combo_strings.append(endc_combo_string)
@@ -350,15 +366,12 @@ def get_ue_capinfo(parsed_log):
     if not 'RAT-ContainerList' in ue_capinfo_response:
       log.info('not a valid capinfo... {}'.format(ue_capinfo_response))
     # print('ue-CapabilityRAT-ContainerList is present')
-    tmp = get_ie_info_from_name_lassen(ue_capinfo_response,
-                                      'ue-CapabilityRAT-ContainerList')
+    tmp = get_ie_tree(ue_capinfo_response).find('**/ue-CapabilityRAT-ContainerList')
     log.info('tmp: {}'.format(tmp))
-    try:
-      tmp = get_list_of_enclosed_ie(tmp[0])
-      log.info(tmp)
-    except IndexError:
+    if not tmp:
       log.info('meh something failed :( ')
       continue
+    tmp = [rat_container.get_lines() for rat_container in tmp[0].find('*')]
     for ota in tmp:
       try:
         if ota[2:] not in capinfo_responses:
@@ -392,7 +405,7 @@ def main():
     log.info('log files: {}'.format(log_files))
     for file in log_files:
       potential_issues_to_investigate = []
-      parsed_log = get_signalling_log_from_sdm_file(file)
+      parsed_log = get_signalling_log_from_sdm_file(file, stream=True)
       file_mcc, file_mnc = get_NW_from_log(parsed_log)
       ue_capinfo = get_ue_capinfo(parsed_log)
       ue_capinfo['mcc'] = file_mcc
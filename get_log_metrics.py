@@ -1,13 +1,27 @@
-"""Get metrics."""
+"""Get metrics.
+
+To get the metrics of the logs in a folder, reusing the metrics stored by an earlier run:
+  python get_log_metrics.py
+To parse the logs again, replacing the stored metrics:
+  python get_log_metrics.py --rebuild
+To follow a log that is still being written, updating the KPIs and graph as each segment completes:
+  python get_log_metrics.py --watch <log folder>
+"""
 
 import re
 import os
 import csv
+import sys
 import logging
 import matplotlib.pyplot as plt
+import numpy as np
 from pathlib import Path
-from parsers.lassen_parser import (get_unique_log_files_capinfo_from_log_folder,
-                                   get_metrics_log_from_sdm_file)
+from parsers.lassen_parser import get_unique_log_files_capinfo_from_log_folder
+from parsers.metrics_table import get_metrics_table
+from parsers.metrics_store import get_metrics_table_from_sdm_file
+from parsers.log_watcher import LogWatcher
+from plotting.decimation import decimate
+from plotting.figure_renderer import FigureRenderer, FigureSpec
 
 
 # set up the get_log_metrics logger
@@ -22,48 +36,20 @@ log = logging.getLogger('get_log_metrics')
 
 def get_mcs(parsed_log):
   """Get a csv file of the mcs and pdsch layer."""
-  output_csv = [['Time', 'MCS', 'Layers']]
-  for line in parsed_log:
-    time = ""
-    mcs = ""
-    layer = ""
-    if "pdschResult.mcs:" in line:
-      line = line.replace('\t', ' ')
-      tmp_line = line.split()
-      time = tmp_line[2]
-      # mcs = re.findall(r'%s(\d+)' % )
-      mcs = tmp_line[3].split(':')[-1]
-      layer = tmp_line[4].split(':')[-1]
-      output_csv.append([time, mcs, layer])
-  
+  pdsch_metrics = get_metrics_table(parsed_log)['pdschResult']
+  time = pdsch_metrics.time_strings
+  mcs = pdsch_metrics.get_position_column(0)
+  layers = pdsch_metrics.get_position_column(1)
+
   with open (Path(str(Path.cwd() / 'last_output.csv')), mode='w') as output_file:
     writer = csv.writer(output_file)
-    for line in output_csv:
-      writer.writerow(line)
-  
+    writer.writerow(['Time', 'MCS', 'Layers'])
+    writer.writerows(zip(time, mcs, layers))
+
   fig = plt.figure()
   fig, ax = plt.subplots()
-  time = []
-  mcs = []
-  layers = []
-  for tmp in output_csv:
-    if 'Time' in tmp:
-      continue
-    time.append(tmp[0])
-  #log.info(time)
-  for tmp in output_csv:
-    if 'MCS' in tmp:
-      continue
-    mcs.append(tmp[1])
-  #log.info(mcs)
-  for tmp in output_csv:
-    if 'Layers' in tmp:
-      continue
-    layers.append(tmp[2])
-  #log.info(layers)
-
-  ax.plot(time, mcs, label='MCS')
-  ax.plot(time, layers, label='layers')
+  ax.plot(*decimate(pdsch_metrics.get_time(), mcs), label='MCS')
+  ax.plot(*decimate(pdsch_metrics.get_time(), layers), label='layers')
   ax.set_xlabel('Time')
   ax.set_title("MCS and Layers")
   ax.legend()
@@ -73,92 +59,29 @@ def get_mcs(parsed_log):
 
 def get_lte_ca_state(parsed_log):
   """Gets plottable graph data of throughput from metrics log."""
-  output_csv = [['Time', 'DL TP', 'UL TP', 'DL BW', 'UL BW', 'LTE Bands']]
-
-  tmp_time = '0'
-  dltp = '0'
-  ultp = '0'
-  total_dl_bw = 0
-  total_ul_bw = 0
-  lte_bands = ''
-  lte_ca_combos = []
-
-  for line in parsed_log:
-    if 'e.l1_ca' in line:
-      tmp_line = line.replace('\t', ' ')
-      print(line)
-      tmp_line = tmp_line.split()
-      print(tmp_line)
-      tmp_time = tmp_line[2]
-      dltp = float(tmp_line[4].split(':')[-1]) / 1000
-      ultp = float(tmp_line[5].split(':')[-1]) / 1000
-      total_dl_bw = 0
-      total_ul_bw = 0
-      for tmp in tmp_line:
-        if '.bw' in tmp:
-          total_dl_bw = total_dl_bw + float(tmp.split(':')[-1])
-      for tmp in tmp_line:
-        if '.ulbw' in tmp:
-          total_ul_bw = total_ul_bw + float(tmp.split(':')[-1])
-      lte_bands = 'LTE Bands: '
-      for tmp in tmp_line:
-        if '.band' in tmp:
-          lte_bands = lte_bands + '{}_'.format(tmp.split(':')[-1])
-      lte_bands = lte_bands[:-1]
-      print(lte_bands)
-      if lte_bands not in lte_ca_combos:
-        lte_ca_combos.append(lte_bands)
-
-      #if 'Deact' not in line:
-      output_csv.append([tmp_time, dltp, ultp, total_dl_bw, total_ul_bw, lte_bands])
-
-  print(lte_ca_combos)
+  lte_metrics = get_metrics_table(parsed_log)['e.l1_ca']
+  time = lte_metrics.time_strings
+  dltp = lte_metrics.get_position_column(1) / 1000
+  ultp = lte_metrics.get_position_column(2) / 1000
+  dlbw = np.nan_to_num(lte_metrics.get_metric_column('.bw', addative=True))
+  ulbw = np.nan_to_num(lte_metrics.get_metric_column('.ulbw', addative=True))
+  lte_bands = lte_metrics.get_joined_metric('.band')
+
+  print(list(dict.fromkeys(lte_bands)))
   with open (Path(str(Path.cwd() / 'last_output_tp.csv')), mode='w') as output_file:
     writer = csv.writer(output_file)
-    for line in output_csv:
-      writer.writerow(line)
-
-  time = []
-  dltp = []
-  ultp = []
-  dlbw = []
-  ulbw = []
-  lte_bands = []
-  for tmp in output_csv:
-    if 'Time' in tmp:
-      continue
-    time.append(tmp[0])
-  #log.info(time)
-  for tmp in output_csv:
-    if 'DL TP' in tmp:
-      continue
-    dltp.append(tmp[1])
-  #log.info(mcs)
-  for tmp in output_csv:
-    if 'UL TP' in tmp:
-      continue
-    ultp.append(tmp[2])
-  for tmp in output_csv:
-    if 'DL BW' in tmp:
-      continue
-    dlbw.append(tmp[3])
-  for tmp in output_csv:
-    if 'UL BW' in tmp:
-      continue
-    ulbw.append(tmp[4])
-  for tmp in output_csv:
-    if 'LTE Bands' in tmp:
-      continue
-    lte_bands.append(tmp[4])
+    writer.writerow(['Time', 'DL TP', 'UL TP', 'DL BW', 'UL BW', 'LTE Bands'])
+    writer.writerows(zip(time, dltp, ultp, dlbw, ulbw, lte_bands))
 
+  time = lte_metrics.get_time()
   fig = plt.figure()
   fig, ax1 = plt.subplots()
 
-  ax1.plot(time, dltp, label='Downlink TP')
-  ax1.plot(time, ultp, label='Uplink TP')
+  ax1.plot(*decimate(time, dltp), label='Downlink TP')
+  ax1.plot(*decimate(time, ultp), label='Uplink TP')
   ax2 = ax1.twinx()
-  ax2.plot(time, dlbw, 'b--', label='Downlink BW')
-  ax2.plot(time, ulbw, 'g--', label='Uplink BW')
+  ax2.plot(*decimate(time, dlbw), 'b--', label='Downlink BW')
+  ax2.plot(*decimate(time, ulbw), 'g--', label='Uplink BW')
   ax1.set_xlabel('Time')
   ax1.set_ylabel('TP (Mbps)')
   ax2.set_ylabel('Bandwidth')
@@ -168,15 +91,60 @@ def get_lte_ca_state(parsed_log):
   fig.savefig('tmp1.png')
 
 
+def get_lte_ca_figure_spec(metrics_table, file_name='watch_tp.png'):
+  """Gets a FigureSpec of the LTE throughput and bandwidth, for rendering without a window."""
+  lte_metrics = metrics_table['e.l1_ca']
+  time = lte_metrics.get_time()
+  figure_spec = FigureSpec(file_name, title='DL/UL TP', xlabel='Time', date_format='%H:%M:%S',
+                           ylabels={'main': 'TP (Mbps)', 'twinx': 'Bandwidth'})
+  figure_spec.add_series(time, lte_metrics.get_position_column(1) / 1000, label='Downlink TP')
+  figure_spec.add_series(time, lte_metrics.get_position_column(2) / 1000, label='Uplink TP')
+  figure_spec.add_series(time, np.nan_to_num(lte_metrics.get_metric_column('.bw', addative=True)), 'b--',
+                         label='Downlink BW', axis='twinx')
+  figure_spec.add_series(time, np.nan_to_num(lte_metrics.get_metric_column('.ulbw', addative=True)), 'g--',
+                         label='Uplink BW', axis='twinx')
+  return figure_spec
+
+
+def print_watch_update(watcher, new_segments):
+  """Prints the KPIs of the segments processed so far and re-renders the throughput graph."""
+  lte_metrics = watcher.metrics_table['e.l1_ca']
+  print('processed {} of the log: {}'.format(len(watcher.processed_segments),
+                                             [segment.name for segment in new_segments]))
+  if len(lte_metrics):
+    print('  Mean DL TP (Mbps): {:.2f}'.format(np.nanmean(lte_metrics.get_position_column(1) / 1000)))
+    print('  Mean UL TP (Mbps): {:.2f}'.format(np.nanmean(lte_metrics.get_position_column(2) / 1000)))
+    print('  LTE bands: {}'.format(list(dict.fromkeys(lte_metrics.get_joined_metric('.band')))))
+  event_counts = {}
+  for failure_event in watcher.failure_events:
+    event_counts[failure_event.event_type] = event_counts.get(failure_event.event_type, 0) + 1
+  print('  Failure events: {}'.format(event_counts))
+  if len(lte_metrics):
+    png_file = FigureRenderer(workers=1).render([get_lte_ca_figure_spec(watcher.metrics_table)])[0]
+    print('  Graph: {}'.format(str(png_file)))
+
+
+def watch_log_folder(log_folder):
+  """Follows a log folder that is still being written until ctrl+c."""
+  watcher = LogWatcher(Path(log_folder), on_update=print_watch_update)
+  watcher.run()
+  return watcher
+
 
 def main():
   """Main function to get the metrics."""
+  args = sys.argv[1:]
+  if len(args) == 2 and args[0] == '--watch':
+    watch_log_folder(args[1])
+    return
+
+  rebuild = args == ['--rebuild']
   log_folder = input('What is the directory of the folder?\n')
   log_files = get_unique_log_files_capinfo_from_log_folder(log_folder)
   print('log folders: {}'.format(log_files))
 
   for file in log_files:
-    parsed_log = get_metrics_log_from_sdm_file(file, True)
+    parsed_log = get_metrics_table_from_sdm_file(file, overwrite=rebuild)
 
     #get_mcs(parsed_log)
     get_lte_ca_state(parsed_log)
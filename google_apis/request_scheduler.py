@@ -0,0 +1,212 @@
+"""A quota aware scheduler for Google API requests.
+
+Every request is sent through a token bucket per quota, refilled at the per-minute quota, so uploads run
+at the quota ceiling instead of hitting it. A request that is throttled (429) or that hits a server error
+is retried with exponential backoff and full jitter. A throttled request also empties the bucket, so
+the other requests waiting on it back off too. Requests that are not idempotent are only retried when
+they were throttled, because a throttled request was never applied.
+
+  How to use:
+  scheduler = RequestScheduler(quotas={'read': 60, 'write': 60, 'drive': 600})
+  result = scheduler.execute(sheet_interface.values().get(spreadsheetId=sheet_id, range='A:A'), 'read')
+"""
+
+from pathlib import Path
+import threading
+import logging
+import random
+import socket
+import time
+import os
+
+
+# set up the request_scheduler logger
+Path(os.getcwd() + '/logs/').mkdir(parents=True, exist_ok=True)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                    datefmt='%m-%d %H:%M',
+                    filename='./logs/tool_log.log',
+                    filemode='w')
+log = logging.getLogger('request_scheduler')
+
+
+# Requests per minute of each quota, the default Sheets read and write quotas per user and a Drive share
+QUOTAS = {
+    'read': 60,
+    'write': 60,
+    'drive': 600,
+}
+# The most requests of a quota sent back to back, as a fraction of its per-minute quota
+BURST_FRACTION = 0.1
+MAX_RETRIES = 8
+BASE_DELAY = 1.0
+MAX_DELAY = 64.0
+THROTTLED_STATUSES = (429,)
+# 403 is how the older APIs report rateLimitExceeded and userRateLimitExceeded
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+SERVER_ERROR_STATUSES = (500, 502, 503, 504)
+
+
+def get_error_status(error):
+  """Gets the HTTP status of an HttpError, or None for any other error."""
+  return getattr(getattr(error, 'resp', None), 'status', None)
+
+
+def is_throttled(error):
+  """Returns True if an error says the request was over quota."""
+  status = get_error_status(error)
+  if status in THROTTLED_STATUSES:
+    return True
+  return status == 403 and any(reason in str(error) for reason in RATE_LIMIT_REASONS)
+
+
+def is_transient(error):
+  """Returns True if an error might not happen again, a server error or a dropped connection."""
+  return (get_error_status(error) in SERVER_ERROR_STATUSES or
+          isinstance(error, (ConnectionError, socket.timeout, TimeoutError)))
+
+
+class TokenBucket:
+  """Lets requests through at a steady rate, with a small burst."""
+
+  def __init__(self, per_minute, capacity=None, clock=time.monotonic, sleep=time.sleep):
+    """
+    Args:
+      per_minute: the requests let through each minute
+      capacity: the most requests let through back to back. Defaults to BURST_FRACTION of per_minute
+      clock: the time source, in seconds
+      sleep: waits a number of seconds
+    """
+    self.rate = per_minute / 60
+    self.capacity = capacity or max(1, int(per_minute * BURST_FRACTION))
+    self.clock = clock
+    self.sleep = sleep
+    self.tokens = float(self.capacity)
+    self.updated = clock()
+    self.lock = threading.Lock()
+
+  def __repr__(self):
+    return 'TokenBucket({}/min, {:.1f} tokens)'.format(self.rate * 60, self.tokens)
+
+  def refill(self):
+    """Adds the tokens earned since the last refill. Called with the lock held."""
+    now = self.clock()
+    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+
+  def acquire(self):
+    """Waits for a token and takes it.
+
+    Returns:
+      waited: the seconds spent waiting
+    """
+    waited = 0.0
+    while True:
+      with self.lock:
+        self.refill()
+        if self.tokens >= 1:
+          self.tokens -= 1
+          return waited
+        wait = (1 - self.tokens) / self.rate
+      self.sleep(wait)
+      waited += wait
+
+  def drain(self):
+    """Takes every token, so every request waits for the bucket to refill."""
+    with self.lock:
+      self.refill()
+      self.tokens = min(self.tokens, 0)
+
+
+class RequestScheduler:
+  """Sends Google API requests through a token bucket per quota, retrying with backoff.
+
+  Attributes:
+    buckets: quota name to its TokenBucket
+    requests: the number of requests executed, including retries
+    retries: the number of retries
+    throttled: the number of requests that were throttled
+  """
+
+  def __init__(self, quotas=None, max_retries=MAX_RETRIES, base_delay=BASE_DELAY, max_delay=MAX_DELAY,
+               clock=time.monotonic, sleep=time.sleep):
+    """
+    Args:
+      quotas: quota name to its requests per minute. Defaults to QUOTAS
+      max_retries: the most times a request is retried
+      base_delay: the backoff before the first retry, in seconds. It doubles for each retry
+      max_delay: the longest backoff, in seconds
+      clock: the time source, in seconds
+      sleep: waits a number of seconds
+    """
+    quotas = quotas or QUOTAS
+    self.buckets = {name: TokenBucket(per_minute, clock=clock, sleep=sleep) for name, per_minute in quotas.items()}
+    self.max_retries = max_retries
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+    self.sleep = sleep
+    self.lock = threading.Lock()
+    self.requests = 0
+    self.retries = 0
+    self.throttled = 0
+
+  def __repr__(self):
+    return 'RequestScheduler({})'.format(list(self.buckets.values()))
+
+  def get_backoff(self, attempt):
+    """Gets a random backoff of up to base_delay * 2 ** attempt seconds, capped at max_delay."""
+    return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+  def count(self, counter):
+    """Adds one to a counter, from any thread."""
+    with self.lock:
+      setattr(self, counter, getattr(self, counter) + 1)
+
+  def execute(self, request, quota='write', idempotent=True):
+    """Executes a request when its quota allows, retrying if it was throttled or failed transiently.
+
+    Args:
+      request: a googleapiclient request, anything with execute()
+      quota: the name of the quota the request counts against
+      idempotent: False if sending the request twice could apply it twice. It is then only retried
+        when it was throttled
+    Returns:
+      the response of the request
+    Raises:
+      the error of the last attempt, if it was not retried or the retries ran out
+    """
+    bucket = self.buckets[quota]
+    attempt = 0
+    while True:
+      bucket.acquire()
+      self.count('requests')
+      try:
+        return request.execute()
+      except Exception as error:
+        throttled = is_throttled(error)
+        if not throttled and not (idempotent and is_transient(error)):
+          raise
+        if attempt >= self.max_retries:
+          log.info('giving up on a {} request after {} retries: {}'.format(quota, attempt, error))
+          raise
+        if throttled:
+          self.count('throttled')
+          bucket.drain()
+        delay = self.get_backoff(attempt)
+        log.info('retrying a {} request in {:.1f} s: {}'.format(quota, delay, error))
+        self.count('retries')
+        self.sleep(delay)
+        attempt += 1
+
+
+SHARED_SCHEDULER = None
+SHARED_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_shared_scheduler():
+  """Returns the RequestScheduler shared by every SheetHelper of the process, creating it the first time."""
+  global SHARED_SCHEDULER
+  with SHARED_SCHEDULER_LOCK:
+    if SHARED_SCHEDULER is None:
+      SHARED_SCHEDULER = RequestScheduler()
+    return SHARED_SCHEDULER
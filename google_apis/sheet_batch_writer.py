@@ -0,0 +1,208 @@
+"""A buffered writer that uploads to a spreadsheet in a few batch calls.
+
+Value ranges and structural requests (addSheet, updateSheetProperties, ...) are collected instead of being
+sent one call each. They are sent when the buffer passes a size threshold, when the oldest buffered write
+is older than the flush interval, or when flush() is called. Writes are sent in the order they were
+added: consecutive structural requests go in one batchUpdate, and consecutive value ranges in one
+values().batchUpdate. New sheets are added ahead of the values buffered before them, so filling many new
+sheets takes two calls.
+
+The writer has no thread of its own, so the flush interval is best effort: it is only checked when a
+write is buffered. A loop that stops writing for a while should call flush_if_due() each time round,
+or the last writes wait until the next write or the end of the with block.
+
+  How to use:
+  with SheetBatchWriter(sheet_helper, spreadsheet_id) as writer:
+    writer.new_worksheet_with_data('Log 1', '!A1', spreadsheet_id, {'values': kpi_rows})
+    writer.update_sheet({'values': [[summary]]}, 'Summary!A2', spreadsheet_id)
+    writer.append_rows(kpi_rows, 'All logs')
+"""
+
+from pathlib import Path
+import logging
+import time
+import os
+
+
+# set up the sheet_batch_writer logger
+Path(os.getcwd() + '/logs/').mkdir(parents=True, exist_ok=True)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                    datefmt='%m-%d %H:%M',
+                    filename='./logs/tool_log.log',
+                    filemode='w')
+log = logging.getLogger('sheet_batch_writer')
+
+
+# Flush once this many value ranges, structural requests or cells are buffered
+MAX_BUFFERED_RANGES = 100
+MAX_BUFFERED_REQUESTS = 100
+MAX_BUFFERED_CELLS = 50000
+# Flush once the oldest buffered write is this many seconds old
+FLUSH_INTERVAL = 10.0
+# Structural requests that can be sent before value ranges buffered ahead of them
+HOISTED_REQUESTS = {'addSheet'}
+
+
+class SheetBatchWriter:
+  """Buffers the writes to one spreadsheet and sends them as batch calls through a SheetHelper.
+
+  Attributes:
+    sheet_helper: the SheetHelper the batch calls are made with
+    spreadsheet_id: the spreadsheet written to
+    batches: the buffered writes, in order, as ('requests' or 'values', list) pairs
+    calls: the number of batch calls made
+  """
+
+  def __init__(self, sheet_helper, spreadsheet_id, value_input_option='RAW',
+               max_ranges=MAX_BUFFERED_RANGES, max_requests=MAX_BUFFERED_REQUESTS,
+               max_cells=MAX_BUFFERED_CELLS, flush_interval=FLUSH_INTERVAL):
+    """
+    Args:
+      sheet_helper: the SheetHelper to send the writes with
+      spreadsheet_id: the spreadsheet to write to
+      value_input_option: 'RAW' or 'USER_ENTERED', for every buffered value range
+      max_ranges: flush once this many value ranges are buffered
+      max_requests: flush once this many structural requests are buffered
+      max_cells: flush once this many cells are buffered
+      flush_interval: flush once the oldest buffered write is this many seconds old, checked on each
+        write and by flush_if_due(). None never flushes on time
+    """
+    self.sheet_helper = sheet_helper
+    self.spreadsheet_id = spreadsheet_id
+    self.value_input_option = value_input_option
+    self.max_ranges = max_ranges
+    self.max_requests = max_requests
+    self.max_cells = max_cells
+    self.flush_interval = flush_interval
+
+    self.batches = []
+    self.buffered_ranges = 0
+    self.buffered_requests = 0
+    self.buffered_cells = 0
+    self.first_buffered = None
+    self.calls = 0
+
+  def __repr__(self):
+    return 'SheetBatchWriter({}, {} ranges and {} requests buffered)'.format(
+        self.spreadsheet_id, self.buffered_ranges, self.buffered_requests)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.flush()
+
+  def check_spreadsheet(self, spreadsheet_id):
+    """Checks a write is for the spreadsheet of the writer."""
+    if spreadsheet_id is not None and spreadsheet_id != self.spreadsheet_id:
+      raise ValueError('the writer writes to {}, not {}'.format(self.spreadsheet_id, spreadsheet_id))
+
+  def buffer(self, kind, item):
+    """Adds a write to the end of the buffer, then flushes if a threshold is passed."""
+    if self.first_buffered is None:
+      self.first_buffered = time.monotonic()
+    if self.batches and self.batches[-1][0] == kind:
+      self.batches[-1][1].append(item)
+    elif kind == 'requests' and set(item) <= HOISTED_REQUESTS:
+      # adding a sheet cannot change the value ranges buffered before it, so it joins the last
+      # structural batch instead of starting a new call after them
+      request_batches = [batch for batch in self.batches if batch[0] == 'requests']
+      if request_batches:
+        request_batches[-1][1].append(item)
+      else:
+        self.batches.insert(0, (kind, [item]))
+    else:
+      self.batches.append((kind, [item]))
+    return self.flush_if_due()
+
+  def add_request(self, request):
+    """Buffers a structural request, e.g. {'addSheet': {'properties': {'title': 'Log 1'}}}."""
+    self.buffered_requests += 1
+    return self.buffer('requests', request)
+
+  def add_values(self, value_range, values):
+    """Buffers a range of values.
+
+    Args:
+      value_range: the range in valuerange format e.g. SheetName!A1:C10
+      values: the rows to write
+    """
+    self.buffered_ranges += 1
+    self.buffered_cells += sum(len(row) for row in values)
+    # rows appended later go after these, even before they are sent
+    self.sheet_helper.update_next_row(self.spreadsheet_id, value_range, values)
+    return self.buffer('values', {'range': value_range, 'values': values})
+
+  def update_sheet(self, body, value_range, output_sheet_id=None):
+    """Buffers SheetHelper.update_sheet(), body holding the 'values'."""
+    self.check_spreadsheet(output_sheet_id)
+    return self.add_values(value_range, body.get('values', []))
+
+  def new_worksheet(self, sheet_name, output_sheet_id=None):
+    """Buffers SheetHelper.new_worksheet()."""
+    self.check_spreadsheet(output_sheet_id)
+    # the new tab is empty, so rows can be appended to it before it is created
+    self.sheet_helper.next_rows[(self.spreadsheet_id, sheet_name)] = 1
+    return self.add_request({'addSheet': {'properties': {'title': sheet_name}}})
+
+  def new_worksheet_with_data(self, sheet_name, value_range, spreadsheet_id=None, data=None):
+    """Buffers SheetHelper.new_worksheet_with_data(), data holding the 'values'."""
+    self.new_worksheet(sheet_name, spreadsheet_id)
+    return self.update_sheet(data or {}, sheet_name + value_range, spreadsheet_id)
+
+  def append_rows(self, rows, sheet_name):
+    """Buffers rows to write after the last row of a tab, see SheetHelper.append_rows().
+
+    Returns:
+      row: the row the first of the rows will be written to
+    """
+    row = self.sheet_helper.reserve_rows(self.spreadsheet_id, sheet_name, len(rows))
+    self.add_values('{}!A{}'.format(sheet_name, row), rows)
+    return row
+
+  def is_due(self):
+    """Returns True if a size or time threshold has been passed."""
+    if not self.batches:
+      return False
+    if (self.buffered_ranges >= self.max_ranges or self.buffered_requests >= self.max_requests or
+        self.buffered_cells >= self.max_cells):
+      return True
+    return (self.flush_interval is not None and
+            time.monotonic() - self.first_buffered >= self.flush_interval)
+
+  def flush_if_due(self):
+    """Flushes if a size or time threshold has been passed. Polling loops call it to flush on time
+    between writes.
+
+    Returns:
+      responses: the responses of the batch calls, empty if nothing was flushed
+    """
+    if self.is_due():
+      return self.flush()
+    return []
+
+  def flush(self):
+    """Sends every buffered write, in order, one batch call per run of writes of the same kind.
+
+    Returns:
+      responses: the response of each batch call
+    """
+    responses = []
+    # a batch leaves the buffer once it is sent, so a failed call can be flushed again
+    while self.batches:
+      kind, items = self.batches[0]
+      if kind == 'requests':
+        responses.append(self.sheet_helper.batch_update({'requests': items}, self.spreadsheet_id))
+      else:
+        responses.append(self.sheet_helper.batch_update_values(items, self.spreadsheet_id,
+                                                               self.value_input_option))
+      self.batches.pop(0)
+      self.calls += 1
+      log.info('flushed {} {} to {}'.format(len(items), kind, self.spreadsheet_id))
+
+    self.buffered_ranges = 0
+    self.buffered_requests = 0
+    self.buffered_cells = 0
+    self.first_buffered = None
+    return responses
@@ -7,6 +7,8 @@ Requires the service_account.json file acquired from pantheon.corp.google.com.
   How to use:
   sheet_helper = Sheet_Helper(service_account_link, scopes)
   sheet_helper.new_spreadsheet(sheet_helper.sheet_interface, title)
+  To upload many ranges in a few calls, see sheet_batch_writer.SheetBatchWriter.
+  Every request is sent through a RequestScheduler, shared by every SheetHelper unless one is given.
 """
 
 from googleapiclient.discovery import build
@@ -17,6 +19,9 @@ from google.oauth2 import service_account
 from pathlib import Path
 from sys import platform
 import logging
+import re
+
+from google_apis.request_scheduler import get_shared_scheduler
 
 
 # set up the sheet_helper logger
@@ -39,6 +44,17 @@ else:
 
 EMAIL = 'scottrobson@google.com'
 
+# The sheet and first row of a range in valuerange format, e.g. 'Sheet 1'!A5:C7 or Sheet1!A:A
+RANGE_PATTERN = re.compile(r"^(?:'((?:[^']|'')+)'|([^!]+))!?[A-Za-z]*(\d*)")
+# Structural requests the sheet id cache can follow, any other sheet level request refreshes it
+SHEET_LEVEL_REQUESTS = ('addSheet', 'deleteSheet', 'updateSheetProperties', 'duplicateSheet')
+# Requests that can move the last row of a tab, the next free rows are counted again after them
+ROW_CHANGING_REQUESTS = ('appendCells', 'appendDimension', 'copyPaste', 'cutPaste', 'deleteDimension',
+                         'deleteDuplicates', 'deleteRange', 'insertDimension', 'insertRange', 'moveDimension',
+                         'pasteData', 'sortRange', 'updateCells')
+# batchUpdate requests that add, remove or move something, so they are not sent twice on a server error
+NON_IDEMPOTENT_PREFIXES = ('add', 'append', 'cut', 'delete', 'duplicate', 'insert', 'move')
+
 
 class SheetHelper:
   """Container class for GSheets and Drive APIs and helper functions.
@@ -54,13 +70,30 @@ class SheetHelper:
     creds: The parsed credentils provided by oauth2 API
     sheet_interface: The object containing the callable Sheets API
     drive_interface: The object containing the callable Drive API
+    scheduler: the RequestScheduler every request is executed through
+    sheet_ids: spreadsheet id to a dict of each tab's title to its sheetId
+    next_rows: (spreadsheet id, tab title) to the next free row of the tab
   """
 
-  def __init__(self, client_secret=CLIENT_SECRET, scopes=SCOPES):
-
-    self.creds = self.get_credentials(client_secret, scopes)
-    self.sheet_interface = self.get_sheets_interface(self.creds)
-    self.drive_interface = self.get_drive_interface(self.creds)
+  def __init__(self, client_secret=CLIENT_SECRET, scopes=SCOPES, sheet_interface=None, drive_interface=None,
+               scheduler=None):
+    """
+    Args:
+      client_secret: the oauth client secret file
+      scopes: the google API scopes to ask for
+      sheet_interface: a Sheets spreadsheets() resource to use instead of building one, e.g. a stub.
+        No credentials are requested if it is given
+      drive_interface: a Drive resource to use instead of building one
+      scheduler: the RequestScheduler to execute the requests through. Defaults to the shared one
+    """
+    self.creds = None
+    if sheet_interface is None or drive_interface is None:
+      self.creds = self.get_credentials(client_secret, scopes)
+    self.sheet_interface = sheet_interface or self.get_sheets_interface(self.creds)
+    self.drive_interface = drive_interface or self.get_drive_interface(self.creds)
+    self.scheduler = scheduler or get_shared_scheduler()
+    self.sheet_ids = {}
+    self.next_rows = {}
 
   def get_credentials(self, client_secret, scopes):
     """Generates the credentials for activating the google APIs using oauth."""
@@ -110,6 +143,10 @@ class SheetHelper:
 
     return drive_interface
 
+  def execute(self, request, quota='write', idempotent=True):
+    """Executes a request through the scheduler, see RequestScheduler.execute."""
+    return self.scheduler.execute(request, quota, idempotent)
+
   def new_spreadsheet(self, title, email=EMAIL, role='writer'):
     """Creates a new spreadhseet with specified title."""
     sheet_properties = {
@@ -118,8 +155,8 @@ class SheetHelper:
             'title': title
         }
     }
-    new_sheet = self.sheet_interface.create(body=sheet_properties,
-                                            fields='spreadsheetId').execute()
+    new_sheet = self.execute(self.sheet_interface.create(body=sheet_properties,
+                                                         fields='spreadsheetId'), idempotent=False)
     self.share_sheet(new_sheet.get('spreadsheetId'))
     return new_sheet
 
@@ -136,30 +173,54 @@ class SheetHelper:
         'emailAddress': email
     }
 
-    res = self.drive_interface.permissions().create(
+    res = self.execute(self.drive_interface.permissions().create(
         fileId=file_id,
         body=user_permissions,
         fields='id',
         transferOwnership=transfer_ownership
-    ).execute()
+    ), 'drive')
 
     return res
 
   def batch_update(self, body, output_sheet_id):
     """Receives a ilst of updates to sheets and applies them."""
-    res = self.sheet_interface.batchUpdate(
+    idempotent = not any(request_type.startswith(NON_IDEMPOTENT_PREFIXES)
+                         for request in body.get('requests', []) for request_type in request)
+    res = self.execute(self.sheet_interface.batchUpdate(
         spreadsheetId=output_sheet_id,
         body=body
-        ).execute()
+        ), idempotent=idempotent)
+    self.update_sheet_cache(output_sheet_id, body.get('requests', []), res.get('replies', []))
+
+    return res
+
+  def batch_update_values(self, data, output_sheet_id, value_input_option='RAW'):
+    """Writes several value ranges in one call.
+
+    Args:
+      data: a list of value ranges, e.g. [{'range': 'Sheet1!A1', 'values': [[1, 2]]}]
+      output_sheet_id: the spreadsheet to write to
+      value_input_option: 'RAW' or 'USER_ENTERED'
+    """
+    body = {
+        'valueInputOption': value_input_option,
+        'data': data
+    }
+    res = self.execute(self.sheet_interface.values().batchUpdate(
+        spreadsheetId=output_sheet_id,
+        body=body
+        ))
+    for value_range in data:
+      self.update_next_row(output_sheet_id, value_range['range'], value_range.get('values', []))
 
     return res
 
   def read_range(self, value_range, output_sheet_id):
     """Reads a range of values from the given sheet."""
-    result = self.sheet_interface.values().batchGet(
+    result = self.execute(self.sheet_interface.values().batchGet(
         spreadsheetId=output_sheet_id,
         ranges=value_range
-    ).execute()
+    ), 'read')
 
     return result
 
@@ -172,10 +233,10 @@ class SheetHelper:
     Returns:
       values: the requested values from the sheet
     """
-    result = self.sheet_interface.values().get(
+    result = self.execute(self.sheet_interface.values().get(
         spreadsheetId=output_sheet_id,
         range=value_range
-    ).execute()
+    ), 'read')
 
     values = result.get('values', [])
 
@@ -184,12 +245,13 @@ class SheetHelper:
   def update_sheet(self, body, value_range, output_sheet_id,
                    value_input_option='RAW'):
     """Use to update a sheet."""
-    self.sheet_interface.values().update(
+    self.execute(self.sheet_interface.values().update(
         spreadsheetId=output_sheet_id,
         range=value_range,
         valueInputOption=value_input_option,
         body=body
-    ).execute()
+    ))
+    self.update_next_row(output_sheet_id, value_range, body.get('values', []))
 
   def new_worksheet(self, sheet_name, output_sheet_id):
     """Helper function to create a new spreadsheet with given name."""
@@ -209,15 +271,7 @@ class SheetHelper:
 
   def rename_sheet(self, old_name, new_name, output_sheet_id):
     """Helper function to easily rename a sheet."""
-
-    sheet_metadata = self.sheet_interface.get(spreadsheetId=output_sheet_id
-                                             ).execute()
-    # Search the given spreadsheet for the old_name string and pull the ID
-    sheets = sheet_metadata.get('sheets')
-    for i in sheets:
-      if i.get('properties').get('title') == old_name:
-        sheet_id = (i.get('properties').get('sheetId'))
-
+    sheet_id = self.get_sheet_id(old_name, output_sheet_id)
     if sheet_id is None:
       raise Exception('old title not found')
 
@@ -248,12 +302,9 @@ class SheetHelper:
 
   def delete_worksheet(self, sheet_name, spreadsheet_id):
     """Deletes a worksheet of a specific name."""
-    sheet_metadata = self.sheet_interface.get(spreadsheetId=spreadsheet_id
-                                             ).execute()
-    sheets = sheet_metadata.get('sheets')
-    for i in sheets:
-      if i.get('properties').get('title') == sheet_name:
-        sheet_id = (i.get('properties').get('sheetId'))
+    sheet_id = self.get_sheet_id(sheet_name, spreadsheet_id)
+    if sheet_id is None:
+      raise Exception('sheet title not found')
 
     request = {
         'requests': [
@@ -267,8 +318,129 @@ class SheetHelper:
     result = self.batch_update(request, spreadsheet_id)
     return result
 
+  def get_sheet_ids(self, spreadsheet_id, refresh=False):
+    """Gets the sheetId of every tab of a spreadsheet, fetching the metadata only the first time.
+
+    Args:
+      spreadsheet_id: the spreadsheet
+      refresh: if True the metadata is fetched again
+    Returns:
+      sheet_ids: each tab's title to its sheetId
+    """
+    if refresh or spreadsheet_id not in self.sheet_ids:
+      sheet_metadata = self.execute(self.sheet_interface.get(spreadsheetId=spreadsheet_id,
+                                                             fields='sheets.properties(sheetId,title)'
+                                                            ), 'read')
+      self.sheet_ids[spreadsheet_id] = {
+          sheet.get('properties').get('title'): sheet.get('properties').get('sheetId')
+          for sheet in sheet_metadata.get('sheets', [])
+      }
+    return self.sheet_ids[spreadsheet_id]
+
+  def get_sheet_id(self, sheet_name, spreadsheet_id):
+    """Gets the sheetId of a tab, or None if the spreadsheet has no tab of that name.
+
+    A title that is not cached is looked up again, in case the tab was added by someone else.
+    """
+    sheet_id = self.get_sheet_ids(spreadsheet_id).get(sheet_name)
+    if sheet_id is None:
+      sheet_id = self.get_sheet_ids(spreadsheet_id, refresh=True).get(sheet_name)
+    return sheet_id
+
+  def update_sheet_cache(self, spreadsheet_id, requests, replies):
+    """Updates the cached sheet ids and next rows after our own batchUpdate.
+
+    Args:
+      spreadsheet_id: the spreadsheet that was updated
+      requests: the requests of the batchUpdate
+      replies: the replies of the batchUpdate, in the same order
+    """
+    sheet_ids = self.sheet_ids.get(spreadsheet_id)
+    for request, reply in zip(requests, list(replies) + [{}] * len(requests)):
+      if 'addSheet' in request:
+        properties = reply.get('addSheet', {}).get('properties', {})
+        if sheet_ids is not None and 'sheetId' in properties:
+          sheet_ids[properties.get('title')] = properties.get('sheetId')
+        else:
+          self.sheet_ids.pop(spreadsheet_id, None)
+          sheet_ids = None
+        # a new tab is empty, unless a SheetBatchWriter already reserved rows on it before it was sent
+        self.next_rows.setdefault(
+            (spreadsheet_id, properties.get('title', request['addSheet']['properties']['title'])), 1)
+      elif 'deleteSheet' in request or 'updateSheetProperties' in request:
+        if 'deleteSheet' in request:
+          sheet_id = request['deleteSheet']['sheetId']
+          new_title = None
+        else:
+          sheet_id = request['updateSheetProperties']['properties'].get('sheetId')
+          new_title = request['updateSheetProperties']['properties'].get('title')
+          if new_title is None:
+            continue
+        if sheet_ids is None:
+          # without the sheet ids the old title of the tab is not known, so no cached row can be trusted
+          self.clear_next_rows(spreadsheet_id)
+          continue
+        old_titles = [title for title, cached_id in sheet_ids.items() if cached_id == sheet_id]
+        for old_title in old_titles:
+          del sheet_ids[old_title]
+          next_row = self.next_rows.pop((spreadsheet_id, old_title), None)
+          if new_title is not None and next_row is not None:
+            self.next_rows[(spreadsheet_id, new_title)] = next_row
+        if new_title is not None:
+          sheet_ids[new_title] = sheet_id
+      elif any(request_type in request for request_type in SHEET_LEVEL_REQUESTS):
+        self.sheet_ids.pop(spreadsheet_id, None)
+        sheet_ids = None
+      elif any(request_type in request for request_type in ROW_CHANGING_REQUESTS):
+        self.clear_next_rows(spreadsheet_id)
+
+  def clear_next_rows(self, spreadsheet_id, sheet_name=None):
+    """Forgets the cached next free row of a tab, or of every tab of the spreadsheet."""
+    for key in list(self.next_rows):
+      if key[0] == spreadsheet_id and sheet_name in (None, key[1]):
+        del self.next_rows[key]
+
+  def update_next_row(self, spreadsheet_id, value_range, values):
+    """Moves the cached next free row of a tab past values written to value_range."""
+    match = RANGE_PATTERN.match(value_range)
+    if not match or '!' not in value_range:
+      self.clear_next_rows(spreadsheet_id)
+      return
+    sheet_name = match.group(1).replace("''", "'") if match.group(1) else match.group(2)
+    key = (spreadsheet_id, sheet_name)
+    if not match.group(3):
+      self.next_rows.pop(key, None)
+    elif key in self.next_rows and values:
+      self.next_rows[key] = max(self.next_rows[key], int(match.group(3)) + len(values))
+
   def get_next_available_row(self, spreadsheet_id, sheet_name):
-    """."""
-    row_a = self.read_single_values(sheet_name + '!A:A', spreadsheet_id)
+    """Gets the first row after the rows of column A, reading the column only the first time.
+
+    The row is then kept up to date by our own writes. Writes by anyone else are not seen.
+    """
+    key = (spreadsheet_id, sheet_name)
+    if key not in self.next_rows:
+      row_a = self.read_single_values(sheet_name + '!A:A', spreadsheet_id)
+      self.next_rows[key] = len(row_a) + 1
+
+    return self.next_rows[key]
+
+  def reserve_rows(self, spreadsheet_id, sheet_name, num_rows):
+    """Gets the next free row of a tab and moves the cached next row past num_rows rows."""
+    row = self.get_next_available_row(spreadsheet_id, sheet_name)
+    self.next_rows[(spreadsheet_id, sheet_name)] = row + num_rows
+    return row
 
-    return len(row_a) + 1
\ No newline at end of file
+  def append_rows(self, rows, sheet_name, spreadsheet_id, value_input_option='RAW'):
+    """Writes rows after the last row of a tab, with one write call once the next row is cached.
+
+    Args:
+      rows: the rows to write
+      sheet_name: the tab to write to
+      spreadsheet_id: the spreadsheet to write to
+    Returns:
+      row: the row the first of the rows was written to
+    """
+    row = self.reserve_rows(spreadsheet_id, sheet_name, len(rows))
+    self.update_sheet({'values': rows}, '{}!A{}'.format(sheet_name, row), spreadsheet_id, value_input_option)
+    return row
@@ -0,0 +1,268 @@
+"""
+A content-addressed cache of DMConsole exports of .sdm segments.
+
+An exported segment is stored under a key made from the segment content and everything that changes
+how DMConsole decodes it: the export type, the filter, the DMConsole build and the modem.bin. Unchanged
+segments are never exported twice, and changing the filter or decoder only misses the entries it affects.
+The cache is pruned each time its index is saved, so it stays under a size limit and drops exports that
+have not been used for a while.
+
+To use:
+>>>cache = ExportCache(dm_console_location=Path('path to DMConsole'))
+>>>key = cache.get_key(Path('path to .sdm segment'), 'metricexport', FILTER)
+>>>exported_log = cache.get(key)
+"""
+from contextlib import contextmanager
+from pathlib import Path
+import threading
+import tempfile
+import hashlib
+import logging
+import shutil
+import json
+import time
+import os
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+  import msvcrt
+
+# set up the export_cache logger
+Path(os.getcwd() + '/logs/').mkdir(parents=True, exist_ok=True)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                    datefmt='%m-%d %H:%M',
+                    filename='./logs/tool_log.log',
+                    filemode='w')
+log = logging.getLogger('export_cache')
+
+
+EXPORT_CACHE_LOCATION = Path(Path.cwd() / 'export_cache')
+# The cache is pruned to this many bytes, the least recently used exports first
+EXPORT_CACHE_MAX_SIZE = 20 * 1024 ** 3
+# Exports not used for this many seconds are pruned, whatever the size of the cache
+EXPORT_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+# Exports used this many seconds ago or less are never pruned, another process may be reading them
+EXPORT_CACHE_MIN_AGE = 60 * 60
+FILE_HASH_INDEX = 'file_hashes.json'
+HASH_CHUNK_SIZE = 1024 * 1024
+# Seconds between tries to lock the index on windows, where the lock cannot be waited on for long
+INDEX_LOCK_RETRY_DELAY = 0.05
+
+
+@contextmanager
+def lock_file(lock_location):
+  """Holds an exclusive lock on a file, shared with every other process using the same file.
+
+  Args:
+    lock_location (Path): The lock file. It is created if it does not exist
+  """
+  with open(lock_location, 'a+b') as lock:
+    if fcntl is not None:
+      fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+      try:
+        yield
+      finally:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+      return
+
+    lock.seek(0)
+    while True:
+      try:
+        msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+        break
+      except OSError:
+        time.sleep(INDEX_LOCK_RETRY_DELAY)
+    try:
+      yield
+    finally:
+      lock.seek(0)
+      msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def read_index(index_file):
+  """Reads a file hash index, returning an empty one if there is none or it is corrupt."""
+  if not index_file.is_file():
+    return {}
+  try:
+    with open(index_file, 'r', encoding='utf-8') as index:
+      return json.load(index)
+  except ValueError:
+    log.info('export cache index {} is corrupt, rebuilding it'.format(str(index_file)))
+    return {}
+
+
+class ExportCache:
+  """
+  A cache of exported segment text files, keyed on the content of everything used to export them.
+
+  File hashes are remembered by path, size and modification time so an archived log is only hashed once.
+  """
+  def __init__(self, cache_location=EXPORT_CACHE_LOCATION, dm_console_location=None, modem_bin_location=None,
+               max_size=EXPORT_CACHE_MAX_SIZE, max_age=EXPORT_CACHE_MAX_AGE):
+    """
+    Args:
+      cache_location (Path): The folder the exported segments are stored in
+      dm_console_location (Path): The DMConsole executable. Its content identifies the DMConsole build
+      modem_bin_location (Path): The modem.bin used by DMConsole to decode the logs
+      max_size (int): The bytes of exports kept, see prune(). None keeps any size
+      max_age (float): Seconds an export is kept after it was last used. None keeps it for ever
+    """
+    self.cache_location = Path(cache_location)
+    self.cache_location.mkdir(parents=True, exist_ok=True)
+    self.dm_console_location = dm_console_location
+    self.modem_bin_location = modem_bin_location
+    self.max_size = max_size
+    self.max_age = max_age
+    self.lock = threading.Lock()
+    self.file_hashes = read_index(self.cache_location / FILE_HASH_INDEX)
+
+  def get_file_hash(self, file):
+    """Returns the sha256 of a file, reusing the last hash if the file has not changed.
+
+    Args:
+      file (Path): The file to hash
+    Returns:
+      file_hash (str): the hex digest of the file content
+    """
+    file = Path(file)
+    stat = file.stat()
+    signature = [stat.st_size, stat.st_mtime_ns]
+    index_key = str(file.resolve())
+    with self.lock:
+      cached = self.file_hashes.get(index_key)
+    if cached and cached[0] == signature:
+      return cached[1]
+
+    file_hash = hashlib.sha256()
+    with open(file, 'rb') as hashed_file:
+      for chunk in iter(lambda: hashed_file.read(HASH_CHUNK_SIZE), b''):
+        file_hash.update(chunk)
+    file_hash = file_hash.hexdigest()
+    with self.lock:
+      self.file_hashes[index_key] = [signature, file_hash]
+    return file_hash
+
+  def get_dm_console_build(self):
+    """Returns a string identifying the DMConsole build used for the exports."""
+    if self.dm_console_location and Path(self.dm_console_location).is_file():
+      return self.get_file_hash(self.dm_console_location)
+    return str(self.dm_console_location)
+
+  def get_modem_bin_hash(self):
+    """Returns the hash of the modem.bin used to decode the logs, or None if there is none."""
+    if self.modem_bin_location and Path(self.modem_bin_location).is_file():
+      return self.get_file_hash(self.modem_bin_location)
+    return None
+
+  def get_key(self, log_file, export_type, filter_file=None):
+    """Gets the cache key of an export of a segment.
+
+    Args:
+      log_file (Path): The .sdm segment
+      export_type (str): The DMConsole export, 'signalexport' or 'metricexport'
+      filter_file (Path): The filter passed to DMConsole, if any
+    Returns:
+      key (str): the hex digest identifying the export
+    """
+    key_parts = {
+        'segment': self.get_file_hash(log_file),
+        'export_type': export_type,
+        'filter': self.get_file_hash(filter_file) if filter_file else None,
+        'dm_console': self.get_dm_console_build(),
+        'modem_bin': self.get_modem_bin_hash(),
+    }
+    return hashlib.sha256(json.dumps(key_parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+  def get_path(self, key):
+    """Returns the path an export with the given key is stored at."""
+    return self.cache_location / key[:2] / (key + '.txt')
+
+  def get(self, key):
+    """Returns the cached export for the key, or None if it is not cached."""
+    cached_export = self.get_path(key)
+    if cached_export.is_file():
+      log.info('export cache hit: {}'.format(key))
+      # the modification time is when the export was last used, the exports used least recently are pruned first
+      try:
+        os.utime(cached_export)
+      except OSError:
+        pass
+      return cached_export
+    return None
+
+  def put(self, key, exported_log):
+    """Moves an exported segment into the cache.
+
+    Args:
+      key (str): The cache key from get_key()
+      exported_log (Path): The .txt file DMConsole exported
+    Returns:
+      cached_export (Path): the location of the export in the cache
+    """
+    cached_export = self.get_path(key)
+    cached_export.parent.mkdir(parents=True, exist_ok=True)
+    # Move to a temporary name first so a half written entry is never mistaken for a cached export
+    tmp_export = cached_export.with_name('{}.{}.{}.tmp'.format(key, os.getpid(), threading.get_ident()))
+    shutil.move(str(exported_log), str(tmp_export))
+    os.replace(tmp_export, cached_export)
+    log.info('export cached: {}'.format(key))
+    return cached_export
+
+  def prune(self):
+    """Deletes the exports not used for max_age, then the least recently used ones until the cache fits
+    max_size. Exports used in the last EXPORT_CACHE_MIN_AGE seconds are kept.
+
+    Returns:
+      pruned (int): the number of exports deleted
+    """
+    now = time.time()
+    cached_exports = []
+    for cached_export in self.cache_location.glob('*/*.txt'):
+      try:
+        stat = cached_export.stat()
+      except OSError:
+        continue
+      cached_exports.append((stat.st_mtime, stat.st_size, cached_export))
+    cached_exports.sort()
+    cache_size = sum(size for _, size, _ in cached_exports)
+
+    pruned = 0
+    for last_used, size, cached_export in cached_exports:
+      too_old = self.max_age is not None and now - last_used > self.max_age
+      too_big = self.max_size is not None and cache_size > self.max_size
+      if not (too_old or too_big) or now - last_used < EXPORT_CACHE_MIN_AGE:
+        break
+      try:
+        os.remove(cached_export)
+      except OSError:  # still open in another process on windows
+        continue
+      cache_size -= size
+      pruned += 1
+    if pruned:
+      log.info('pruned {} exports from the export cache, {} bytes left'.format(pruned, cache_size))
+    return pruned
+
+  def save_index(self):
+    """Writes the remembered file hashes to the cache folder, then prunes the cache.
+
+    Other processes may share the cache, so the index is merged with the one on disk under a file lock
+    rather than overwritten, and written to a temporary file of its own before it replaces the index.
+    """
+    index_file = self.cache_location / FILE_HASH_INDEX
+    with self.lock, lock_file(self.cache_location / (FILE_HASH_INDEX + '.lock')):
+      file_hashes = read_index(index_file)
+      file_hashes.update(self.file_hashes)
+      self.file_hashes = file_hashes
+      tmp_handle, tmp_index = tempfile.mkstemp(dir=str(self.cache_location), prefix=FILE_HASH_INDEX,
+                                               suffix='.tmp')
+      try:
+        with os.fdopen(tmp_handle, 'w', encoding='utf-8') as index:
+          json.dump(file_hashes, index)
+        os.replace(tmp_index, index_file)
+      except BaseException:
+        os.remove(tmp_index)
+        raise
+      self.prune()
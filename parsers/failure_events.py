@@ -0,0 +1,154 @@
+"""
+A single pass scanner of parsed signalling logs for failure events such as RLFs.
+
+Every search term of every FailurePattern is combined into one compiled pattern, so the log is scanned
+once however many patterns there are. Each hit is returned as a FailureEvent with its type, cause, OTA
+message and timestamp.
+
+To use:
+>>>scanner = FailureEventScanner()
+>>>for failure_event in scanner.scan(parsed_log):
+>>>  print(failure_event.event_type, failure_event.cause, failure_event.timestamp)
+"""
+from pathlib import Path
+import logging
+import json
+import os
+
+from parsers.log_scan import get_terms_pattern, iter_matching_messages
+from parsers.log_stream import get_log_set
+
+# set up the failure_events logger
+Path(os.getcwd() + '/logs/').mkdir(parents=True, exist_ok=True)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                    datefmt='%m-%d %H:%M',
+                    filename='./logs/tool_log.log',
+                    filemode='w')
+log = logging.getLogger('failure_events')
+
+
+class FailurePattern:
+  """
+  A print that marks a failure event.
+
+  Attributes:
+    event_type: the type of event the print belongs to, e.g. 'rlf'
+    search_term: the print, matched as a substring of a line
+    cause: the cause reported when the print is found. None if the print does not name a cause
+    qualifies: if True the print only gives the cause of an event of the same type on the same line,
+      it is not an event by itself. e.g. 't310-Expire' is only a RLF cause on a rlf-Cause line
+  """
+  def __init__(self, event_type, search_term, cause=None, qualifies=False):
+    self.event_type = event_type
+    self.search_term = search_term
+    self.cause = cause
+    self.qualifies = qualifies
+
+  def __repr__(self):
+    return 'FailurePattern({}, {})'.format(self.event_type, self.search_term)
+
+
+class FailureEvent:
+  """
+  A failure found in a log.
+
+  Attributes:
+    event_type: the type of the FailurePattern that found it
+    cause: the cause of the failure, None if it was not reported
+    message_index: the position of the OTA message holding the failure, starting at 0
+    line_number: the line the failure was found on, starting at 0
+    timestamp: the time of the OTA message as written in its first line, None if it has none
+    line: the line the failure was found on
+  """
+  def __init__(self, event_type, cause, message_index, line_number, timestamp, line):
+    self.event_type = event_type
+    self.cause = cause
+    self.message_index = message_index
+    self.line_number = line_number
+    self.timestamp = timestamp
+    self.line = line
+
+  def __repr__(self):
+    return 'FailureEvent({}, {}, line {})'.format(self.event_type, self.cause, self.line_number)
+
+
+DEFAULT_FAILURE_PATTERNS = (
+    FailurePattern('rlf', 'rlf-Cause'),
+    FailurePattern('rlf', 'other-failure', 'other-failure', qualifies=True),
+    FailurePattern('rlf', 'randomAccessProblem', 'randomAccessProblem', qualifies=True),
+    FailurePattern('rlf', 't310-Expire', 't310-Expiry', qualifies=True),
+    FailurePattern('rlf', 'rlc-MaxNumRetx', 'rlc-MaxNumRetx', qualifies=True),
+    # the UE telling the network a RLF happened
+    FailurePattern('rlf_info', 'rlf-InfoAvailable-r10: true', 'rlf-InfoAvailable-r10: true'),
+    FailurePattern('rlf_info', 'rlf-InfoAvailable-r11: true', 'rlf-InfoAvailable-r11: true'),
+    FailurePattern('rlf_info', 'scgFailureInformationNR', 'scgFailureInformationNR'),
+    FailurePattern('rlf_info', 'rlf-Report-r9', 'rlf-Report-r9'),
+)
+
+
+def load_failure_patterns(pattern_file):
+  """Loads FailurePatterns from a json list of objects with the arguments of FailurePattern.
+
+  Args:
+    pattern_file (Path): e.g. [{"event_type": "rlf", "search_term": "rlf-Cause"}, ...]
+  """
+  with open(pattern_file, 'r', encoding='utf-8') as patterns:
+    return [FailurePattern(**pattern) for pattern in json.load(patterns)]
+
+
+class FailureEventScanner:
+  """Finds the failure events of any number of FailurePatterns in one pass over a log."""
+  def __init__(self, failure_patterns=DEFAULT_FAILURE_PATTERNS, encoding='utf-8'):
+    """
+    Args:
+      failure_patterns (iterable): The FailurePatterns to look for
+      encoding (str): The encoding of the logs
+    """
+    self.failure_patterns = list(failure_patterns)
+    self.patterns_by_term = {}
+    for failure_pattern in self.failure_patterns:
+      self.patterns_by_term.setdefault(failure_pattern.search_term, []).append(failure_pattern)
+    # the log is scanned with a bytes pattern, then each of the few lines it finds is checked for every term
+    self.log_pattern = get_terms_pattern(self.patterns_by_term, encoding)
+
+  def get_line_events(self, line):
+    """Gets the event types and causes of a line.
+
+    Returns:
+      line_events (list): (event_type, cause) of every event on the line
+    """
+    # every term is checked, the scan pattern only finds one term per position so it misses terms that
+    # are inside or overlap other terms, e.g. Cause inside rlf-Cause
+    matched_patterns = []
+    for search_term, failure_patterns in self.patterns_by_term.items():
+      if search_term in line:
+        matched_patterns.extend(failure_patterns)
+
+    line_events = []
+    for failure_pattern in matched_patterns:
+      if failure_pattern.qualifies:
+        continue
+      causes = [qualifier.cause for qualifier in matched_patterns
+                if qualifier.qualifies and qualifier.event_type == failure_pattern.event_type]
+      for cause in causes or [failure_pattern.cause]:
+        if (failure_pattern.event_type, cause) not in line_events:
+          line_events.append((failure_pattern.event_type, cause))
+    return line_events
+
+  def scan(self, parsed_log):
+    """Scans a parsed log for failure events.
+
+    Args:
+      parsed_log (LogSet or Path): A parsed signalling log, or the Path of one
+    Returns:
+      failure_events (list): the FailureEvents, in log order
+    """
+    log_set = get_log_set(parsed_log)
+    failure_events = []
+    for line_number, message_index, timestamp, line in iter_matching_messages(log_set, self.log_pattern):
+      for event_type, cause in self.get_line_events(line):
+        failure_events.append(FailureEvent(event_type, cause, message_index, line_number, timestamp, line))
+
+    log.info('found {} failure events in {}'.format(len(failure_events), str(log_set)))
+    return failure_events
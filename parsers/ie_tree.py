@@ -0,0 +1,138 @@
+"""
+An indentation tree of the information elements (IEs) of a Lassen OTA message.
+
+Each OTA message is parsed once into a tree of IeNodes, one per line, where the children of a node are
+the lines indented further than it that follow it. Parsed trees are kept in an LRU cache, so repeated
+queries on the same message do not re-scan its lines.
+
+To use:
+>>>ie_tree = get_ie_tree(ota_message)
+>>>for rat_container in ie_tree.find('**/ue-CapabilityRAT-ContainerList/*'):
+>>>  rat_container.get_lines()
+"""
+from fnmatch import fnmatchcase
+import functools
+
+IE_TREE_CACHE_SIZE = 256
+
+
+class IeNode:
+  """
+  One line of an OTA message and the IEs it encloses.
+
+  Attributes:
+    name: the name of the IE, the first word of the line without a trailing ':'. None for the root
+    line: the line of the OTA message
+    indent: the number of spaces before the IE name. -1 for the root
+    children: the IeNodes enclosed by this IE
+    start: the index of the line in the OTA message
+    end: the index of the first line after the IE and everything it encloses
+  """
+  __slots__ = ('name', 'line', 'indent', 'children', 'lines', 'start', 'end', 'path_cache')
+
+  def __init__(self, line, indent, lines, start):
+    self.name = get_ie_name(line) if line is not None else None
+    self.line = line
+    self.indent = indent
+    self.children = []
+    self.lines = lines
+    self.start = start
+    self.end = len(lines)
+    self.path_cache = {}
+
+  def __repr__(self):
+    return 'IeNode({}, {} children)'.format(self.name, len(self.children))
+
+  def get_lines(self):
+    """Returns the lines of the IE and everything it encloses."""
+    return list(self.lines[self.start : self.end])
+
+  def iter_nodes(self):
+    """Yields every IE enclosed by this one, in the order they appear in the message."""
+    stack = list(reversed(self.children))
+    while stack:
+      node = stack.pop()
+      yield node
+      stack.extend(reversed(node.children))
+
+  def find(self, path):
+    """Gets the IEs that match a path of IE names below this node.
+
+    Args:
+      path (str): IE names separated by '/'. A name can be a wildcard pattern, '*' matches any single IE
+        and '**' matches any number of levels, e.g. 'ue-CapabilityRAT-ContainerList/*' or
+        '**/supportedBandCombinationList/*'
+    Returns:
+      nodes (list): the matching IeNodes, in the order they appear in the message
+    """
+    if path in self.path_cache:
+      return self.path_cache[path]
+
+    nodes = [self]
+    for path_part in path.split('/'):
+      if not path_part:
+        continue
+      next_nodes = []
+      if path_part == '**':
+        for node in nodes:
+          next_nodes.append(node)
+          next_nodes.extend(node.iter_nodes())
+      else:
+        for node in nodes:
+          for child in node.children:
+            if fnmatchcase(child.name, path_part):
+              next_nodes.append(child)
+      # '**' can reach the same IE through more than one parent
+      nodes = list({id(node): node for node in next_nodes}.values())
+    nodes.sort(key=lambda node: node.start)
+
+    self.path_cache[path] = nodes
+    return nodes
+
+
+def get_ie_name(line):
+  """Returns the name of the IE on a line of an OTA message."""
+  words = line.split()
+  if not words:
+    return ''
+  return words[0].rstrip(':')
+
+
+def get_indent(line):
+  """Returns the number of spaces at the start of a line."""
+  return len(line) - len(line.lstrip(' '))
+
+
+def parse_ie_tree(ota_lines):
+  """Parses the lines of an OTA message into an IE tree in a single pass.
+
+  Args:
+    ota_lines (list): The lines of an OTA message
+  Returns:
+    root (IeNode): a node without a line whose children are the least indented IEs of the message
+  """
+  ota_lines = tuple(ota_lines)
+  root = IeNode(None, -1, ota_lines, 0)
+  stack = [root]
+  for line_number, line in enumerate(ota_lines):
+    indent = get_indent(line)
+    while stack[-1].indent >= indent:
+      stack.pop().end = line_number
+    node = IeNode(line, indent, ota_lines, line_number)
+    stack[-1].children.append(node)
+    stack.append(node)
+  return root
+
+
+@functools.lru_cache(maxsize=IE_TREE_CACHE_SIZE)
+def _get_cached_ie_tree(ota_lines):
+  return parse_ie_tree(ota_lines)
+
+
+def get_ie_tree(ota_lines):
+  """Returns the IE tree of an OTA message, from the LRU cache if it has been parsed before.
+
+  Args:
+    ota_lines (list): The lines of an OTA message
+  """
+  return _get_cached_ie_tree(tuple(ota_lines))
@@ -3,10 +3,18 @@ A script to parse and use parsed .sdm log files
 """
 from pathlib import Path
 # from constructors.log_construct import SignalingLog
+from parsers.export_cache import ExportCache
+from parsers.log_stream import LogSet, ParsedLog, get_log_set, iter_ota_messages
+from parsers.ota_index import get_ota_index
+from parsers.ie_tree import get_ie_tree, get_indent
+from parsers.log_scan import search_log_for_terms
+from parsers.failure_events import DEFAULT_FAILURE_PATTERNS, FailureEventScanner
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from sys import platform
 import subprocess
 import logging
+import shutil
 import csv
 import os
 import datetime
@@ -24,6 +32,12 @@ log = logging.getLogger('lassen_parser')
 DM_CONSOLE_LOCATION = Path('/Applications/Uni-DM.app/Contents/MacOS/') # Add the location of your ShannonDM
 MODEM_BIN_LOCATION = Path('/Users/scottrobson/Downloads/modem.bin')
 FILTER = Path(Path.cwd() / 'parsers/ENDC.met')
+# A text export is roughly this many times bigger than the .sdm segment it came from. Used to
+# make sure the concurrent DMConsole exports do not fill the disk.
+EXPORT_SIZE_RATIO = 10
+# The DMConsole exports a LassenParser runs at once when it is not given export_workers. None uses the
+# number of CPUs, see set_default_export_workers()
+DEFAULT_EXPORT_WORKERS = None
 
 
 class LassenParser:
@@ -36,11 +50,21 @@ class LassenParser:
                               output(Path('output path'))
   >>>lp.parse_log_signalling_csv(Path('path to log file'), concatenate_logs(True/False),
                               output(Path('output path'))
+
+  The .sdm segments of a log are exported by a pool of concurrent DMConsole workers, and each
+  segment export is kept in a content-addressed cache so it is only exported once:
+  >>>lp = LassenParser(export_workers=8, limit_workers_by_disk=True, use_export_cache=True)
   """
-  def __init__(self, dm_console_location=DM_CONSOLE_LOCATION):
+  def __init__(self, dm_console_location=DM_CONSOLE_LOCATION, export_workers=None,
+               limit_workers_by_disk=True, use_export_cache=True):
     """
     Args:
       dm_console_location (Path): The location of the folder containing the DMConsole.exe
+      export_workers (int): The maximum number of DMConsole exports to run at once. If it is None
+        DEFAULT_EXPORT_WORKERS is used, or the number of CPUs if that is None too
+      limit_workers_by_disk (bool): If True the number of concurrent exports is also capped by how many
+        exported segments fit in the free disk space
+      use_export_cache (bool): If True segment exports are reused from the ExportCache
     """
     if platform == "win32":
       log.info(platform)
@@ -56,6 +80,113 @@ class LassenParser:
       log.info(str(output))
 
     self.dm_console_location = dm_console_location
+    self.export_workers = export_workers
+    self.limit_workers_by_disk = limit_workers_by_disk
+    self.export_cache = None
+    if use_export_cache:
+      self.export_cache = ExportCache(dm_console_location=dm_console_location,
+                                      modem_bin_location=MODEM_BIN_LOCATION)
+
+  def get_export_worker_count(self, log_files):
+    """Gets the number of DMConsole exports to run at once for the given segments.
+
+    Args:
+      log_files (list): Path objects of the .sdm segments to export
+    Returns:
+      workers (int): the number of concurrent DMConsole workers, at least 1
+    """
+    cpu_count = os.cpu_count() or 1
+    workers = self.export_workers or DEFAULT_EXPORT_WORKERS or cpu_count
+    workers = min(workers, cpu_count, max(len(log_files), 1))
+
+    if self.limit_workers_by_disk and log_files:
+      largest_export = max(Path(file).stat().st_size for file in log_files) * EXPORT_SIZE_RATIO
+      free_disk = shutil.disk_usage(Path(log_files[0]).parent).free
+      if largest_export:
+        workers = min(workers, free_disk // largest_export)
+
+    workers = max(int(workers), 1)
+    log.info('exporting {} segments with {} DMConsole workers'.format(len(log_files), workers))
+    return workers
+
+  def export_segment(self, log_file, export_type='signalexport', filter_file=None):
+    """Runs DMConsole on a single .sdm segment.
+
+    Args:
+      log_file (Path): The .sdm segment to export
+      export_type (str): The DMConsole export, 'signalexport' or 'metricexport'
+      filter_file (Path): A filter to pass to DMConsole with -f. Not used if it is None
+    Returns:
+      exported_log (Path): the exported .txt file, or None if DMConsole did not export the segment.
+        If the export cache is used this is the cached export, which must not be deleted. Otherwise it
+        is left next to the .sdm segment, see release_export()
+    """
+    cache_key = None
+    if self.export_cache:
+      cache_key = self.export_cache.get_key(log_file, export_type, filter_file)
+      cached_export = self.export_cache.get(cache_key)
+      if cached_export:
+        return cached_export
+
+    command = str(self.dm_console_location) + ' ' + export_type
+    if filter_file:
+      command = command + ' -f ' + str(filter_file)
+    command = command + ' ' + str(log_file)
+    print('Parsing the logs. Running this command: {}'.format(command))
+    subprocess.run(command.split(), capture_output=True)
+
+    exported_log = Path(str(log_file)[:-3] + 'txt')
+    if not exported_log.is_file():
+      log.info('DMConsole did not export {}'.format(str(log_file)))
+      return None
+    if self.export_cache:
+      exported_log = self.export_cache.put(cache_key, exported_log)
+    return exported_log
+
+  def export_segments(self, log_files, export_type='signalexport', filter_file=None):
+    """Exports the .sdm segments with a pool of concurrent DMConsole workers.
+
+    Args:
+      log_files (list): Path objects of the .sdm segments, in segment order
+      export_type (str): The DMConsole export, 'signalexport' or 'metricexport'
+      filter_file (Path): A filter to pass to DMConsole with -f. Not used if it is None
+    Returns:
+      exported_logs (list): the exported .txt files in the same order as log_files. An entry is None
+        if that segment could not be exported
+    """
+    workers = self.get_export_worker_count(log_files)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+      exported_logs = list(executor.map(lambda file: self.export_segment(file, export_type, filter_file),
+                                        log_files))
+    if self.export_cache:
+      self.export_cache.save_index()
+    return exported_logs
+
+  def release_export(self, exported_log):
+    """Deletes a segment export once it has been read, unless the export cache owns it."""
+    if exported_log and not self.export_cache and Path(exported_log).is_file():
+      os.remove(exported_log)
+
+  def collect_exports(self, exported_logs, output_file):
+    """Gets the exports of the segments of a log as one parsed log.
+
+    Cached exports are read where they are. Without an export cache nothing owns the exports DMConsole
+    left next to the .sdm segments, so they are concatenated into output_file and deleted.
+
+    Args:
+      exported_logs (list): the exported .txt files, in segment order
+      output_file (Path): the file to concatenate them into when there is no export cache
+    Returns:
+      log_set (LogSet): the exports, or a ParsedLog of output_file
+    """
+    log_set = LogSet(exported_logs)
+    if self.export_cache:
+      return log_set
+    log_set.write_to(output_file)
+    log_set.close()
+    for exported_log in exported_logs:
+      self.release_export(exported_log)
+    return ParsedLog(output_file)
 
   def modify_file_for_mac_os_unidm(self, log_path):
     """Uni-DM on MacOS cannot handle the brackets in a log file, this removes them."""
@@ -76,117 +207,76 @@ class LassenParser:
     return Path(renamed_file_name)
 
   def parse_log_signalling_txt_pixellogger(self, log_path):
-    """Parse the pixellogger logs."""
+    """Parse the pixellogger logs.
+
+    Returns:
+      log_set (LogSet): the signalling exports of the log segments, in segment order
+    """
     # we need to remove any of the spaces in the log files
     log_path = rename_folder_before_parsing(log_path)
-    if Path(log_path / 'pixellogger_parsed.txt').is_file():
-      os.remove(Path(log_path / 'pixellogger_parsed.txt'))
-    output_file = Path(log_path / 'pixellogger_parsed.txt')
     log_files = []
     for file in Path(log_path).iterdir():
       if 'sdm' in file.suffix:
         if 'sbuff_power' not in file.name:
           log_files.append(file)
 
-    with open(output_file, "w") as output_text_file:
-      output_text_file.write('Parsed log file of {}\n\n'.format(str(log_path)))
+    log_files = sorted(log_files)
+    exported_logs = self.export_segments(log_files, 'signalexport')
+    for file, exported_log in zip(log_files, exported_logs):
+      if not exported_log:
+        raise FileNotFoundError('DMConsole did not export {}'.format(str(file)))
+    return self.collect_exports(exported_logs, Path(log_path) / 'pixellogger_parsed.txt')
 
-    for file in sorted(log_files):
-      command = str(self.dm_console_location) + ' signalexport ' + str(file)
-      print('Parsing the logs. Running this command: {}'.format(command))
-      subprocess.run(command.split(), capture_output=True)
-
-      exported_log = Path(str(file)[:-3] + 'txt')
-      with open(output_file, 'a') as output_text_file:
-        with open(exported_log, 'r') as tmp_output:
-          for line in tmp_output.readlines():
-            output_text_file.write(line)
+  def parse_log_metrics_txt_maclinux(self, log_path, concatenate_logs=True, output=True, overwrite=True):
+    """Export the metrics of the log segments in the folder of log_path for mac/linux.
 
-      os.remove(str(file)[:-3] + 'txt')
-    return output_file
+    Returns:
+      log_set (LogSet): the metrics exports of the log segments, in segment order
+    """
+    # Segment exports are reused from the export cache, so only fall back to an existing
+    # directory_metrics.txt when there is no cache to check it against
+    if not self.export_cache and not overwrite:
+      for file in Path(log_path).parent.iterdir():
+        if 'directory_metrics' in file.name:
+          return ParsedLog(file)
 
-  def parse_log_metrics_txt_maclinux(self, log_path, concatenate_logs=True, output=True, overwrite=True):
-    """."""
-    for file in Path(log_path).parent.iterdir():
-      if 'directory_metrics' in file.name:
-        if overwrite:
-          with open(file, 'w', encoding='utf-8') as output_file:
-            output_file.write('test')
-          break
-        else:
-          return file
-    
     self.modify_file_for_mac_os_unidm(log_path)
-    log_files = []
-    for file in Path(log_path).parent.iterdir():
-      if 'sdm' in file.suffix:
-        if 'sbuff_power_on_log' not in str(file.name):
-          log_files.append(file)
-    
-    output_file = str(str(Path(file.parent) / 'directory_metrics.txt'))
-    with open(output_file, "w") as output_text_file:
-      output_text_file.write('Parsed log file of {}\n\n'.format(str(log_path)))
-
-    for file in sorted(log_files):
-      command = str(self.dm_console_location) + ' metricexport -f ' + str(FILTER) + ' ' + str(file)
-      print('Parsing the logs. Running this command: {}'.format(command))
-      subprocess.run(command.split(), capture_output=True)
-
-      exported_log = Path(str(file)[:-3] + 'txt')
-      with open(output_file, 'a') as output_text_file:
-        try:
-          with open(exported_log, 'r') as tmp_output:
-            for line in tmp_output.readlines():
-              output_text_file.write(line)
-        except FileNotFoundError:
-          print('File not found')
-          continue
-      
-      os.remove(str(file)[:-3] + 'txt')
+    log_files = get_log_segments(log_path)
+    if not concatenate_logs:
+      log_files = log_files[:1]
 
-      if not concatenate_logs:
-        break
-    
-    return output_file
+    exported_logs = self.export_segments(log_files, 'metricexport', FILTER)
+    for exported_log in exported_logs:
+      if not exported_log:
+        print('File not found')
+    return self.collect_exports([exported_log for exported_log in exported_logs if exported_log],
+                                Path(log_path).parent / 'directory_metrics.txt')
 
   def parse_log_signalling_txt_maclinux(self, log_path, concatenate_logs=True, output=None):
-    """Parse log file function for mac/linux."""
-    if not output:
+    """Parse log file function for mac/linux.
+
+    Returns:
+      log_set (LogSet): the signalling exports of the log segments, in segment order. If output is
+        set the segments are also written to that file
+    """
+    if not output and not self.export_cache:
       for file in Path(log_path).parent.iterdir():
         if 'directory_parsed' in file.name:
-          return file
+          return ParsedLog(file)
     self.modify_file_for_mac_os_unidm(log_path)
-    log_files = []
-    for file in Path(log_path).parent.iterdir():
-      if 'sdm' in file.suffix:
-        if 'sbuff_power_on_log' not in str(file.name):
-          log_files.append(file)
+    log_files = get_log_segments(log_path)
+    if not concatenate_logs:
+      log_files = log_files[:1]
 
-    if not output:
-      output_file = str(str(Path(file.parent) / 'directory_parsed.txt'))
-    else:
-      output_file = output
-    # print(output_file)
-    with open(output_file, "w") as output_text_file:
-      output_text_file.write('Parsed log file of {}\n\n'.format(str(log_path)))
-
-    for file in sorted(log_files):
-      command = str(self.dm_console_location) + ' signalexport ' + str(file)
-      print('Parsing the logs. Running this command: {}'.format(command))
-      subprocess.run(command.split(), capture_output=True)
-      
-      exported_log = Path(str(file)[:-3] + 'txt')
-      with open(output_file, 'a') as output_text_file:
-        with open(exported_log, 'r') as tmp_output:
-          for line in tmp_output.readlines():
-            output_text_file.write(line)
-
-      os.remove(str(file)[:-3] + 'txt')
+    exported_logs = self.export_segments(log_files, 'signalexport')
+    for file, exported_log in zip(log_files, exported_logs):
+      if not exported_log:
+        raise FileNotFoundError('DMConsole did not export {}'.format(str(file)))
+    log_set = self.collect_exports(exported_logs, output or Path(log_path).parent / 'directory_parsed.txt')
 
-      if not concatenate_logs:
-        break
-    
-    return output_file
+    if output and self.export_cache:
+      log_set.write_to(output)
+    return log_set
 
   def parse_log_signalling_txt(self, log_path, concatenate_logs=True, output=None):
     """
@@ -288,75 +378,70 @@ class LassenParser:
   def check_for_rlf_txt(self, parsed_log_txt):
     pass
 
-  def check_for_rlf(self, parsed_log):
-    """.
+  def get_failure_events(self, parsed_log, failure_patterns=DEFAULT_FAILURE_PATTERNS):
+    """Scans a parsed signalling log for failure events in a single pass.
+
     Args:
-       parsed_log (Path): Path of a parsed signaling log in *.csv
+       parsed_log (LogSet or Path): A parsed signalling log, or the Path of one
+       failure_patterns (iterable): The FailurePatterns to look for
+    Returns:
+      failure_events (list): the FailureEvents found, in log order
     """
     try:
-      with open(str(parsed_log), 'r') as csvlogfile:
-        csvlog = []
-        for line in csvlogfile:
-          csvlog.append(line)
+      return FailureEventScanner(failure_patterns).scan(parsed_log)
     except FileNotFoundError:
       raise FileNotFoundError('Parsed log file not found!')
 
-    current_line = 0
-    rlf_found = False
-    for line in csvlog:
-      if 'rlf-Cause' in line:
-        rlf_found = True
-        print('Log contains a RLF in line {}: "{}"'.format(current_line, line.strip()))
-        if 'other-failure' in line:
-          print('The log contains a "other-failure" Re-establishment request at line {}'.format(str(current_line)))
-        if 'randomAccessProblem' in line:
-          print('The log contains a "randomAccessProblem" Re-establishment request at line {}'.format(str(current_line)))
-        if 't310-Expire' in line:
-          print('The log contains a "t310-Expiry" Re-establishment request at line {}'.format(str(current_line)))
-        if 'rlc-MaxNumRetx' in line:
-          print('The log contains a "rlc-MaxNumRetx" Re-establishment request at line {}'.format(str(current_line)))
-      # Check for UE sending rlf info available to the NW
-      if 'rlf-InfoAvailable-r10: true' in line:
-        rlf_found = True
-        print('The log contains a RLF info to the network (rlf-InfoAvailable-r10: true) on or around message {}'.format(str(current_line)))
-      # Check for UE sending rlf info available to the NW
-      if 'rlf-InfoAvailable-r11: true' in line:
-        rlf_found = True
-        print('The log contains a RLF info to the network (rlf-InfoAvailable-r11: true) on or around message {}'.format(str(current_line)))
-      if 'scgFailureInformationNR' in line:
-        rlf_found = True
-        print('The log contains a RLF info to the network (scgFailureInformationNR) on or around message {}'.format(str(current_line)))
-      current_line += 1
-      if 'rlf-Report-r9' in line:
-        rlf_found = True
-        print('The log contains a RLF info to the network (rlf-Report-r9) on or around message {}'.format(str(current_line)))
-    return rlf_found
+  def check_for_rlf(self, parsed_log):
+    """Prints the radio link failures in a parsed signalling log.
 
-  def check_for_print(self, parsed_log, search_term):
-    """.
     Args:
-      parsed_log (Path): Path of a parsed signaling log in *.csv
-      search_term (str): a string to search the log for
+       parsed_log (LogSet or Path): A parsed signalling log, or the Path of one
     Returns:
+      rlf_found (bool): True if the log contains a RLF
+    """
+    failure_events = self.get_failure_events(parsed_log)
+    for failure_event in failure_events:
+      if failure_event.event_type == 'rlf':
+        print('Log contains a RLF in line {}: "{}"'.format(failure_event.line_number, failure_event.line.strip()))
+        if failure_event.cause:
+          print('The log contains a "{}" Re-establishment request at line {}'.format(failure_event.cause,
+                                                                                    str(failure_event.line_number)))
+      else:
+        print('The log contains a RLF info to the network ({}) on or around message {}'.format(failure_event.cause,
+                                                                                              str(failure_event.line_number)))
+    return bool(failure_events)
 
+  def search_for_prints(self, parsed_log, search_terms):
+    """Searches a parsed log for many prints in a single pass.
+
+    Args:
+      parsed_log (LogSet or Path): A parsed signalling log, or the Path of one
+      search_terms (iterable): The strings to search the log for
+    Returns:
+      search_hits (dict): each search term to a list of SearchHits with the message id, line number and
+        timestamp of every line it is in
     """
+    log.info('Scanning log {} for {} prints'.format(str(parsed_log), len(search_terms)))
     try:
-      with open(str(parsed_log), 'r') as csvlogfile:
-        csvlog = []
-        for line in csvlogfile:
-          csvlog.append(line)
+      return search_log_for_terms(parsed_log, search_terms)
     except FileNotFoundError:
       raise FileNotFoundError('Parsed log file not found!')
 
-    log.info('Scanning log {} for "{}"'.format(str(parsed_log), search_term))
-
-    current_line = 0
-    instances_of_log = []
-    for row in csvlog:
-      if search_term in row:
-        print('Found {} in line {}'.format(search_term, current_line))
+  def check_for_print(self, parsed_log, search_term):
+    """Scans a parsed log for a print.
 
-      current_line += 1
+    Args:
+      parsed_log (LogSet or Path): A parsed signalling log, or the Path of one
+      search_term (str): a string to search the log for
+    Returns:
+      line_numbers (list): the line numbers that contain search_term
+    """
+    line_numbers = []
+    for search_hit in self.search_for_prints(parsed_log, [search_term])[search_term]:
+      print('Found {} in line {}'.format(search_term, search_hit.line_number))
+      line_numbers.append(search_hit.line_number)
+    return line_numbers
 
   def get_infoexport(self, log_file):
     """return the infoexport metadata from a log file"""
@@ -372,6 +457,15 @@ class LassenParser:
     log.info(response)
     return response
 
+  def get_log_start_time(self, log_file):
+    """Gets the time logging started from the infoexport of a log file, or None if it is not available."""
+    try:
+      infoexport = self.get_infoexport(log_file)
+    except OSError as error:
+      log.info('infoexport failed for {}: {}'.format(str(log_file), error))
+      return None
+    return get_logging_time_from_infoexport(infoexport.stdout.splitlines())[0]
+
 '''
 def get_individual_signaling_log_object_csv_lassen(parsed_csv):
   """."""
@@ -390,16 +484,56 @@ def get_individual_signaling_log_object_csv_lassen(parsed_csv):
 '''
 
 
+def set_default_export_workers(export_workers):
+  """Sets the DMConsole exports each LassenParser of this process runs at once, unless it is given its own.
+
+  Used in the processes of a pool, which already share the CPUs between them, so the pool does not start
+  a CPU count of DMConsole exports in every process.
+
+  Args:
+    export_workers (int): The exports to run at once. None goes back to the number of CPUs
+  """
+  global DEFAULT_EXPORT_WORKERS
+  DEFAULT_EXPORT_WORKERS = export_workers
+
+
+def get_log_segments(log_path):
+  """Returns the sorted .sdm segments in the folder of log_path, without the power on log."""
+  log_files = []
+  for file in Path(log_path).parent.iterdir():
+    if 'sdm' in file.suffix:
+      if 'sbuff_power_on_log' not in str(file.name):
+        log_files.append(file)
+  return sorted(log_files)
+
+
+def get_logging_time_from_infoexport(infoexport):
+  """Gets the start and end of logging from the lines of an infoexport.
+
+  Args:
+    infoexport (list): The lines of the infoexport, as bytes or str
+  Returns:
+    log_start_time (datetime), log_end_time (datetime): None if there is no Logging Time line
+  """
+  for line in infoexport:
+    if isinstance(line, bytes):
+      line = line.decode('ascii')
+    if 'Logging Time' in line:
+      tmp = line.split()
+      log_start_time = datetime.datetime.strptime(tmp[-5] + ' ' + tmp[-4] + '000', '%Y-%m-%d %H:%M:%S.%f')
+      log_end_time = datetime.datetime.strptime(tmp[-2] + ' ' + tmp[-1] + '000', '%Y-%m-%d %H:%M:%S.%f')
+      return log_start_time, log_end_time
+  return None, None
+
+
+def get_log_start_time(log_file):
+  """Gets the time logging started for a sdm file, or None if the infoexport is not available."""
+  return LassenParser().get_log_start_time(log_file)
+
+
 def get_spaces_before_ie_name(line):
   """."""
-  spaces_before_ie_start = 0
-  for char in line:
-    if char != ' ':
-      # print('spaces before IE name: {}'.format(spaces_before_ie_start))
-      return spaces_before_ie_start
-
-    spaces_before_ie_start += 1
-  return spaces_before_ie_start
+  return get_indent(line)
 
 
 def get_list_of_enclosed_ie(ota_lines):
@@ -419,23 +553,14 @@ def get_list_of_enclosed_ie(ota_lines):
     if current_line_indent == indent_of_ie_list:
       return ota_lines[start_line : current_line]
   """
-  def get_num_spaces(line):
-    num_spaces = 0
-    for char in line:
-      if char != ' ':
-        return num_spaces
-      num_spaces += 1
-    return len(line)
-
   ie_list = []
-  log.debug('ota_lines: {}'.format(ota_lines))
   # The indent we are searching for is the indent after the name of the IE, so we find it here
-  indent_of_ie_list = get_num_spaces(ota_lines[1])
+  indent_of_ie_list = get_indent(ota_lines[1])
   start_line = 1
   current_line = 2
   end_line = 2
   for line in ota_lines[2 : ]:
-    if get_num_spaces(line) == indent_of_ie_list:
+    if get_indent(line) == indent_of_ie_list:
       # print('Indent_of_search: {}, Spaces in line: {}, Line {}'.format(str(get_num_spaces(line)), str(indent_of_ie_list), line))
       end_line = current_line
       ie_list.append(ota_lines[start_line : end_line])
@@ -456,13 +581,8 @@ def get_line_number_of_next_indent(ie_list, indent):
   """
   current_line = 1
   for line in ie_list[1 : ]:
-    current_line_indent = 0
-    for char in line:
-      if char != ' ':
-        break
-      current_line_indent += 1
+    current_line_indent = get_indent(line)
 
-    log.info('current line indent: {}. Line: {}'.format(str(current_line_indent), line))
     if current_line_indent == indent:
       return  current_line - 1
     current_line += 1
@@ -484,30 +604,12 @@ def get_ie_info_from_name_lassen(ota_log, ie_name):
   Returns:
     ie_data (list): A list of the strings contained by the information element
   """
-  log.info('ota-log: {}, ie_name: {}'.format(ota_log, ie_name))
-  if ie_name in ota_log:
-    print('yay the search term is in the log: {}'.format(ie_name))
-  current_line = 0
-  lines_of_presence_of_ie = []
+  log.debug('searching the IE tree of an OTA log for {}'.format(ie_name))
+  # Each IE is a node of the (cached) IE tree of the OTA log, and the tree is in the order of the lines
   ie_data = []
-  for line in ota_log:
-    if ie_name in line:
-      log.info('Line {}: {}'.format(current_line,line))
-      lines_of_presence_of_ie.append(current_line)
-      log.info('the search term is present in {}, Line: {}'.format(line, str(current_line)))
-    current_line += 1
-
-  # For each iteration of the search term get the line number with the next iteration that is
-  for start_line in lines_of_presence_of_ie:
-    num_spaces_in_ie = get_spaces_before_ie_name(ota_log[start_line])
-    # Get the next line where the IE has the same or fewer number of spaces before it is named
-    end_line = start_line + 1
-    for line in ota_log[start_line + 1: ]:
-      if get_spaces_before_ie_name(line) <= num_spaces_in_ie:
-        break
-      end_line += 1
-
-    ie_data.append(ota_log[start_line : end_line])
+  for node in get_ie_tree(ota_log).iter_nodes():
+    if ie_name in node.line:
+      ie_data.append(node.get_lines())
 
   return ie_data
 
@@ -520,12 +622,13 @@ def get_signaling_log_list_from_csv_lassen(log_path):
   pass
 
 
-def get_signalling_log_from_sdm_file(log_file, concatenate_logs=True, output=None):
+def get_signalling_log_from_sdm_file(log_file, concatenate_logs=True, output=None, stream=False):
   """
   Input a Path object of a unique sdm file. Output a .txt file of the capinfo.
 
   Args:
       Path: log_file: A Path objexct of the file to parse
+      bool: stream: If True a LogSet is returned that reads the lines lazily instead of a list of lines
   """
   lassen_parser = LassenParser()
   if 'sbuff_' in log_file.name:
@@ -536,16 +639,21 @@ def get_signalling_log_from_sdm_file(log_file, concatenate_logs=True, output=Non
     log.info('output directory: ' + str(output))
     parsed_log = lassen_parser.parse_log_signalling_txt(log_file, concatenate_logs, output)
 
-  log_lines = []
-  with open(parsed_log, 'r', encoding='utf-8') as parsed_log_file:
-    for line in parsed_log_file:
-      log_lines.append(line)
+  parsed_log = get_log_set(parsed_log)
+  if stream:
+    return parsed_log
 
-  return log_lines
+  return list(parsed_log)
 
 
-def get_metrics_log_from_sdm_file(log_file, overwrite):
-  """."""
+def get_metrics_log_from_sdm_file(log_file, overwrite, stream=False):
+  """Gets the metrics export of a sdm file.
+
+  Args:
+    log_file (Path): A Path object of the file to parse
+    overwrite (bool): If True any existing metrics export is replaced
+    stream (bool): If True a LogSet is returned that reads the lines lazily instead of a list of lines
+  """
   lassen_parser = LassenParser()
   if 'sbuff_' in log_file.name:
     log.info('Log is pixellogger')
@@ -556,12 +664,11 @@ def get_metrics_log_from_sdm_file(log_file, overwrite):
     else:
       pass
       #TODO(@scottrobson) create function to get the metrics using a windows device
-  log_lines = []
-  with open(parsed_log, 'r', encoding='utf-8') as parsed_log_file:
-    for line in parsed_log_file:
-      log_lines.append(line)
+  parsed_log = get_log_set(parsed_log)
+  if stream:
+    return parsed_log
 
-  return log_lines
+  return list(parsed_log)
 
 
 def get_unique_log_files_capinfo_from_log_folder(log_folder):
@@ -630,27 +737,20 @@ def get_instances_of_log_by_print_from_lines(parsed_log, search_term):
   """Get a list of all OTA logs that contain the print search_term.
 
   Args:
-    parsed_log (list): List of strings representing the log files
+    parsed_log (iterable): List of strings representing the log files, or a LogSet. A LogSet is
+      indexed once (see OtaMessageIndex) so repeated searches do not rescan the log
 
   Returns:
     instances_of_log (list): list of logs containing the print
   """
-  current_line = 0
-  start_of_individual_log = 0
-  instances_of_log = []
-  for line in parsed_log:
-    if line == '\n':
-      start_of_individual_log = current_line
-    if search_term in line:
-      # Get the last line of the OTA log
-      tmp = current_line
-      for line in parsed_log[current_line: ]:
-        if line == '\n':
-          last_line_of_individual_log = tmp
-          break
-        tmp += 1
-      log.info(parsed_log[start_of_individual_log + 1 : last_line_of_individual_log])
-      instances_of_log.append(parsed_log[start_of_individual_log + 1 : last_line_of_individual_log])
+  if isinstance(parsed_log, LogSet):
+    return get_ota_index(parsed_log).get_messages_containing(search_term)
 
-    current_line += 1
-  return instances_of_log
\ No newline at end of file
+  instances_of_log = []
+  for ota_message in iter_ota_messages(parsed_log):
+    for line in ota_message:
+      if search_term in line:
+        log.info(ota_message)
+        instances_of_log.append(ota_message)
+        break
+  return instances_of_log
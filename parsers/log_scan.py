@@ -0,0 +1,226 @@
+"""
+Byte level scanning of parsed logs through a memory map.
+
+The segments of a log are mapped instead of read, and a compiled bytes pattern is run over the mapped
+buffer. Only the lines that match are sliced out and decoded, and line numbers are counted in bounded
+chunks between matches, so memory use stays flat no matter how large the log is. The OTA message of each
+match is found the same way: the blank lines before it are counted in the buffer, and only the first line
+of the message is decoded, for its timestamp.
+
+To use:
+>>>for line_number, line in iter_matching_lines(parsed_log, get_terms_pattern(['rlf-Cause'])):
+>>>  ...
+>>>for line_number, message_index, timestamp, line in iter_matching_messages(parsed_log, pattern):
+>>>  ...
+>>>search_hits = search_log_for_terms(parsed_log, ['rlf-Cause', 'ue-CapabilityRequest'])
+"""
+from pathlib import Path
+import logging
+import mmap
+import re
+import os
+
+from parsers.log_stream import get_log_set
+from parsers.ota_index import MESSAGE_SEPARATORS, TIMESTAMP_PATTERN
+
+# set up the log_scan logger
+Path(os.getcwd() + '/logs/').mkdir(parents=True, exist_ok=True)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                    datefmt='%m-%d %H:%M',
+                    filename='./logs/tool_log.log',
+                    filemode='w')
+log = logging.getLogger('log_scan')
+
+
+LINE_COUNT_CHUNK_SIZE = 1024 * 1024
+# The blank lines before the first line of an OTA message, matched at the line break that ends the blank
+# line. The first line of a segment is preceded by the start of the buffer instead of a line break.
+MESSAGE_START_PATTERN = re.compile(rb'(?:\A|\n)\r?\n(?=[^\r\n])')
+
+
+class SearchHit:
+  """
+  A line of a log that contains a search term.
+
+  Attributes:
+    search_term: the term found
+    message_index: the position of the OTA message holding the line, starting at 0
+    line_number: the line number in the whole log, starting at 0
+    timestamp: the time of the OTA message as written in its first line, None if it has none
+    line: the line
+  """
+  def __init__(self, search_term, message_index, line_number, timestamp, line):
+    self.search_term = search_term
+    self.message_index = message_index
+    self.line_number = line_number
+    self.timestamp = timestamp
+    self.line = line
+
+  def __repr__(self):
+    return 'SearchHit({}, line {})'.format(self.search_term, self.line_number)
+
+
+def get_terms_pattern(search_terms, encoding='utf-8'):
+  """Compiles a bytes pattern that matches any of the search terms literally.
+
+  Args:
+    search_terms (iterable): The strings to search for
+    encoding (str): The encoding of the log
+  """
+  # longer terms first so a term that contains another is matched whole
+  search_terms = sorted(set(search_terms), key=len, reverse=True)
+  return re.compile(b'|'.join(re.escape(search_term.encode(encoding)) for search_term in search_terms))
+
+
+def count_lines(buffer, start, end):
+  """Counts the line breaks in buffer[start:end] without copying more than a chunk at a time."""
+  line_count = 0
+  for chunk_start in range(start, end, LINE_COUNT_CHUNK_SIZE):
+    line_count += buffer[chunk_start:min(chunk_start + LINE_COUNT_CHUNK_SIZE, end)].count(b'\n')
+  return line_count
+
+
+def ends_with_blank_line(buffer, size):
+  """Returns True if the last line of a buffer is a blank line, the end of an OTA message."""
+  if size <= 2 and buffer[:size] in MESSAGE_SEPARATORS:
+    return True
+  tail = buffer[max(0, size - 3):size]
+  return tail.endswith(b'\n\n') or tail.endswith(b'\n\r\n')
+
+
+def get_line_timestamp(buffer, line_start, encoding):
+  """Decodes the line starting at line_start and returns the time written in it, None if it has none."""
+  line_end = buffer.find(b'\n', line_start)
+  line_end = len(buffer) if line_end == -1 else line_end
+  timestamp = TIMESTAMP_PATTERN.search(buffer[line_start:line_end].decode(encoding, errors='replace'))
+  return timestamp.group() if timestamp else None
+
+
+def scan_log_set(log_set, pattern, find_messages):
+  """Yields every line of a LogSet that pattern matches, with the OTA message it is in if asked for.
+
+  The messages are numbered like an OtaMessageIndex: a message is a run of lines that are not blank, and
+  it carries on into the next segment unless the segment ends with a blank line. The blank lines are
+  counted in the mapped buffer between matches, and only the first line of a message that has a match
+  is decoded.
+
+  Yields:
+    line_number (int), message_index (int), timestamp (str), line (str): message_index and timestamp are
+      None unless find_messages
+  """
+  first_line = 0
+  message_count = 0
+  # the timestamp of the message still open at the end of the last segment
+  open_timestamp = None
+  at_message_start = True
+  for segment_path in log_set.segment_paths:
+    with open(segment_path, 'rb') as segment_file:
+      segment_size = os.fstat(segment_file.fileno()).st_size
+      if not segment_size:
+        continue
+      with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        line_number = first_line
+        counted_to = 0
+        position = 0
+        # the offset of the first line of the last message started in this segment
+        message_start = None
+        timestamp = open_timestamp
+        if find_messages and at_message_start and buffer[:1] not in (b'\r', b'\n'):
+          message_count += 1
+          message_start = 0
+        while True:
+          match = pattern.search(buffer, position)
+          if not match:
+            break
+          line_start = buffer.rfind(b'\n', 0, match.start()) + 1
+          line_end = buffer.find(b'\n', match.end())
+          line_end = segment_size if line_end == -1 else line_end + 1
+          line_number += count_lines(buffer, counted_to, line_start)
+          message_index = None
+          if find_messages:
+            # the blank lines right before the matched line are included, it can be the first of a message
+            for message_match in MESSAGE_START_PATTERN.finditer(buffer, counted_to, line_start + 1):
+              message_count += 1
+              message_start = message_match.end()
+              timestamp = None
+            if timestamp is None and message_start is not None:
+              timestamp = get_line_timestamp(buffer, message_start, log_set.encoding)
+            message_index = message_count - 1
+          counted_to = line_start
+          yield (line_number, message_index, timestamp,
+                 buffer[line_start:line_end].decode(log_set.encoding, errors='replace'))
+          position = line_end
+
+        line_number += count_lines(buffer, counted_to, segment_size)
+        # a segment that does not end with a line break still has a last line
+        if buffer[segment_size - 1:segment_size] != b'\n':
+          line_number += 1
+        first_line = line_number
+        if find_messages:
+          for message_match in MESSAGE_START_PATTERN.finditer(buffer, counted_to, segment_size):
+            message_count += 1
+            message_start = message_match.end()
+            timestamp = None
+          at_message_start = ends_with_blank_line(buffer, segment_size)
+          if at_message_start:
+            open_timestamp = None
+          elif message_start is not None:
+            open_timestamp = timestamp if timestamp is not None else get_line_timestamp(
+                buffer, message_start, log_set.encoding)
+
+
+def iter_matching_lines(parsed_log, pattern):
+  """Yields every line of a parsed log that pattern matches, once per line.
+
+  Args:
+    parsed_log (LogSet or str or Path): The parsed log to scan
+    pattern (re.Pattern): A compiled bytes pattern, see get_terms_pattern()
+  Yields:
+    line_number (int), line (str): the line number in the whole log starting at 0, and the decoded line
+  """
+  for line_number, _, _, line in scan_log_set(get_log_set(parsed_log), pattern, find_messages=False):
+    yield line_number, line
+
+
+def iter_matching_messages(parsed_log, pattern):
+  """Yields every line of a parsed log that pattern matches, with the OTA message it is in.
+
+  Unlike get_ota_index(), nothing is kept for the lines that do not match, so memory use stays flat.
+
+  Args:
+    parsed_log (LogSet or str or Path): The parsed log to scan
+    pattern (re.Pattern): A compiled bytes pattern, see get_terms_pattern()
+  Yields:
+    line_number (int), message_index (int), timestamp (str), line (str): the line number in the whole log
+      starting at 0, the position of its OTA message starting at 0, the time written in the first line of
+      the message (None if it has none), and the decoded line
+  """
+  return scan_log_set(get_log_set(parsed_log), pattern, find_messages=True)
+
+
+def search_log_for_terms(parsed_log, search_terms):
+  """Finds every line containing any of the search terms in a single pass over a parsed log.
+
+  Args:
+    parsed_log (LogSet or Path): A parsed log, or the Path of one
+    search_terms (iterable): The strings to search for, matched as substrings of the lines
+  Returns:
+    search_hits (dict): each search term to a list of its SearchHits, in log order. Terms that are not
+      found have an empty list
+  """
+  log_set = get_log_set(parsed_log)
+  search_terms = list(dict.fromkeys(search_terms))
+  search_hits = {search_term: [] for search_term in search_terms}
+  if not search_terms:
+    return search_hits
+
+  terms_pattern = get_terms_pattern(search_terms, log_set.encoding)
+  for line_number, message_index, timestamp, line in iter_matching_messages(log_set, terms_pattern):
+    # the pattern finds one term per position, so check every term to find terms inside other terms
+    line_terms = [search_term for search_term in search_terms if search_term in line]
+    for search_term in line_terms:
+      search_hits[search_term].append(SearchHit(search_term, message_index, line_number, timestamp, line))
+
+  log.info('searched {} for {} terms'.format(str(log_set), len(search_terms)))
+  return search_hits
@@ -0,0 +1,262 @@
+"""
+Lazy, constant memory access to parsed (exported) log files.
+
+The per-segment exports of a log are presented as one log by a LogSet, so they never need to be
+concatenated into a single file.
+
+To use:
+>>>parsed_log = LogSet([Path('segment_0001.txt'), Path('segment_0002.txt')])
+>>>for line in parsed_log:
+>>>  ...
+>>>for ota_message in parsed_log.get_ota_messages():
+>>>  ...
+>>>segment_index, line_in_segment = parsed_log.get_segment_for_line(250000)
+"""
+from pathlib import Path
+import bisect
+import shutil
+import os
+
+LINE_COUNT_CHUNK_SIZE = 1024 * 1024
+
+
+class LogSet:
+  """
+  The ordered per-segment exports of a log presented as one seekable parsed log.
+
+  Iterating a LogSet reads the segments one line at a time, in order, every time it is iterated. The
+  segments can also be read as a single byte stream with seek(), tell() and read(), and a per-segment
+  offset table allows jumping straight to the segment holding a byte offset or a line.
+  """
+  def __init__(self, segment_paths, encoding='utf-8'):
+    """
+    Args:
+      segment_paths (list): Paths of the exported segments, in segment order
+      encoding (str): The encoding of the exported segments
+    """
+    self.segment_paths = [Path(segment_path) for segment_path in segment_paths]
+    self.encoding = encoding
+    # segment_offsets[i] is the byte offset of the start of segment i in the logical stream, the last
+    # entry is the size of the whole stream
+    self.segment_offsets = [0]
+    for segment_path in self.segment_paths:
+      self.segment_offsets.append(self.segment_offsets[-1] + os.path.getsize(segment_path))
+    self.segment_line_offsets = None
+    self.position = 0
+    self.open_segment_index = None
+    self.open_segment = None
+
+  def __iter__(self):
+    for segment_path in self.segment_paths:
+      with open(segment_path, 'r', encoding=self.encoding) as segment_file:
+        for line in segment_file:
+          yield line
+
+  def __repr__(self):
+    return 'LogSet({} segments, {} bytes)'.format(len(self.segment_paths), self.get_size())
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def get_ota_messages(self):
+    """Returns a generator of the blank-line delimited OTA messages in the log."""
+    return iter_ota_messages(self)
+
+  def get_size(self):
+    """Returns the size in bytes of all of the segments together."""
+    return self.segment_offsets[-1]
+
+  def get_segment_for_offset(self, offset):
+    """Gets the segment that holds a byte offset of the logical stream.
+
+    Args:
+      offset (int): A byte offset in the logical stream
+    Returns:
+      segment_index (int), offset_in_segment (int)
+    """
+    if offset < 0 or offset >= self.get_size():
+      raise IndexError('offset {} is outside of the log set'.format(offset))
+    segment_index = bisect.bisect_right(self.segment_offsets, offset) - 1
+    return segment_index, offset - self.segment_offsets[segment_index]
+
+  def get_segment_line_offsets(self):
+    """Returns the line number each segment starts at. The last entry is the number of lines."""
+    if self.segment_line_offsets is None:
+      segment_line_offsets = [0]
+      for segment_path in self.segment_paths:
+        line_count = 0
+        last_chunk = b''
+        with open(segment_path, 'rb') as segment_file:
+          for chunk in iter(lambda: segment_file.read(LINE_COUNT_CHUNK_SIZE), b''):
+            line_count += chunk.count(b'\n')
+            last_chunk = chunk
+        # a segment that does not end with a line break still has a last line
+        if last_chunk and not last_chunk.endswith(b'\n'):
+          line_count += 1
+        segment_line_offsets.append(segment_line_offsets[-1] + line_count)
+      self.segment_line_offsets = segment_line_offsets
+    return self.segment_line_offsets
+
+  def get_segment_for_line(self, line_number):
+    """Gets the segment that holds a line of the log.
+
+    Args:
+      line_number (int): The line number in the whole log, starting at 0
+    Returns:
+      segment_index (int), line_in_segment (int)
+    """
+    segment_line_offsets = self.get_segment_line_offsets()
+    if line_number < 0 or line_number >= segment_line_offsets[-1]:
+      raise IndexError('line {} is outside of the log set'.format(line_number))
+    segment_index = bisect.bisect_right(segment_line_offsets, line_number) - 1
+    return segment_index, line_number - segment_line_offsets[segment_index]
+
+  def iter_lines_from(self, line_number):
+    """Yields the lines of the log starting at line_number, only reading from the segment it is in.
+
+    Args:
+      line_number (int): The line number in the whole log, starting at 0
+    """
+    segment_index, line_in_segment = self.get_segment_for_line(line_number)
+    for segment_path in self.segment_paths[segment_index:]:
+      with open(segment_path, 'r', encoding=self.encoding) as segment_file:
+        for line in segment_file:
+          if line_in_segment:
+            line_in_segment -= 1
+            continue
+          yield line
+
+  def seek(self, offset, whence=os.SEEK_SET):
+    """Moves the position in the logical byte stream, like file.seek()."""
+    if whence == os.SEEK_CUR:
+      offset = self.position + offset
+    elif whence == os.SEEK_END:
+      offset = self.get_size() + offset
+    if offset < 0:
+      raise ValueError('negative seek position {}'.format(offset))
+    self.position = offset
+    return self.position
+
+  def tell(self):
+    """Returns the position in the logical byte stream."""
+    return self.position
+
+  def read(self, size=-1):
+    """Reads bytes from the logical byte stream, crossing segment boundaries as needed.
+
+    Args:
+      size (int): The number of bytes to read. If it is negative the rest of the log set is read
+    Returns:
+      data (bytes): the bytes read, empty at the end of the log set
+    """
+    if size is None or size < 0:
+      size = self.get_size() - self.position
+    data = []
+    while size > 0 and self.position < self.get_size():
+      segment_index, offset_in_segment = self.get_segment_for_offset(self.position)
+      if segment_index != self.open_segment_index:
+        self.close()
+        self.open_segment = open(self.segment_paths[segment_index], 'rb')
+        self.open_segment_index = segment_index
+      self.open_segment.seek(offset_in_segment)
+      chunk = self.open_segment.read(min(size, self.segment_offsets[segment_index + 1] - self.position))
+      if not chunk:
+        break
+      data.append(chunk)
+      self.position += len(chunk)
+      size -= len(chunk)
+    return b''.join(data)
+
+  def read_at(self, offset, size):
+    """Reads bytes from an offset of the logical byte stream without using the read() position.
+
+    Each segment read from is opened and closed again, so this can be called from several threads and
+    leaves no file open.
+
+    Args:
+      offset (int): The byte offset in the logical stream to read from
+      size (int): The number of bytes to read
+    Returns:
+      data (bytes): the bytes read, fewer than size at the end of the log set
+    """
+    end = min(offset + size, self.get_size())
+    data = []
+    while offset < end:
+      segment_index, offset_in_segment = self.get_segment_for_offset(offset)
+      with open(self.segment_paths[segment_index], 'rb') as segment_file:
+        segment_file.seek(offset_in_segment)
+        chunk = segment_file.read(min(end, self.segment_offsets[segment_index + 1]) - offset)
+      if not chunk:
+        break
+      data.append(chunk)
+      offset += len(chunk)
+    return b''.join(data)
+
+  def close(self):
+    """Closes the segment opened by read()."""
+    if self.open_segment:
+      self.open_segment.close()
+    self.open_segment = None
+    self.open_segment_index = None
+
+  def write_to(self, output_file):
+    """Writes the segments into a single file. Only needed when a concatenated copy is asked for.
+
+    Args:
+      output_file (str or Path): The file to write
+    """
+    with open(output_file, 'wb') as output:
+      for segment_path in self.segment_paths:
+        with open(segment_path, 'rb') as segment_file:
+          shutil.copyfileobj(segment_file, output)
+    return output_file
+
+
+class ParsedLog(LogSet):
+  """A single parsed log file, read one line at a time every time it is iterated."""
+  def __init__(self, log_path, encoding='utf-8'):
+    """
+    Args:
+      log_path (Path): The path of the parsed .txt log
+      encoding (str): The encoding of the parsed log
+    """
+    super().__init__([log_path], encoding)
+    self.log_path = Path(log_path)
+
+  def __repr__(self):
+    return 'ParsedLog({})'.format(str(self.log_path))
+
+
+def get_log_set(parsed_log):
+  """Returns the parsed log as a LogSet.
+
+  Args:
+    parsed_log (LogSet or str or Path): A LogSet, or the path of a single parsed log file
+  """
+  if isinstance(parsed_log, LogSet):
+    return parsed_log
+  return ParsedLog(parsed_log)
+
+
+def iter_ota_messages(log_lines):
+  """Yields the OTA messages of a parsed log one at a time.
+
+  Args:
+    log_lines (iterable): The lines of a parsed log, a list or a LogSet
+  Yields:
+    ota_message (list): the lines of one OTA message, without the blank lines around it
+  """
+  ota_message = []
+  for line in log_lines:
+    if line == '\n':
+      if ota_message:
+        yield ota_message
+      ota_message = []
+    else:
+      ota_message.append(line)
+
+  if ota_message:
+    yield ota_message
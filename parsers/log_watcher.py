@@ -0,0 +1,205 @@
+"""
+A watch mode for a log folder that is still being written, e.g. during a live drive test.
+
+The folder is polled for .sdm segments. Once a segment is complete (a newer segment has started, or it
+has not changed for a while) only that segment is exported and parsed, and its metrics and failure
+events are appended to the tables parsed so far. The metrics are also kept in the log's MetricsStore, where
+only the rows of the new segments are written after the first poll.
+
+To use:
+>>>watcher = LogWatcher(Path('path to log folder'), on_update=print_kpis)
+>>>watcher.run()
+"""
+from pathlib import Path
+from sys import platform
+import logging
+import time
+import os
+
+from parsers.failure_events import DEFAULT_FAILURE_PATTERNS, FailureEventScanner
+from parsers.lassen_parser import (FILTER, LassenParser, get_log_segments, rename_folder_before_parsing)
+from parsers.log_stream import ParsedLog
+from parsers.metrics_store import MetricsStore
+from parsers.metrics_table import METRIC_CATEGORIES, MetricsTable, parse_metrics_table
+from parsers.ota_index import get_ota_index
+
+# set up the log_watcher logger
+Path(os.getcwd() + '/logs/').mkdir(parents=True, exist_ok=True)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                    datefmt='%m-%d %H:%M',
+                    filename='./logs/tool_log.log',
+                    filemode='w')
+log = logging.getLogger('log_watcher')
+
+
+POLL_INTERVAL = 2.0
+# The newest segment is complete once it has not changed for this many seconds
+SEGMENT_SETTLE_TIME = 10.0
+
+
+class LogWatcher:
+  """
+  Exports and parses the segments of a log folder as they are completed.
+
+  Attributes:
+    metrics_table: the metrics of every processed segment
+    failure_events: the FailureEvents of every processed segment, with line numbers and message indexes
+      counted across the segments
+    processed_segments: the segments exported and parsed so far, in order
+  """
+  def __init__(self, log_folder, on_update=None, poll_interval=POLL_INTERVAL,
+               settle_time=SEGMENT_SETTLE_TIME, categories=METRIC_CATEGORIES,
+               failure_patterns=DEFAULT_FAILURE_PATTERNS, lassen_parser=None):
+    """
+    Args:
+      log_folder (Path): The folder the .sdm segments are written to
+      on_update (callable): Called with the LogWatcher and the list of newly processed segments after
+        every poll that processed a segment
+      poll_interval (float): Seconds between polls of the folder
+      settle_time (float): Seconds the newest segment has to be unchanged to count as complete
+      categories (iterable): The metric categories to collect
+      failure_patterns (iterable): The FailurePatterns to look for
+      lassen_parser (LassenParser): The parser used for the DMConsole exports
+    """
+    self.log_folder = Path(rename_folder_before_parsing(log_folder))
+    self.on_update = on_update
+    self.poll_interval = poll_interval
+    self.settle_time = settle_time
+    self.categories = tuple(categories)
+    self.lassen_parser = lassen_parser or LassenParser()
+    self.failure_event_scanner = FailureEventScanner(failure_patterns)
+
+    self.metrics_table = MetricsTable({})
+    self.failure_events = []
+    self.processed_segments = []
+    self.segment_states = {}
+    self.line_count = 0
+    self.message_count = 0
+    self.stored = False
+    self.running = False
+
+  def __repr__(self):
+    return 'LogWatcher({}, {} segments processed)'.format(str(self.log_folder), len(self.processed_segments))
+
+  def get_segments(self):
+    """Returns the .sdm segments currently in the folder, in segment order."""
+    segments = get_log_segments(self.log_folder / 'segment.sdm')
+    if platform != 'win32' and any('(' in segment.name for segment in segments):
+      self.lassen_parser.modify_file_for_mac_os_unidm(segments[0])
+      segments = get_log_segments(self.log_folder / 'segment.sdm')
+    return segments
+
+  def get_completed_segments(self):
+    """Gets the segments that are complete and not yet processed.
+
+    A segment is complete once a newer segment exists, or once its size and modification time have not
+    changed for settle_time seconds.
+    """
+    now = time.monotonic()
+    segments = self.get_segments()
+    completed_segments = []
+    for segment_number, segment in enumerate(segments):
+      if segment in self.processed_segments:
+        continue
+      stat = segment.stat()
+      state = (stat.st_size, stat.st_mtime_ns)
+      last_state, unchanged_since = self.segment_states.get(segment, (None, now))
+      if state != last_state:
+        unchanged_since = now
+      self.segment_states[segment] = (state, unchanged_since)
+
+      is_newest = segment_number == len(segments) - 1
+      if not is_newest or now - unchanged_since >= self.settle_time:
+        completed_segments.append(segment)
+      else:
+        break
+    return completed_segments
+
+  def process_segment(self, segment):
+    """Exports and parses one segment and appends its metrics and failure events."""
+    last_timestamp = self.metrics_table.get_last_timestamp()
+    if last_timestamp is None:
+      start_time = self.lassen_parser.get_log_start_time(segment)
+    else:
+      # a later segment is placed on the day of the last metric so far, which is a datetime64
+      start_time = last_timestamp.astype('datetime64[us]').item()
+
+    metrics_export = self.lassen_parser.export_segment(segment, 'metricexport', FILTER)
+    if metrics_export:
+      segment_metrics = parse_metrics_table(ParsedLog(metrics_export), self.categories, start_time)
+      self.lassen_parser.release_export(metrics_export)
+      # only the start time of the log is the table's start time, not the time a later segment is placed on
+      if self.metrics_table.start_time is None and last_timestamp is None:
+        self.metrics_table.start_time = segment_metrics.start_time
+      self.metrics_table.append(segment_metrics)
+
+    signalling_export = self.lassen_parser.export_segment(segment, 'signalexport')
+    if signalling_export:
+      signalling_log = ParsedLog(signalling_export)
+      for failure_event in self.failure_event_scanner.scan(signalling_log):
+        failure_event.line_number += self.line_count
+        failure_event.message_index += self.message_count
+        self.failure_events.append(failure_event)
+      self.line_count += signalling_log.get_segment_line_offsets()[-1]
+      self.message_count += len(get_ota_index(signalling_log, index_terms=False))
+      self.lassen_parser.release_export(signalling_export)
+
+    self.processed_segments.append(segment)
+    log.info('processed segment {}'.format(str(segment)))
+
+  def poll(self):
+    """Processes the segments completed since the last poll.
+
+    Returns:
+      new_segments (list): the segments processed
+    """
+    new_segments = self.get_completed_segments()
+    for segment in new_segments:
+      self.process_segment(segment)
+
+    if new_segments:
+      if self.lassen_parser.export_cache:
+        self.lassen_parser.export_cache.save_index()
+      metrics_store = MetricsStore(self.log_folder / new_segments[-1].name)
+      # the first poll replaces whatever an earlier run stored, later polls only write the new rows
+      if self.stored:
+        metrics_store.append(self.metrics_table, self.categories, self.processed_segments)
+      else:
+        metrics_store.save(self.metrics_table, self.categories, self.processed_segments)
+        self.stored = True
+      if self.on_update:
+        self.on_update(self, new_segments)
+    return new_segments
+
+  def run(self, idle_timeout=None):
+    """Polls the folder until stop() is called, the user presses ctrl+c or no segment is completed for
+    idle_timeout seconds.
+
+    Args:
+      idle_timeout (float): Seconds without a new segment before the watch stops. None watches forever
+    """
+    self.running = True
+    last_update = time.monotonic()
+    print('Watching {} for new segments. Press ctrl+c to stop.'.format(str(self.log_folder)))
+    try:
+      while self.running:
+        if self.poll():
+          last_update = time.monotonic()
+        elif idle_timeout is not None and time.monotonic() - last_update > idle_timeout:
+          break
+        time.sleep(self.poll_interval)
+    except KeyboardInterrupt:
+      pass
+    self.running = False
+    return self.metrics_table
+
+  def stop(self):
+    """Stops run() after the current poll."""
+    self.running = False
+
+  def get_signalling_log(self):
+    """Returns the signalling exports of the processed segments as one LogSet. Without an export cache they
+    are concatenated into directory_parsed.txt in the log folder."""
+    exported_logs = [self.lassen_parser.export_segment(segment, 'signalexport') for segment in self.processed_segments]
+    return self.lassen_parser.collect_exports(exported_logs, self.log_folder / 'directory_parsed.txt')
@@ -0,0 +1,382 @@
+"""
+A columnar on-disk store of parsed metrics tables, kept in the folder of the log they were parsed from.
+
+Each category of a MetricsTable is written as one .npy file per column. Numeric columns are stored as
+they are, text columns are dictionary encoded as int32 codes and a small array of their distinct values.
+A manifest records the segments the table was parsed from, so a stored table is only reused while the
+log is unchanged. Loading memory-maps the columns, so it does not read the log or the columns up front.
+The rows of newer segments can be appended to the end of each column file, see MetricsStore.append().
+
+To use:
+>>>metrics_table = get_metrics_table_from_sdm_file(Path('path to .sdm file'))
+>>>time, dltp = metrics_table['e.l1_ca'].get_metric('dltp')
+"""
+from collections.abc import Mapping
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import logging
+import shutil
+import json
+import io
+import os
+
+from parsers.lassen_parser import (FILTER, get_log_segments, get_log_start_time,
+                                   get_metrics_log_from_sdm_file, rename_folder_before_parsing)
+from parsers.metrics_table import METRIC_CATEGORIES, MetricCategory, MetricsTable, parse_metrics_table
+
+# set up the metrics_store logger
+Path(os.getcwd() + '/logs/').mkdir(parents=True, exist_ok=True)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                    datefmt='%m-%d %H:%M',
+                    filename='./logs/tool_log.log',
+                    filemode='w')
+log = logging.getLogger('metrics_store')
+
+
+METRICS_STORE_FOLDER = 'metrics_store'
+MANIFEST_NAME = 'manifest.json'
+# Bump when the layout of the store changes so older stores are rebuilt
+STORE_VERSION = 1
+
+
+class StoredColumns(Mapping):
+  """The columns of a stored category, memory-mapped the first time each one is read."""
+  def __init__(self, category_location, column_info, rows=None):
+    """
+    Args:
+      category_location (Path): The folder the category's .npy files are in
+      column_info (dict): key to the manifest entry of its column
+      rows (int): The rows the manifest records. Rows after them are from an append that did not finish
+    """
+    self.category_location = category_location
+    self.column_info = column_info
+    self.rows = rows
+    self.loaded_columns = {}
+
+  def __getitem__(self, key):
+    if key not in self.loaded_columns:
+      info = self.column_info[key]
+      column = np.load(self.category_location / info['file'], mmap_mode='r')[:self.rows]
+      if info['encoding'] == 'dictionary':
+        values = np.load(self.category_location / info['values'])
+        column = values[column]
+      self.loaded_columns[key] = column
+    return self.loaded_columns[key]
+
+  def __iter__(self):
+    return iter(self.column_info)
+
+  def __len__(self):
+    return len(self.column_info)
+
+
+def write_column(category_location, column_number, column):
+  """Writes one column of a category, dictionary encoding it if it is not numeric.
+
+  Returns:
+    column_info (dict): the manifest entry of the column
+  """
+  column_file = 'column_{}.npy'.format(column_number)
+  column = np.asarray(column)
+  if column.dtype.kind == 'f':
+    np.save(category_location / column_file, column)
+    return {'file': column_file, 'encoding': 'plain'}
+  values, codes = np.unique(column, return_inverse=True)
+  values_file = 'values_{}.npy'.format(column_number)
+  np.save(category_location / column_file, codes.astype(np.int32))
+  np.save(category_location / values_file, values)
+  return {'file': column_file, 'encoding': 'dictionary', 'values': values_file}
+
+
+def write_category(category_location, category):
+  """Writes the time strings, timestamps and columns of a MetricCategory to a new folder.
+
+  Returns:
+    category_info (dict): the manifest entry of the category, without its folder
+  """
+  category_location.mkdir()
+  np.save(category_location / 'time_strings.npy', np.asarray(category.time_strings))
+  np.save(category_location / 'timestamps.npy', np.asarray(category.timestamps, dtype=np.int64))
+  column_info = {}
+  for column_number, (key, column) in enumerate(category.columns.items()):
+    column_info[key] = write_column(category_location, column_number, column)
+  return {
+      'rows': len(category),
+      'columns': column_info,
+      # json keys are strings, so the positions are stored as pairs
+      'key_positions': sorted(category.key_positions.items()),
+  }
+
+
+def get_next_column_number(column_info):
+  """Returns a column number no column of a stored category uses."""
+  return max([int(info['file'][len('column_'):-len('.npy')]) for info in column_info.values()], default=-1) + 1
+
+
+def get_npy_header(version, dtype, rows):
+  """Returns the bytes of a .npy header of a 1-D array in the given format version."""
+  header = io.BytesIO()
+  header_info = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (rows,)}
+  if version == (1, 0):
+    np.lib.format.write_array_header_1_0(header, header_info)
+  else:
+    np.lib.format.write_array_header_2_0(header, header_info)
+  return header.getvalue()
+
+
+def append_to_npy(npy_path, rows, array):
+  """Writes an array into a 1-D .npy file after its first rows, in place when possible.
+
+  Anything after the first rows, e.g. from an append that did not finish, is overwritten. The file is only
+  rewritten whole if the rows do not fit its dtype (e.g. longer strings) or its header cannot grow in place.
+
+  Args:
+    npy_path (Path): The .npy file
+    rows (int): The rows of the file to keep
+    array (np.ndarray): The rows to write after them
+  """
+  array = np.asarray(array)
+  with open(npy_path, 'r+b') as npy_file:
+    version = np.lib.format.read_magic(npy_file)
+    if version == (1, 0):
+      shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(npy_file)
+    else:
+      shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(npy_file)
+    data_start = npy_file.tell()
+    header = get_npy_header(version, dtype, rows + len(array))
+    if (len(shape) == 1 and rows <= shape[0] and not dtype.hasobject and len(header) == data_start and
+        np.result_type(dtype, array.dtype) == dtype):
+      npy_file.seek(data_start + rows * dtype.itemsize)
+      npy_file.write(array.astype(dtype).tobytes())
+      npy_file.truncate()
+      npy_file.seek(0)
+      npy_file.write(header)
+      return
+
+  tmp_path = npy_path.with_name(npy_path.name + '.tmp')
+  with open(tmp_path, 'wb') as tmp_file:
+    np.save(tmp_file, np.concatenate((np.load(npy_path, mmap_mode='r')[:rows], array)))
+  os.replace(tmp_path, npy_path)
+
+
+class MetricsStore:
+  """
+  The stored MetricsTable of one log. A metrics export covers every segment in the folder of the log,
+  so the table is stored in a folder inside the log folder.
+  """
+  def __init__(self, log_file, store_location=None):
+    """
+    Args:
+      log_file (Path): The .sdm file of the log
+      store_location (Path): The folder to store the table in. Defaults to a folder in the log folder
+    """
+    self.log_file = Path(log_file)
+    if store_location is None:
+      store_location = self.log_file.parent / METRICS_STORE_FOLDER
+    self.store_location = Path(store_location)
+
+  def __repr__(self):
+    return 'MetricsStore({})'.format(str(self.store_location))
+
+  def get_fingerprint(self, categories=METRIC_CATEGORIES, log_files=None):
+    """Returns what the stored table depends on: the size and modification time of every segment and the
+    filter, and the categories collected.
+
+    Segment names are left out because they are renamed for DMConsole on mac/linux.
+
+    Args:
+      categories (iterable): The categories collected
+      log_files (list): The segments the table was parsed from. Defaults to every segment of the log
+    """
+    if log_files is None:
+      log_files = get_log_segments(self.log_file)
+    segments = [[file.stat().st_size, file.stat().st_mtime_ns] for file in sorted(log_files)]
+    filter_stat = FILTER.stat() if FILTER.is_file() else None
+    return {
+        'version': STORE_VERSION,
+        'segments': segments,
+        'filter': [filter_stat.st_size, filter_stat.st_mtime_ns] if filter_stat else None,
+        'categories': list(categories),
+    }
+
+  def get_manifest(self):
+    """Returns the manifest of the stored table, or None if there is no readable store."""
+    manifest_file = self.store_location / MANIFEST_NAME
+    if not manifest_file.is_file():
+      return None
+    try:
+      with open(manifest_file, 'r', encoding='utf-8') as manifest:
+        return json.load(manifest)
+    except ValueError:
+      log.info('metrics store manifest {} is corrupt'.format(str(manifest_file)))
+      return None
+
+  def is_current(self, categories=METRIC_CATEGORIES):
+    """Returns True if the stored table was parsed from the log as it is now."""
+    manifest = self.get_manifest()
+    return bool(manifest) and manifest['fingerprint'] == self.get_fingerprint(categories)
+
+  def save(self, metrics_table, categories=METRIC_CATEGORIES, log_files=None):
+    """Writes a MetricsTable to the store, replacing anything stored before.
+
+    Args:
+      metrics_table (MetricsTable): The parsed metrics of the log
+      categories (iterable): The categories the table was parsed with
+      log_files (list): The segments the table was parsed from, if it is not every segment of the log.
+        The stored table is then only current once those are all the segments there are
+    Returns:
+      store_location (Path): the folder the table was written to
+    """
+    tmp_location = self.store_location.with_name(self.store_location.name + '.tmp')
+    shutil.rmtree(tmp_location, ignore_errors=True)
+    tmp_location.mkdir(parents=True)
+
+    manifest_categories = {}
+    for category_number, (name, category) in enumerate(metrics_table.categories.items()):
+      manifest_categories[name] = dict(write_category(tmp_location / str(category_number), category),
+                                       folder=str(category_number))
+
+    self.write_manifest(tmp_location, metrics_table, manifest_categories, categories, log_files)
+    shutil.rmtree(self.store_location, ignore_errors=True)
+    os.replace(tmp_location, self.store_location)
+    log.info('stored {} in {}'.format(metrics_table, str(self.store_location)))
+    return self.store_location
+
+  def write_manifest(self, location, metrics_table, manifest_categories, categories, log_files):
+    """Writes the manifest of a stored table, replacing the last one in one step."""
+    start_time = metrics_table.start_time
+    manifest = {
+        'fingerprint': self.get_fingerprint(categories, log_files),
+        'start_time': start_time.isoformat() if start_time else None,
+        'categories': manifest_categories,
+    }
+    tmp_file = location / (MANIFEST_NAME + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as manifest_file:
+      json.dump(manifest, manifest_file, indent=1)
+    os.replace(tmp_file, location / MANIFEST_NAME)
+
+  def append(self, metrics_table, categories=METRIC_CATEGORIES, log_files=None):
+    """Appends the rows of a MetricsTable that are not stored yet, e.g. the metrics of newer segments.
+
+    The table has to start with the rows that are stored, as a table that rows were appended to does. Only
+    the new rows are written, at the end of each column file, and the manifest is replaced last, so an
+    append that does not finish leaves the stored table as it was. A column that changes from numbers to
+    text, and a column that is new, is written whole. If nothing is stored the table is saved.
+
+    Args:
+      metrics_table (MetricsTable): The parsed metrics of the log, the stored rows and the new ones
+      categories (iterable): The categories the table was parsed with
+      log_files (list): The segments the table was parsed from, see save()
+    Returns:
+      store_location (Path): the folder the table was written to
+    """
+    manifest = self.get_manifest()
+    manifest_categories = manifest['categories'] if manifest else {}
+    if not manifest or any(len(metrics_table[name]) < info['rows'] for name, info in manifest_categories.items()):
+      return self.save(metrics_table, categories, log_files)
+
+    replaced_files = []
+    for name, category in metrics_table.categories.items():
+      info = manifest_categories.get(name)
+      if info is None:
+        folder = str(max([int(info['folder']) for info in manifest_categories.values()], default=-1) + 1)
+        shutil.rmtree(self.store_location / folder, ignore_errors=True)
+        manifest_categories[name] = dict(write_category(self.store_location / folder, category), folder=folder)
+        continue
+
+      rows = info['rows']
+      category_location = self.store_location / info['folder']
+      append_to_npy(category_location / 'time_strings.npy', rows, np.asarray(category.time_strings[rows:]))
+      append_to_npy(category_location / 'timestamps.npy', rows,
+                    np.asarray(category.timestamps[rows:], dtype=np.int64))
+      for key, column in category.columns.items():
+        column = np.asarray(column)
+        column_info = info['columns'].get(key)
+        if column_info is None:
+          info['columns'][key] = write_column(category_location, get_next_column_number(info['columns']), column)
+        elif column_info['encoding'] == 'plain' and column.dtype.kind == 'f':
+          append_to_npy(category_location / column_info['file'], rows, column[rows:])
+        elif column_info['encoding'] == 'dictionary' and column.dtype.kind != 'f':
+          self.append_dictionary_column(category_location, column_info, rows, column[rows:])
+        else:
+          # written to new files, the stored ones stay as the manifest says until it is replaced
+          replaced_files.extend(category_location / column_info[file_key] for file_key in ('file', 'values')
+                                if file_key in column_info)
+          info['columns'][key] = write_column(category_location, get_next_column_number(info['columns']), column)
+      info['rows'] = len(category)
+      info['key_positions'] = sorted(category.key_positions.items())
+
+    self.write_manifest(self.store_location, metrics_table, manifest_categories, categories, log_files)
+    for replaced_file in replaced_files:
+      replaced_file.unlink()
+    log.info('appended to {} in {}'.format(metrics_table, str(self.store_location)))
+    return self.store_location
+
+  @staticmethod
+  def append_dictionary_column(category_location, column_info, rows, new_rows):
+    """Appends text rows to a dictionary encoded column, adding the values it does not have yet."""
+    values = np.load(category_location / column_info['values'])
+    new_values, new_codes = np.unique(new_rows, return_inverse=True)
+    value_codes = {value: code for code, value in enumerate(values.tolist())}
+    added_values = [value for value in new_values.tolist() if value not in value_codes]
+    if added_values:
+      # the values are not kept sorted, codes already stored have to keep pointing at the same value
+      values = np.concatenate((values, np.asarray(added_values)))
+      value_codes.update((value, code) for code, value in enumerate(values.tolist()))
+      tmp_file = category_location / (column_info['values'] + '.tmp')
+      with open(tmp_file, 'wb') as values_file:
+        np.save(values_file, values)
+      os.replace(tmp_file, category_location / column_info['values'])
+    codes = np.asarray([value_codes[value] for value in new_values.tolist()], dtype=np.int32)
+    append_to_npy(category_location / column_info['file'], rows, codes[new_codes])
+
+  def load(self):
+    """Memory-maps the stored MetricsTable.
+
+    Returns:
+      metrics_table (MetricsTable): the stored table, or None if nothing is stored
+    """
+    manifest = self.get_manifest()
+    if not manifest:
+      return None
+
+    categories = {}
+    for name, info in manifest['categories'].items():
+      category_location = self.store_location / info['folder']
+      rows = info['rows']
+      categories[name] = MetricCategory(name,
+                                        np.load(category_location / 'time_strings.npy', mmap_mode='r')[:rows],
+                                        np.load(category_location / 'timestamps.npy', mmap_mode='r')[:rows],
+                                        StoredColumns(category_location, info['columns'], rows),
+                                        {position: key for position, key in info['key_positions']})
+
+    start_time = manifest['start_time']
+    start_time = datetime.fromisoformat(start_time) if start_time else None
+    log.info('loaded metrics store {}'.format(str(self.store_location)))
+    return MetricsTable(categories, start_time)
+
+
+def get_metrics_table_from_sdm_file(log_file, overwrite=False, categories=METRIC_CATEGORIES):
+  """Gets the MetricsTable of a sdm file, from the metrics store next to it if the log has not changed.
+
+  Args:
+    log_file (Path): A Path object of the file to parse
+    overwrite (bool): If True the log is exported and parsed again even if it is stored
+    categories (iterable): The categories to collect
+  Returns:
+    metrics_table (MetricsTable)
+  """
+  # the log folder is renamed before parsing, so the store has to be found in the renamed folder
+  log_file = Path(rename_folder_before_parsing(Path(log_file).parent)) / Path(log_file).name
+  metrics_store = MetricsStore(log_file)
+  if not overwrite and metrics_store.is_current(categories):
+    metrics_table = metrics_store.load()
+    if metrics_table is not None:
+      return metrics_table
+
+  parsed_log = get_metrics_log_from_sdm_file(log_file, overwrite, stream=True)
+  metrics_table = parse_metrics_table(parsed_log, categories, get_log_start_time(log_file))
+  metrics_store.save(metrics_table, categories)
+  return metrics_table
@@ -0,0 +1,412 @@
+"""
+A columnar, single pass parser of DMConsole metricexport output.
+
+Every metric line is split once. The key:value tokens of each category (e.l1_ca, c.data, ...) are
+gathered into typed NumPy columns, so plots and statistics read ready-made arrays instead of
+re-splitting the log for every metric.
+
+To use:
+>>>metrics_table = get_metrics_table(get_metrics_log_from_sdm_file(log_file, False, stream=True))
+>>>time, dltp = metrics_table['e.l1_ca'].get_metric('dltp')
+
+Times are stored as int64 epoch nanoseconds. Pass the time logging started (from the infoexport) as
+start_time to place them on the right day, otherwise they are placed on 1970-01-01.
+"""
+from pathlib import Path
+import numpy as np
+import logging
+import re
+import os
+
+# set up the metrics_table logger
+Path(os.getcwd() + '/logs/').mkdir(parents=True, exist_ok=True)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                    datefmt='%m-%d %H:%M',
+                    filename='./logs/tool_log.log',
+                    filemode='w')
+log = logging.getLogger('metrics_table')
+
+
+METRIC_CATEGORIES = ('e.l1_ca', 'c.data', 'n.L2_NR_MacThroughput', 'pdschResult')
+TIME_PATTERN = re.compile(r'\d{1,2}:\d{2}:\d{2}\.\d+$')
+# The time is one of the first few words of a metric line
+TIME_SEARCH_WORDS = 4
+# A metric time is written as H:MM:SS.ffffff, padded to HH:MM:SS.fffffffff for decoding
+TIME_OF_DAY_WIDTH = len('HH:MM:SS.fffffffff')
+FRACTION_WEIGHTS = 10 ** np.arange(8, -1, -1, dtype=np.int64)
+NS_PER_SECOND = 10 ** 9
+NS_PER_DAY = 24 * 60 * 60 * NS_PER_SECOND
+# A time of day that goes back by more than this is taken to be on the next day
+DAY_ROLLOVER_NS = 12 * 60 * 60 * NS_PER_SECOND
+
+
+class MetricCategory:
+  """
+  The metric lines of one category as NumPy columns.
+
+  Attributes:
+    name: the category, e.g. 'e.l1_ca'
+    time_strings: the time of day of every line, as written in the export
+    timestamps: the time of every line as int64 epoch nanoseconds
+    columns: a dict of metric key to column. Numeric columns are float64 with NaN where a line did not
+      have the key, other columns are strings with '' where a line did not have the key
+    key_positions: the key found at each word position after the time, for exports where the metric is
+      identified by its position in the line
+  """
+  def __init__(self, name, time_strings, timestamps, columns, key_positions):
+    self.name = name
+    self.time_strings = time_strings
+    self.timestamps = timestamps
+    self.columns = columns
+    self.key_positions = key_positions
+
+  def __len__(self):
+    return len(self.time_strings)
+
+  def __repr__(self):
+    return 'MetricCategory({}, {} rows, {} columns)'.format(self.name, len(self), len(self.columns))
+
+  def get_time(self):
+    """Returns the time of every line as a datetime64[ns] array."""
+    return self.timestamps.view('datetime64[ns]')
+
+  def get_keys(self, metric):
+    """Returns the keys that contain metric, in the order they appear in the lines."""
+    return [key for key in self.columns if metric in key]
+
+  def get_column(self, key):
+    """Returns the column of a key."""
+    return self.columns[key]
+
+  def get_position_column(self, position):
+    """Returns the column of the key at a word position after the time.
+
+    Args:
+      position (int): The position of the word after the time, starting at 0
+    """
+    return self.columns[self.key_positions[position]]
+
+  def get_metric_column(self, metric, addative=False):
+    """Gets a metric for every line of the category.
+
+    Args:
+      metric (str): A string the metric key contains, e.g. 'dltp' or '.bw'
+      addative (bool): If True the values of every key that contains metric are added together,
+        otherwise the first key of the line that contains metric is used
+    Returns:
+      values (np.ndarray): the metric of each line, NaN (or '' for text) where the line does not have it
+    """
+    columns = [self.columns[key] for key in self.get_keys(metric)]
+    if addative:
+      columns = [column for column in columns if column.dtype.kind == 'f']
+    if not columns:
+      log.info('{} is not present in {}'.format(metric, self.name))
+      return np.full(len(self), np.nan)
+
+    if addative:
+      columns = np.vstack(columns)
+      values = np.nansum(columns, axis=0)
+      values[np.isnan(columns).all(axis=0)] = np.nan
+      return values
+
+    if any(column.dtype.kind != 'f' for column in columns):
+      columns = [get_text_column(column) for column in columns]
+    values = columns[0].copy()
+    present = get_present(values)
+    for column in columns[1:]:
+      missing = ~present & get_present(column)
+      values[missing] = column[missing]
+      present = present | missing
+    return values
+
+  def get_metric(self, metric, addative=False):
+    """Gets the values of a metric and the time of the lines that have it.
+
+    Args:
+      metric (str): A string the metric key contains, e.g. 'dltp' or '.bw'
+      addative (bool): If True the values of every key that contains metric are added together
+    Returns:
+      time (np.ndarray), values (np.ndarray)
+    """
+    values = self.get_metric_column(metric, addative)
+    present = get_present(values)
+    return self.get_time()[present], values[present]
+
+  def append(self, other):
+    """Appends the rows of another MetricCategory of the same category, e.g. from a newer segment.
+
+    Keys only one of the categories has are filled with NaN (or '') for the rows of the other.
+
+    Args:
+      other (MetricCategory): The rows to add after the rows of this category
+    """
+    num_rows = len(self)
+    num_other_rows = len(other)
+    columns = {}
+    for key in list(self.columns) + [key for key in other.columns if key not in self.columns]:
+      column = self.columns.get(key)
+      other_column = other.columns.get(key)
+      if column is None:
+        column = get_missing_column(other_column, num_rows)
+      if other_column is None:
+        other_column = get_missing_column(column, num_other_rows)
+      if column.dtype.kind != other_column.dtype.kind and 'f' in (column.dtype.kind, other_column.dtype.kind):
+        column = get_text_column(column)
+        other_column = get_text_column(other_column)
+      columns[key] = np.concatenate((column, other_column))
+
+    self.columns = columns
+    self.time_strings = np.concatenate((self.time_strings, other.time_strings))
+    self.timestamps = np.concatenate((self.timestamps, other.timestamps))
+    for position, key in other.key_positions.items():
+      self.key_positions.setdefault(position, key)
+    return self
+
+  def get_joined_metric(self, metric, prefix='', separator='_'):
+    """Joins the values of every key that contains metric into one string per line.
+
+    Used for metrics spread over several keys, such as the bands of a CA combo ('B3_B7_B1').
+
+    Args:
+      metric (str): A string the metric keys contain, e.g. '.band'
+      prefix (str): A string to put in front of each value
+      separator (str): The string between the values
+    Returns:
+      joined (np.ndarray): an object array of the joined string of each line, '' if the line has none
+    """
+    joined = np.full(len(self), '', dtype=object)
+    for key in self.get_keys(metric):
+      column = get_text_column(self.columns[key])
+      present = column != ''
+      values = np.char.add(prefix, column).astype(object)
+      joined = np.where(present, np.where(joined == '', values, joined + separator + values), joined)
+    return joined
+
+
+class MetricsTable:
+  """The MetricCategory of every category of a metrics export."""
+  def __init__(self, categories, start_time=None):
+    """
+    Args:
+      categories (dict): category name to MetricCategory
+      start_time (datetime): The time logging started, the timestamps are anchored to it
+    """
+    self.categories = categories
+    self.start_time = start_time
+
+  def __getitem__(self, category):
+    if category not in self.categories:
+      return MetricCategory(category, np.array([], dtype=str), np.array([], dtype=np.int64), {}, {})
+    return self.categories[category]
+
+  def __contains__(self, category):
+    return category in self.categories
+
+  def append(self, other):
+    """Appends the rows of another MetricsTable, e.g. the metrics of a newer segment of the log.
+
+    Args:
+      other (MetricsTable): The metrics to add after the metrics of this table
+    """
+    for category, metric_category in other.categories.items():
+      if category in self.categories:
+        self.categories[category].append(metric_category)
+      else:
+        self.categories[category] = metric_category
+    return self
+
+  def get_last_timestamp(self):
+    """Returns the latest time in the table as a datetime64[ns], or None if the table is empty."""
+    last_timestamps = [category.timestamps[-1] for category in self.categories.values() if len(category)]
+    if not last_timestamps:
+      return None
+    return np.int64(max(last_timestamps)).view('datetime64[ns]')
+
+  def __repr__(self):
+    return 'MetricsTable({})'.format(list(self.categories.values()))
+
+
+def datetime_to_epoch_ns(time):
+  """Returns a datetime as int64 nanoseconds since the epoch."""
+  return int(np.datetime64(time, 'ns').astype(np.int64))
+
+
+def parse_time_of_day_ns(time_strings):
+  """Decodes metric times of day into nanoseconds since midnight, all at once.
+
+  Args:
+    time_strings (np.ndarray): Times written as H:MM:SS.ffffff
+  Returns:
+    time_of_day_ns (np.ndarray): int64 nanoseconds since midnight
+  """
+  time_strings = np.asarray(time_strings, dtype=str)
+  if not len(time_strings):
+    return np.array([], dtype=np.int64)
+
+  # Give every time the same layout so each digit is at a fixed position
+  time_strings = np.char.add(np.where(np.char.find(time_strings, ':') == 1, '0', ''), time_strings)
+  time_strings = np.char.ljust(time_strings, TIME_OF_DAY_WIDTH, '0').astype('S{}'.format(TIME_OF_DAY_WIDTH))
+  digits = np.frombuffer(time_strings.tobytes(), dtype=np.uint8).reshape(-1, TIME_OF_DAY_WIDTH)
+  digits = digits.astype(np.int64) - ord('0')
+
+  hours = digits[:, 0] * 10 + digits[:, 1]
+  minutes = digits[:, 3] * 10 + digits[:, 4]
+  seconds = digits[:, 6] * 10 + digits[:, 7]
+  return (hours * 3600 + minutes * 60 + seconds) * NS_PER_SECOND + digits[:, 9:] @ FRACTION_WEIGHTS
+
+
+def get_epoch_ns(time_of_day_ns, start_time=None):
+  """Places times of day on their date, counting a day each time the time of day wraps past midnight.
+
+  Args:
+    time_of_day_ns (np.ndarray): int64 nanoseconds since midnight, in log order
+    start_time (datetime): The time logging started. If None the first time is placed on 1970-01-01
+  Returns:
+    timestamps (np.ndarray): int64 epoch nanoseconds
+  """
+  if not len(time_of_day_ns):
+    return np.array([], dtype=np.int64)
+
+  days = np.zeros(len(time_of_day_ns), dtype=np.int64)
+  days[1:] = np.cumsum(np.diff(time_of_day_ns) < -DAY_ROLLOVER_NS)
+
+  midnight = 0
+  if start_time is not None:
+    start_ns = datetime_to_epoch_ns(start_time)
+    midnight = start_ns - start_ns % NS_PER_DAY
+    # Logging started before midnight but the first metric is after it
+    if start_ns - midnight - time_of_day_ns[0] > DAY_ROLLOVER_NS:
+      midnight += NS_PER_DAY
+  return midnight + days * NS_PER_DAY + time_of_day_ns
+
+
+def get_present(column):
+  """Returns a bool array of the rows of a column that have a value."""
+  if column.dtype.kind == 'f':
+    return ~np.isnan(column)
+  return column != ''
+
+
+def get_missing_column(column, num_rows):
+  """Returns a column of num_rows missing values, of the same kind as column."""
+  if column.dtype.kind == 'f':
+    return np.full(num_rows, np.nan)
+  return np.full(num_rows, '', dtype=column.dtype)
+
+
+def get_text_column(column):
+  """Returns a column as strings, with whole numbers written without a decimal point and '' if missing."""
+  if column.dtype.kind != 'f':
+    return column
+  text_column = np.char.mod('%.15g', column)
+  text_column[np.isnan(column)] = ''
+  return text_column
+
+
+def get_typed_column(rows, values, num_rows):
+  """Builds a NumPy column from the values of a key and the rows they were found in.
+
+  Args:
+    rows (list): The row of each value
+    values (list): The string values of the key
+    num_rows (int): The number of rows in the category
+  Returns:
+    column (np.ndarray): float64 with NaN for missing rows if every value is a number, otherwise str
+      with '' for missing rows
+  """
+  values = np.array(values)
+  try:
+    typed_values = values.astype(np.float64)
+  except ValueError:
+    try:
+      typed_values = np.char.replace(values, ',', '').astype(np.float64)
+    except ValueError:
+      typed_values = None
+
+  if typed_values is not None:
+    column = np.full(num_rows, np.nan)
+  else:
+    typed_values = values
+    column = np.full(num_rows, '', dtype=values.dtype)
+  column[rows] = typed_values
+  return column
+
+
+def parse_metrics_table(parsed_log, categories=METRIC_CATEGORIES, start_time=None):
+  """Parses a metrics export into a MetricsTable in a single pass.
+
+  Args:
+    parsed_log (iterable): The lines of a metrics export, a list or a LogSet
+    categories (iterable): The categories to collect. A line is part of every category it contains
+    start_time (datetime): The time logging started, from the infoexport of the log
+  Returns:
+    metrics_table (MetricsTable)
+  """
+  categories = tuple(categories)
+  time_strings = {category: [] for category in categories}
+  key_values = {category: {} for category in categories}
+  key_positions = {category: {} for category in categories}
+
+  for line in parsed_log:
+    line_categories = [category for category in categories if category in line]
+    if not line_categories:
+      continue
+
+    words = line.split()
+    time_index = None
+    for index, word in enumerate(words[:TIME_SEARCH_WORDS]):
+      if TIME_PATTERN.match(word):
+        time_index = index
+        break
+    if time_index is None:
+      log.info('no time found in metric line {}'.format(line))
+      continue
+
+    metrics = []
+    for position, word in enumerate(words[time_index + 1:]):
+      key, separator, value = word.rpartition(':')
+      if separator and key:
+        metrics.append((position, key, value))
+
+    for category in line_categories:
+      row = len(time_strings[category])
+      time_strings[category].append(words[time_index])
+      category_values = key_values[category]
+      category_positions = key_positions[category]
+      for position, key, value in metrics:
+        if key not in category_values:
+          category_values[key] = ([], [])
+        category_values[key][0].append(row)
+        category_values[key][1].append(value)
+        if position not in category_positions:
+          category_positions[position] = key
+
+  metric_categories = {}
+  for category in categories:
+    num_rows = len(time_strings[category])
+    if not num_rows:
+      continue
+    columns = {}
+    for key, (rows, values) in key_values[category].items():
+      columns[key] = get_typed_column(rows, values, num_rows)
+    category_time_strings = np.array(time_strings[category])
+    timestamps = get_epoch_ns(parse_time_of_day_ns(category_time_strings), start_time)
+    metric_categories[category] = MetricCategory(category, category_time_strings, timestamps, columns,
+                                                 key_positions[category])
+    log.info('parsed {}'.format(metric_categories[category]))
+
+  return MetricsTable(metric_categories, start_time)
+
+
+def get_metrics_table(parsed_log, categories=METRIC_CATEGORIES, start_time=None):
+  """Returns the MetricsTable of a metrics export, parsing it if it is not a MetricsTable already.
+
+  Args:
+    parsed_log (MetricsTable or iterable): A MetricsTable, or the lines of a metrics export
+    categories (iterable): The categories to collect if the export needs parsing
+    start_time (datetime): The time logging started, from the infoexport of the log
+  """
+  if isinstance(parsed_log, MetricsTable):
+    return parsed_log
+  return parse_metrics_table(parsed_log, categories, start_time)
@@ -0,0 +1,217 @@
+"""
+An index of the OTA messages in a parsed log, built in a single pass.
+
+The index records the byte offsets of every blank-line delimited OTA message and, optionally, an
+inverted index from the tokens in the log to the messages they appear in. Finding the messages that
+contain a print is then a dictionary lookup instead of a rescan of the whole log.
+
+To use:
+>>>ota_index = get_ota_index(log_set)
+>>>capinfo_requests = ota_index.get_messages_containing('ue-CapabilityRequest')
+"""
+from array import array
+from pathlib import Path
+import weakref
+import bisect
+import logging
+import re
+import io
+import os
+
+from parsers.log_stream import get_log_set
+
+# set up the ota_index logger
+Path(os.getcwd() + '/logs/').mkdir(parents=True, exist_ok=True)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                    datefmt='%m-%d %H:%M',
+                    filename='./logs/tool_log.log',
+                    filemode='w')
+log = logging.getLogger('ota_index')
+
+
+# The characters that separate the tokens of the inverted index. A search term is split the same way,
+# so every token of a search term is a substring of a token in the lines that contain it.
+TOKEN_PATTERN = re.compile(rb'[^\s:=,;(){}\[\]<>"\']+')
+MESSAGE_SEPARATORS = (b'\n', b'\r\n')
+TIMESTAMP_PATTERN = re.compile(r'\d{1,2}:\d{2}:\d{2}\.\d+')
+
+_ota_indexes = weakref.WeakKeyDictionary()
+
+
+class OtaMessageIndex:
+  """
+  The start and end byte offsets of every OTA message in a LogSet, with an optional inverted index of
+  the tokens in each message.
+  """
+  def __init__(self, parsed_log, index_terms=True):
+    """
+    Args:
+      parsed_log (LogSet or Path): The parsed log to index
+      index_terms (bool): If True an inverted index of tokens to message ids is also built
+    """
+    self.log_set = get_log_set(parsed_log)
+    self.index_terms = index_terms
+    self.message_starts = array('q')
+    self.message_ends = array('q')
+    self.message_first_lines = array('q')
+    self.term_index = {}
+    self.term_lookups = {}
+    self.token_lookups = {}
+    self.message_timestamps = {}
+    self.build()
+
+  def __len__(self):
+    return len(self.message_starts)
+
+  def build(self):
+    """Reads the log once and records the offsets (and tokens) of every OTA message."""
+    term_index = self.term_index
+    message_start = None
+    message_tokens = set()
+    line_number = 0
+    for segment_path, segment_offset in zip(self.log_set.segment_paths, self.log_set.segment_offsets):
+      offset = segment_offset
+      with open(segment_path, 'rb') as segment_file:
+        for line in segment_file:
+          if line in MESSAGE_SEPARATORS:
+            if message_start is not None:
+              self.add_message(message_start, offset, message_first_line, message_tokens)
+              message_tokens = set()
+              message_start = None
+          else:
+            if message_start is None:
+              message_start = offset
+              message_first_line = line_number
+            if self.index_terms:
+              message_tokens.update(TOKEN_PATTERN.findall(line))
+          offset += len(line)
+          line_number += 1
+
+    if message_start is not None:
+      self.add_message(message_start, offset, message_first_line, message_tokens)
+    log.info('indexed {} OTA messages and {} terms in {}'.format(len(self), len(term_index), self.log_set))
+
+  def add_message(self, start, end, first_line, tokens):
+    """Adds one message to the index."""
+    message_id = len(self.message_starts)
+    self.message_starts.append(start)
+    self.message_ends.append(end)
+    self.message_first_lines.append(first_line)
+    for token in tokens:
+      message_ids = self.term_index.get(token)
+      if message_ids is None:
+        self.term_index[token] = array('q', [message_id])
+      else:
+        message_ids.append(message_id)
+
+  def get_message(self, message_id):
+    """Reads one OTA message from the log.
+
+    Args:
+      message_id (int): The position of the message in the log, starting at 0
+    Returns:
+      ota_message (list): the lines of the message, as iter_ota_messages() would return them
+    """
+    # read_at() opens its own handles, so messages can be read from several threads at once
+    data = self.log_set.read_at(self.message_starts[message_id],
+                                self.message_ends[message_id] - self.message_starts[message_id])
+    return io.StringIO(data.decode(self.log_set.encoding), newline=None).readlines()
+
+  def get_message_id_for_line(self, line_number):
+    """Returns the id of the message a line is in, or of the message before it if the line is blank.
+    -1 if the line is before the first message."""
+    return bisect.bisect_right(self.message_first_lines, line_number) - 1
+
+  def get_message_timestamp(self, message_id):
+    """Returns the time of a message as written in its first line, or None if it has none."""
+    if message_id not in self.message_timestamps:
+      timestamp = None
+      if message_id >= 0:
+        timestamp = TIMESTAMP_PATTERN.search(self.get_message(message_id)[0])
+      self.message_timestamps[message_id] = timestamp.group() if timestamp else None
+    return self.message_timestamps[message_id]
+
+  def get_message_ids_containing(self, search_term):
+    """Gets the ids of the messages with a line that contains search_term.
+
+    Args:
+      search_term (str): The print to search for. Matched as a substring of the lines, like `in`
+    Returns:
+      message_ids (list): the sorted ids of the matching messages
+    """
+    if search_term in self.term_lookups:
+      return self.term_lookups[search_term]
+
+    encoded_term = search_term.encode(self.log_set.encoding)
+    term_tokens = TOKEN_PATTERN.findall(encoded_term)
+    if not self.index_terms or not term_tokens:
+      candidates = range(len(self))
+      verify = True
+    else:
+      candidates = None
+      for term_token in term_tokens:
+        token_candidates = self.get_token_message_ids(term_token)
+        candidates = token_candidates if candidates is None else candidates & token_candidates
+        if not candidates:
+          break
+      candidates = sorted(candidates)
+      # a search term made of a single token can only be in a line inside one of the tokens found,
+      # anything longer needs the candidate messages checked
+      verify = len(term_tokens) > 1 or term_tokens[0] != encoded_term
+
+    if verify:
+      message_ids = []
+      for message_id in candidates:
+        for line in self.get_message(message_id):
+          if search_term in line:
+            message_ids.append(message_id)
+            break
+    else:
+      message_ids = list(candidates)
+
+    self.term_lookups[search_term] = message_ids
+    return message_ids
+
+  def get_token_message_ids(self, term_token):
+    """Gets the ids of the messages with a token that contains a token of a search term.
+
+    Every token of the index that contains the term token is taken, e.g. bandEUTRA also finds
+    bandEUTRA-r10. The scan of the vocabulary is done once per term token.
+
+    Args:
+      term_token (bytes): A token of a search term, see TOKEN_PATTERN
+    Returns:
+      message_ids (set): the ids of the messages
+    """
+    if term_token not in self.token_lookups:
+      message_ids = set()
+      for token, token_message_ids in self.term_index.items():
+        if term_token in token:
+          message_ids.update(token_message_ids)
+      self.token_lookups[term_token] = message_ids
+    return self.token_lookups[term_token]
+
+  def get_messages_containing(self, search_term):
+    """Gets the OTA messages with a line that contains search_term.
+
+    Args:
+      search_term (str): The print to search for
+    Returns:
+      instances_of_log (list): the lines of each matching message, in log order
+    """
+    return [self.get_message(message_id) for message_id in self.get_message_ids_containing(search_term)]
+
+
+def get_ota_index(parsed_log, index_terms=True):
+  """Returns the OtaMessageIndex of a LogSet, building it the first time it is asked for.
+
+  Args:
+    parsed_log (LogSet): The parsed log to index
+    index_terms (bool): If True the inverted index of tokens is also built
+  """
+  ota_index = _ota_indexes.get(parsed_log)
+  if ota_index is None or (index_terms and not ota_index.index_terms):
+    ota_index = OtaMessageIndex(parsed_log, index_terms)
+    _ota_indexes[parsed_log] = ota_index
+  return ota_index
@@ -0,0 +1,123 @@
+"""
+Decimation of time series before they are plotted.
+
+A plot cannot show more points than it has pixels, so long series are cut down to a target number of
+points first. The min/max envelope keeps the lowest and highest sample of every bucket, so throughput
+dips and spikes survive. Largest-Triangle-Three-Buckets (LTTB) keeps the sample of each bucket that best
+preserves the shape of the line.
+
+To use:
+>>>time, dltp = decimate(time, dltp, max_points=2000)
+"""
+import numpy as np
+
+DEFAULT_MAX_POINTS = 2000
+DECIMATION_METHODS = ('minmax', 'lttb')
+
+
+def get_numeric_x(x):
+  """Returns x as float64, with datetimes and timedeltas as nanoseconds."""
+  x = np.asarray(x)
+  if x.dtype.kind == 'M':
+    x = x.astype('datetime64[ns]').view(np.int64)
+  elif x.dtype.kind == 'm':
+    x = x.astype('timedelta64[ns]').view(np.int64)
+  return x.astype(np.float64)
+
+
+def get_min_max_indices(y, max_points):
+  """Gets the indices of the lowest and highest sample of each bucket of y.
+
+  Args:
+    y (np.ndarray): float64 samples, NaN where there is no sample
+    max_points (int): The most indices to return
+  Returns:
+    indices (np.ndarray): sorted, always including the first and last sample
+  """
+  num_samples = len(y)
+  num_buckets = max(1, (max_points - 2) // 2)
+  bucket_size = -(-num_samples // num_buckets)
+  padding = bucket_size * num_buckets - num_samples
+  # NaNs and the padding are never the lowest or highest of a bucket unless the whole bucket is empty
+  lows = np.pad(np.where(np.isnan(y), np.inf, y), (0, padding), constant_values=np.inf)
+  highs = np.pad(np.where(np.isnan(y), -np.inf, y), (0, padding), constant_values=-np.inf)
+  bucket_starts = np.arange(num_buckets) * bucket_size
+  indices = np.concatenate((
+      [0, num_samples - 1],
+      bucket_starts + lows.reshape(num_buckets, bucket_size).argmin(axis=1),
+      bucket_starts + highs.reshape(num_buckets, bucket_size).argmax(axis=1),
+  ))
+  return np.unique(indices[indices < num_samples])
+
+
+def get_lttb_indices(x, y, max_points):
+  """Gets the indices picked by Largest-Triangle-Three-Buckets.
+
+  Args:
+    x (np.ndarray): float64 sample positions, in increasing order
+    y (np.ndarray): float64 samples
+    max_points (int): The number of indices to return, at least 3
+  Returns:
+    indices (np.ndarray): sorted, always including the first and last sample
+  """
+  num_samples = len(y)
+  # the first and last sample are kept, the rest are split into max_points - 2 buckets
+  bucket_edges = np.linspace(1, num_samples - 1, max_points - 1).astype(np.int64)
+  y = np.nan_to_num(y)
+  indices = np.empty(max_points, dtype=np.int64)
+  indices[0] = 0
+  indices[-1] = num_samples - 1
+  for bucket in range(max_points - 2):
+    start, end = bucket_edges[bucket], bucket_edges[bucket + 1]
+    if bucket + 2 < len(bucket_edges):
+      next_start, next_end = bucket_edges[bucket + 1], bucket_edges[bucket + 2]
+    else:
+      next_start, next_end = num_samples - 1, num_samples
+    next_x = x[next_start:next_end].mean()
+    next_y = y[next_start:next_end].mean()
+    previous = indices[bucket]
+    # twice the area of the triangle between the last kept point, each candidate and the next bucket
+    areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) -
+                   (x[previous] - x[start:end]) * (next_y - y[previous]))
+    indices[bucket + 1] = start + areas.argmax()
+  return indices
+
+
+def get_run_edge_indices(y, max_points):
+  """Gets the first and last sample of every run of equal values, for series that are not numbers.
+
+  If there are still too many, evenly spaced ones are kept.
+  """
+  changes = np.flatnonzero(y[1:] != y[:-1])
+  indices = np.unique(np.concatenate(([0, len(y) - 1], changes, changes + 1)))
+  if len(indices) > max_points:
+    indices = indices[np.linspace(0, len(indices) - 1, max_points).astype(np.int64)]
+  return indices
+
+
+def decimate(x, y, max_points=DEFAULT_MAX_POINTS, method='minmax'):
+  """Cuts a series down to about max_points samples for plotting.
+
+  Args:
+    x (array): The sample positions, e.g. times, in increasing order
+    y (array): The samples
+    max_points (int): The most samples to keep
+    method (str): 'minmax' to keep the envelope, 'lttb' to keep the shape. Series that are not numbers
+      keep the edges of their runs of equal values
+  Returns:
+    x (np.ndarray), y (np.ndarray): the kept samples. The series is returned unchanged if it is short
+  """
+  if method not in DECIMATION_METHODS:
+    raise ValueError('method must be one of {}, not {}'.format(DECIMATION_METHODS, method))
+  x = np.asarray(x)
+  y = np.asarray(y)
+  if len(y) <= max_points or max_points < 3:
+    return x, y
+
+  if y.dtype.kind not in 'biuf':
+    indices = get_run_edge_indices(y, max_points)
+  elif method == 'lttb':
+    indices = get_lttb_indices(get_numeric_x(x), y.astype(np.float64), max_points)
+  else:
+    indices = get_min_max_indices(y.astype(np.float64), max_points)
+  return x[indices], y[indices]
@@ -0,0 +1,249 @@
+"""
+Headless, parallel rendering of report figures.
+
+A figure is described by a FigureSpec holding plain arrays, so it can be sent to a worker process. The
+workers draw the figures on their own Agg canvas and save them as PNGs. For the report PDF the workers
+also send the drawn figures back, and each is saved as a vector page, so its lines stay sharp and its
+text can be selected. pyplot is never used and the global backend is left alone, so nothing tries to open a
+window and importing this module does not stop the interactive plots of a script from showing.
+
+To use:
+>>>figure_spec = FigureSpec('dut-v-ref.png', title='DUT v REF', ylabels={'main': 'TP (Mbps)'})
+>>>figure_spec.add_series(dut_time, dut_dltp, 'b-', label='DUT')
+>>>figure_spec.add_series(ref_time, ref_dltp, 'r-', label='REF', axis='twiny')
+>>>FigureRenderer().render_to_pdf([figure_spec], 'report.pdf')
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import logging
+import os
+
+import matplotlib.dates as md
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_pdf import PdfPages
+import numpy as np
+
+from plotting.decimation import DEFAULT_MAX_POINTS, decimate
+
+# set up the figure_renderer logger
+Path(os.getcwd() + '/logs/').mkdir(parents=True, exist_ok=True)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                    datefmt='%m-%d %H:%M',
+                    filename='./logs/tool_log.log',
+                    filemode='w')
+log = logging.getLogger('figure_renderer')
+
+
+FIGURE_SIZE = (6.4, 4.8)
+FIGURE_DPI = 150
+# The axes a series can be drawn on. The twins share the main axis' x or y axis like Axes.twinx()
+# and Axes.twiny(), 'twiny_twinx' is the twinx of the twiny axis
+AXIS_NAMES = ('main', 'twinx', 'twiny', 'twiny_twinx')
+
+
+class SeriesSpec:
+  """
+  One line of a figure.
+
+  Attributes:
+    x, y: the data, as arrays
+    fmt: the matplotlib format string, e.g. 'b--'
+    label: the legend label
+    axis: the axis to draw on, one of AXIS_NAMES
+    row: the subplot row to draw on, starting at 0
+  """
+  def __init__(self, x, y, fmt='', label=None, axis='main', row=0):
+    if axis not in AXIS_NAMES:
+      raise ValueError('axis must be one of {}, not {}'.format(AXIS_NAMES, axis))
+    self.x = np.asarray(x)
+    self.y = np.asarray(y)
+    self.fmt = fmt
+    self.label = label
+    self.axis = axis
+    self.row = row
+
+
+class FigureSpec:
+  """
+  Everything needed to draw one figure of a report.
+
+  Attributes:
+    file_name: the PNG the figure is saved as
+    title: the title of the first row
+    series: the SeriesSpecs to draw
+    rows: the number of subplot rows, sharing the x axis
+    xlabel: the label of the x axis of the last row
+    ylabels: axis name (or (row, axis name)) to the label of that y axis
+    date_format: a strftime format for x axes holding datetimes, e.g. '%H:%M:%S'
+    horizontal_lines: (row, y) of reference lines to draw
+    max_points: the most points drawn in the figure, shared between its series. None draws every sample
+    decimation: how series are cut down to max_points, 'minmax' or 'lttb', see decimation.decimate()
+  """
+  def __init__(self, file_name, title=None, rows=1, xlabel=None, ylabels=None, date_format=None,
+               max_points=DEFAULT_MAX_POINTS * 4, decimation='minmax'):
+    self.file_name = file_name
+    self.title = title
+    self.series = []
+    self.rows = rows
+    self.xlabel = xlabel
+    self.ylabels = ylabels or {}
+    self.date_format = date_format
+    self.horizontal_lines = []
+    self.max_points = max_points
+    self.decimation = decimation
+
+  def __repr__(self):
+    return 'FigureSpec({}, {} series)'.format(self.file_name, len(self.series))
+
+  def decimate(self):
+    """Cuts every series down to its share of max_points, before the spec is sent to a worker."""
+    if self.max_points and self.series:
+      series_max_points = max(3, self.max_points // len(self.series))
+      for series in self.series:
+        series.x, series.y = decimate(series.x, series.y, series_max_points, self.decimation)
+    return self
+
+  def add_series(self, x, y, fmt='', label=None, axis='main', row=0):
+    """Adds a line to the figure, see SeriesSpec."""
+    self.series.append(SeriesSpec(x, y, fmt, label, axis, row))
+    return self
+
+  def add_horizontal_line(self, y, row=0):
+    """Adds a horizontal reference line to a row."""
+    self.horizontal_lines.append((row, y))
+    return self
+
+
+def get_axis(row_axes, axis_name):
+  """Gets an axis of a subplot row, creating the twin axes the first time they are asked for.
+
+  Args:
+    row_axes (dict): axis name to the axes already created for the row, must hold 'main'
+    axis_name (str): One of AXIS_NAMES
+  """
+  if axis_name not in row_axes:
+    if axis_name == 'twinx':
+      row_axes[axis_name] = row_axes['main'].twinx()
+    elif axis_name == 'twiny':
+      row_axes[axis_name] = row_axes['main'].twiny()
+    else:
+      row_axes[axis_name] = get_axis(row_axes, 'twiny').twinx()
+  return row_axes[axis_name]
+
+
+def draw_figure(figure_spec):
+  """Draws a FigureSpec onto a new figure with an Agg canvas.
+
+  Returns:
+    fig (Figure): the drawn figure
+  """
+  fig = Figure(figsize=FIGURE_SIZE, dpi=FIGURE_DPI)
+  # the canvas is given to the figure, so the backend pyplot uses is not changed
+  FigureCanvasAgg(fig)
+  main_axes = np.atleast_1d(fig.subplots(figure_spec.rows, 1, sharex=True))
+  rows = [{'main': main_axis} for main_axis in main_axes]
+
+  for series in figure_spec.series:
+    axis = get_axis(rows[series.row], series.axis)
+    axis.plot(series.x, series.y, series.fmt, label=series.label)
+    if figure_spec.date_format and np.issubdtype(series.x.dtype, np.datetime64):
+      axis.xaxis.set_major_formatter(md.DateFormatter(figure_spec.date_format))
+  for row, y in figure_spec.horizontal_lines:
+    rows[row]['main'].axhline(y, color='grey', linewidth=0.5)
+
+  for row, row_axes in enumerate(rows):
+    for axis_name, axis in row_axes.items():
+      ylabel = figure_spec.ylabels.get((row, axis_name))
+      if ylabel is None and row == 0:
+        ylabel = figure_spec.ylabels.get(axis_name)
+      if ylabel:
+        axis.set_ylabel(ylabel)
+    # one legend per row with the lines of every axis in it
+    handles = []
+    labels = []
+    for axis in row_axes.values():
+      axis_handles, axis_labels = axis.get_legend_handles_labels()
+      handles.extend(axis_handles)
+      labels.extend(axis_labels)
+    if handles:
+      row_axes['main'].legend(handles, labels, loc='best')
+
+  if figure_spec.title:
+    main_axes[0].set_title(figure_spec.title)
+  if figure_spec.xlabel:
+    main_axes[-1].set_xlabel(figure_spec.xlabel)
+  return fig
+
+
+def render_figure(figure_spec, output_directory=None, keep_figure=False):
+  """Draws a FigureSpec and saves it as a PNG. Run in the worker processes.
+
+  Args:
+    figure_spec (FigureSpec): The figure to draw
+    output_directory (Path): The folder to save the PNG in. Defaults to the working directory
+    keep_figure (bool): If True the drawn figure is returned too, to be saved again e.g. as a PDF page
+  Returns:
+    png_file (Path): the saved PNG, or (png_file, fig) if keep_figure
+  """
+  png_file = Path(output_directory or Path.cwd()) / figure_spec.file_name
+  fig = draw_figure(figure_spec)
+  fig.savefig(png_file)
+  log.info('rendered {}'.format(str(png_file)))
+  return (png_file, fig) if keep_figure else png_file
+
+
+def write_pdf(figures, pdf_file):
+  """Saves drawn figures into a PDF as vector pages, one per page, in order.
+
+  Args:
+    figures (list): The Figures to add
+    pdf_file (Path): The PDF to write
+  """
+  with PdfPages(pdf_file) as output_pdf:
+    for fig in figures:
+      output_pdf.savefig(fig)
+  log.info('wrote {} figures into {}'.format(len(figures), str(pdf_file)))
+  return pdf_file
+
+
+class FigureRenderer:
+  """Renders FigureSpecs in a pool of worker processes."""
+  def __init__(self, workers=None, output_directory=None):
+    """
+    Args:
+      workers (int): The number of worker processes. Defaults to the number of CPUs, 1 renders in this process
+      output_directory (Path): The folder to save the PNGs in. Defaults to the working directory
+    """
+    self.workers = workers or os.cpu_count() or 1
+    self.output_directory = output_directory
+
+  def render(self, figure_specs, keep_figures=False):
+    """Renders every FigureSpec to a PNG.
+
+    Args:
+      figure_specs (list): The figures to render
+      keep_figures (bool): If True the drawn figures are sent back from the workers too
+    Returns:
+      png_files (list): the PNG of each FigureSpec, in the same order. (png_file, fig) pairs if keep_figures
+    """
+    figure_specs = [figure_spec.decimate() for figure_spec in figure_specs]
+    if self.workers == 1 or len(figure_specs) < 2:
+      return [render_figure(figure_spec, self.output_directory, keep_figures) for figure_spec in figure_specs]
+
+    with ProcessPoolExecutor(max_workers=min(self.workers, len(figure_specs))) as executor:
+      return list(executor.map(render_figure, figure_specs, [self.output_directory] * len(figure_specs),
+                               [keep_figures] * len(figure_specs)))
+
+  def render_to_pdf(self, figure_specs, pdf_file):
+    """Renders every FigureSpec to a PNG, and saves the same figures as vector pages of a PDF in order.
+
+    The figures are drawn in the workers, only writing the pages is done in this process.
+
+    Returns:
+      png_files (list): the PNG of each FigureSpec
+    """
+    rendered = self.render(figure_specs, keep_figures=True)
+    write_pdf([fig for _, fig in rendered], pdf_file)
+    return [png_file for png_file, _ in rendered]
@@ -0,0 +1,176 @@
+"""A local fake of the Sheets discovery client, the spreadsheets() resource a SheetHelper is built on.
+
+The fake keeps the tabs of each spreadsheet and the rows written to them in memory, and records every
+request that is executed, so tests can check the calls a SheetHelper really makes.
+
+To use:
+>>>sheets = FakeSpreadsheets({'spreadsheet': {'Sheet1': 4}})
+>>>sheet_helper = SheetHelper(sheet_interface=sheets, drive_interface=FakeDrive(), scheduler=get_fake_scheduler())
+>>>sheets.calls
+"""
+import re
+
+from google_apis.request_scheduler import RequestScheduler
+
+# the tab and first row of a range, e.g. 'My tab'!A5:C7 or Sheet1!A:A
+RANGE_PATTERN = re.compile(r"^(?:'((?:[^']|'')+)'|([^!]+))!?[A-Za-z]*(\d*)")
+
+
+class FakeClock:
+  """A clock that only moves when something sleeps on it."""
+
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.now += seconds
+
+
+def get_fake_scheduler():
+  """Returns a RequestScheduler on a FakeClock, so rate limiting never really sleeps."""
+  clock = FakeClock()
+  return RequestScheduler(clock=clock, sleep=clock.sleep)
+
+
+class FakeRequest:
+  """A request of the fake client. Executing it records the call and applies it to the spreadsheets."""
+
+  def __init__(self, sheets, method, kwargs, apply):
+    self.sheets = sheets
+    self.method = method
+    self.kwargs = kwargs
+    self.apply = apply
+
+  def execute(self):
+    self.sheets.calls.append((self.method, self.kwargs))
+    return self.apply(**self.kwargs)
+
+
+class FakeValues:
+  """The values() resource of the fake client."""
+
+  def __init__(self, sheets):
+    self.sheets = sheets
+
+  def get(self, **kwargs):
+    return FakeRequest(self.sheets, 'values.get', kwargs, self.sheets.get_values)
+
+  def batchGet(self, **kwargs):
+    return FakeRequest(self.sheets, 'values.batchGet', kwargs, self.sheets.batch_get_values)
+
+  def update(self, **kwargs):
+    return FakeRequest(self.sheets, 'values.update', kwargs, self.sheets.update_values)
+
+  def batchUpdate(self, **kwargs):
+    return FakeRequest(self.sheets, 'values.batchUpdate', kwargs, self.sheets.batch_update_values)
+
+
+class FakeSpreadsheets:
+  """The spreadsheets() resource of the fake client.
+
+  Attributes:
+    tabs: spreadsheet id to each tab's title to its sheetId
+    rows: (spreadsheet id, sheetId) to the number of rows written to column A of the tab
+    calls: the (method, keyword arguments) of every executed request, in order
+  """
+
+  def __init__(self, spreadsheets=None):
+    """
+    Args:
+      spreadsheets: spreadsheet id to each tab's title to its number of rows
+    """
+    self.tabs = {}
+    self.rows = {}
+    self.calls = []
+    self.next_sheet_id = 1
+    for spreadsheet_id, tabs in (spreadsheets or {}).items():
+      self.tabs[spreadsheet_id] = {}
+      for title, rows in tabs.items():
+        self.add_tab(spreadsheet_id, title, rows)
+
+  def add_tab(self, spreadsheet_id, title, rows=0):
+    """Adds a tab, returning its properties."""
+    sheet_id = self.next_sheet_id
+    self.next_sheet_id += 1
+    self.tabs.setdefault(spreadsheet_id, {})[title] = sheet_id
+    self.rows[(spreadsheet_id, sheet_id)] = rows
+    return {'sheetId': sheet_id, 'title': title}
+
+  def get_calls(self, method):
+    """Returns the keyword arguments of every call of a method."""
+    return [kwargs for called, kwargs in self.calls if called == method]
+
+  def get_rows(self, spreadsheet_id, title):
+    """Returns the number of rows written to a tab."""
+    return self.rows[(spreadsheet_id, self.tabs[spreadsheet_id][title])]
+
+  def get_range(self, spreadsheet_id, value_range):
+    """Returns the sheetId and first row of a range, the row is None for a whole column."""
+    match = RANGE_PATTERN.match(value_range)
+    title = match.group(1).replace("''", "'") if match.group(1) else match.group(2)
+    return self.tabs[spreadsheet_id][title], int(match.group(3)) if match.group(3) else None
+
+  def write(self, spreadsheet_id, value_range, values):
+    sheet_id, row = self.get_range(spreadsheet_id, value_range)
+    if row is None:
+      self.rows[(spreadsheet_id, sheet_id)] = len(values)
+    elif values:
+      self.rows[(spreadsheet_id, sheet_id)] = max(self.rows[(spreadsheet_id, sheet_id)], row + len(values) - 1)
+
+  def get(self, **kwargs):
+    return FakeRequest(self, 'get', kwargs, self.get_metadata)
+
+  def batchUpdate(self, **kwargs):
+    return FakeRequest(self, 'batchUpdate', kwargs, self.batch_update)
+
+  def values(self):
+    return FakeValues(self)
+
+  def get_metadata(self, spreadsheetId, fields=None):
+    return {'sheets': [{'properties': {'sheetId': sheet_id, 'title': title}}
+                       for title, sheet_id in self.tabs[spreadsheetId].items()]}
+
+  def batch_update(self, spreadsheetId, body):
+    replies = []
+    tabs = self.tabs[spreadsheetId]
+    for request in body['requests']:
+      reply = {}
+      if 'addSheet' in request:
+        reply = {'addSheet': {'properties': self.add_tab(spreadsheetId,
+                                                         request['addSheet']['properties']['title'])}}
+      elif 'deleteSheet' in request:
+        sheet_id = request['deleteSheet']['sheetId']
+        del tabs[next(title for title, tab_id in tabs.items() if tab_id == sheet_id)]
+      elif 'updateSheetProperties' in request:
+        properties = request['updateSheetProperties']['properties']
+        old_title = next(title for title, tab_id in tabs.items() if tab_id == properties['sheetId'])
+        tabs[properties['title']] = tabs.pop(old_title)
+      elif 'insertDimension' in request:
+        dimension_range = request['insertDimension']['range']
+        key = (spreadsheetId, dimension_range['sheetId'])
+        self.rows[key] += dimension_range['endIndex'] - dimension_range['startIndex']
+      replies.append(reply)
+    return {'spreadsheetId': spreadsheetId, 'replies': replies}
+
+  def get_values(self, spreadsheetId, range):
+    sheet_id, _ = self.get_range(spreadsheetId, range)
+    return {'range': range, 'values': [['x']] * self.rows[(spreadsheetId, sheet_id)]}
+
+  def batch_get_values(self, spreadsheetId, ranges):
+    return {'valueRanges': [self.get_values(spreadsheetId, value_range) for value_range in [ranges]]}
+
+  def update_values(self, spreadsheetId, range, valueInputOption, body):
+    self.write(spreadsheetId, range, body.get('values', []))
+    return {'updatedRange': range}
+
+  def batch_update_values(self, spreadsheetId, body):
+    for value_range in body['data']:
+      self.write(spreadsheetId, value_range['range'], value_range.get('values', []))
+    return {'totalUpdatedRanges': len(body['data'])}
+
+
+class FakeDrive:
+  """The Drive resource of the fake client, which nothing in these tests calls."""
@@ -0,0 +1,102 @@
+"""Checks the adb shell sessions against a fake adb, a shell script that runs sh for 'adb shell'.
+
+To use:
+  python -m unittest discover -s tests
+"""
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from constructors.adb_session import AdbShellSession, AdbShellSessionPool, SESSION_FAILED_RETURNCODE
+
+FAKE_ADB = '''#!/bin/sh
+if [ "$1" = "-s" ]; then
+  shift 2
+fi
+if [ "$1" = "shell" ]; then
+  exec sh
+fi
+exit 1
+'''
+
+
+@unittest.skipIf(os.name == 'nt' or shutil.which('sh') is None, 'the fake adb is a posix shell script')
+class TestAdbShellSessionPool(unittest.TestCase):
+
+  def setUp(self):
+    self.folder = Path(tempfile.mkdtemp())
+    self.addCleanup(shutil.rmtree, str(self.folder), True)
+    fake_adb = self.folder / 'adb'
+    fake_adb.write_text(FAKE_ADB)
+    fake_adb.chmod(fake_adb.stat().st_mode | stat.S_IEXEC)
+    self.reconnects = []
+    self.sessions = AdbShellSessionPool(adb_path=fake_adb, timeout=1, on_reconnect=self.reconnects.append)
+    self.addCleanup(self.sessions.close_all)
+
+  def test_stdout_and_stderr_are_framed_per_command(self):
+    output = self.sessions.run('echo out; echo err >&2', 'SERIAL')
+    self.assertEqual((output.returncode, output.stdout, output.stderr), (0, b'out\n', b'err\n'))
+    output = self.sessions.run(['echo', 'next'], 'SERIAL')
+    self.assertEqual((output.stdout, output.stderr), (b'next\n', b''))
+    self.assertEqual(self.sessions.get_session('SERIAL').connections, 1)
+
+  def test_output_without_a_trailing_newline(self):
+    output = self.sessions.run('printf abc; printf def >&2', 'SERIAL')
+    self.assertEqual((output.stdout, output.stderr), (b'abc', b'def'))
+
+  def test_exit_status(self):
+    self.assertEqual(self.sessions.run('false', 'SERIAL').returncode, 1)
+    self.assertEqual(self.sessions.run('(exit 7)', 'SERIAL').returncode, 7)
+    self.assertEqual(self.sessions.run('true', 'SERIAL').returncode, 0)
+
+  def test_timeout_closes_the_session_and_the_next_command_reconnects(self):
+    output = self.sessions.run('sleep 3', 'SERIAL')
+    self.assertEqual(output.returncode, SESSION_FAILED_RETURNCODE)
+    self.assertIn(b'timed out', output.stderr)
+    output = self.sessions.run('echo back', 'SERIAL')
+    self.assertEqual(output.stdout, b'back\n')
+    self.assertEqual(self.sessions.get_session('SERIAL').connections, 2)
+    self.assertEqual(self.reconnects, [])
+
+  def test_drop_while_running_is_not_sent_again(self):
+    ran = self.folder / 'ran'
+    output = self.sessions.run('echo ran >> {}; exit 3'.format(ran), 'SERIAL')
+    self.assertEqual(output.returncode, SESSION_FAILED_RETURNCODE)
+    self.assertEqual(ran.read_text(), 'ran\n')
+    self.assertEqual(self.reconnects, ['SERIAL'])
+
+    output = self.sessions.run('echo back', 'SERIAL')
+    self.assertEqual(output.stdout, b'back\n')
+    self.assertEqual(self.sessions.get_session('SERIAL').connections, 2)
+
+  def test_session_dropped_between_commands_reconnects(self):
+    self.sessions.run('true', 'SERIAL')
+    session = self.sessions.get_session('SERIAL')
+    session.process.kill()
+    session.process.wait()
+    output = self.sessions.run('echo back', 'SERIAL')
+    self.assertEqual(output.stdout, b'back\n')
+    self.assertEqual(self.reconnects, ['SERIAL'])
+
+  def test_command_not_written_is_sent_again(self):
+    self.sessions.run('true', 'SERIAL')
+    session = self.sessions.get_session('SERIAL')
+    dead_process = session.process
+    dead_process.kill()
+    dead_process.wait()
+    is_alive = AdbShellSession.is_alive
+    # the dead shell still looks alive, so the command is written to its closed stdin
+    with mock.patch.object(AdbShellSession, 'is_alive',
+                           lambda session: session.process is dead_process or is_alive(session)):
+      output = self.sessions.run('echo back', 'SERIAL')
+    self.assertEqual(output.stdout, b'back\n')
+    self.assertEqual(self.reconnects, ['SERIAL'])
+    self.assertEqual(session.connections, 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
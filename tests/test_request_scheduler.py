@@ -0,0 +1,121 @@
+"""Checks the RequestScheduler against a throttling fake, with a fake clock so nothing really sleeps.
+
+To use:
+  python -m unittest discover -s tests
+"""
+import unittest
+from unittest import mock
+
+from google_apis.request_scheduler import RequestScheduler, TokenBucket
+
+
+class FakeClock:
+  """A clock that only moves when something sleeps on it, remembering every sleep."""
+
+  def __init__(self):
+    self.now = 0.0
+    self.sleeps = []
+
+  def __call__(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.sleeps.append(seconds)
+    self.now += seconds
+
+
+class FakeHttpError(Exception):
+  """Looks like a googleapiclient HttpError to the scheduler, an error with resp.status."""
+
+  def __init__(self, status):
+    super().__init__('HTTP {}'.format(status))
+    self.resp = mock.Mock(status=status)
+
+
+class FakeRequest:
+  """A request that fails with the given statuses in turn, then succeeds."""
+
+  def __init__(self, statuses):
+    self.statuses = list(statuses)
+    self.executions = 0
+
+  def execute(self):
+    self.executions += 1
+    if self.statuses:
+      raise FakeHttpError(self.statuses.pop(0))
+    return 'done'
+
+
+class TestRequestScheduler(unittest.TestCase):
+
+  def setUp(self):
+    self.clock = FakeClock()
+    self.scheduler = RequestScheduler(quotas={'write': 60}, max_retries=3, base_delay=1.0, max_delay=64.0,
+                                      clock=self.clock, sleep=self.clock.sleep)
+    # the backoff is the top of its jitter range, so the sleeps can be checked exactly
+    patcher = mock.patch('google_apis.request_scheduler.random.uniform', side_effect=lambda low, high: high)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_throttled_request_backs_off_exponentially(self):
+    request = FakeRequest([429, 429])
+    self.assertEqual(self.scheduler.execute(request), 'done')
+    self.assertEqual(request.executions, 3)
+    self.assertEqual(self.clock.sleeps, [1.0, 2.0])
+    self.assertEqual((self.scheduler.retries, self.scheduler.throttled), (2, 2))
+
+  def test_throttled_request_drains_the_bucket(self):
+    bucket = self.scheduler.buckets['write']
+    self.scheduler.execute(FakeRequest([429]), idempotent=False)
+    # the drained bucket refilled one token during the backoff, and the retry took it
+    self.assertLess(bucket.tokens, 1)
+
+  def test_retries_run_out(self):
+    request = FakeRequest([429] * 10)
+    with self.assertRaises(FakeHttpError):
+      self.scheduler.execute(request)
+    self.assertEqual(request.executions, 4)
+
+  def test_idempotent_request_is_retried_on_server_error(self):
+    request = FakeRequest([500, 503])
+    self.assertEqual(self.scheduler.execute(request), 'done')
+    self.assertEqual(request.executions, 3)
+    self.assertEqual(self.scheduler.throttled, 0)
+
+  def test_non_idempotent_request_is_only_retried_when_throttled(self):
+    throttled = FakeRequest([429])
+    self.assertEqual(self.scheduler.execute(throttled, idempotent=False), 'done')
+    self.assertEqual(throttled.executions, 2)
+
+    failed = FakeRequest([500])
+    with self.assertRaises(FakeHttpError):
+      self.scheduler.execute(failed, idempotent=False)
+    self.assertEqual(failed.executions, 1)
+
+  def test_other_errors_are_not_retried(self):
+    request = FakeRequest([400])
+    with self.assertRaises(FakeHttpError):
+      self.scheduler.execute(request)
+    self.assertEqual(request.executions, 1)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+  def setUp(self):
+    self.clock = FakeClock()
+    self.bucket = TokenBucket(60, capacity=5, clock=self.clock, sleep=self.clock.sleep)
+
+  def test_burst_then_steady_rate(self):
+    for _ in range(5):
+      self.assertEqual(self.bucket.acquire(), 0)
+    self.assertEqual(self.bucket.acquire(), 1.0)
+
+  def test_drain_makes_the_next_request_wait(self):
+    self.bucket.drain()
+    self.assertEqual(self.bucket.tokens, 0)
+    self.assertEqual(self.bucket.acquire(), 1.0)
+    self.assertEqual(self.clock.sleeps, [1.0])
+
+
+if __name__ == '__main__':
+  unittest.main()
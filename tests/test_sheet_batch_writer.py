@@ -0,0 +1,98 @@
+"""Checks the SheetBatchWriter through a real SheetHelper on a local fake of the Sheets discovery client.
+
+To use:
+  python -m unittest discover -s tests
+"""
+import unittest
+from unittest import mock
+
+from fake_sheets_client import FakeDrive, FakeSpreadsheets, get_fake_scheduler
+from google_apis.sheet_batch_writer import SheetBatchWriter
+
+try:
+  from google_apis.sheet_helper import SheetHelper
+except ImportError:
+  SheetHelper = None
+
+
+@unittest.skipIf(SheetHelper is None, 'the Google API client libraries are not installed')
+class TestSheetBatchWriter(unittest.TestCase):
+
+  def setUp(self):
+    self.sheets = FakeSpreadsheets({'spreadsheet': {'All logs': 4, 'Summary': 0}})
+    self.sheet_helper = SheetHelper(sheet_interface=self.sheets, drive_interface=FakeDrive(),
+                                    scheduler=get_fake_scheduler())
+
+  def get_methods(self):
+    return [method for method, _ in self.sheets.calls]
+
+  def test_new_sheets_with_data_take_two_calls(self):
+    with SheetBatchWriter(self.sheet_helper, 'spreadsheet') as writer:
+      for log in range(3):
+        writer.new_worksheet_with_data('Log {}'.format(log), '!A1', 'spreadsheet', {'values': [[log]]})
+    self.assertEqual(self.get_methods(), ['batchUpdate', 'values.batchUpdate'])
+    requests = self.sheets.get_calls('batchUpdate')[0]['body']['requests']
+    self.assertEqual([request['addSheet']['properties']['title'] for request in requests],
+                     ['Log 0', 'Log 1', 'Log 2'])
+    data = self.sheets.get_calls('values.batchUpdate')[0]['body']['data']
+    self.assertEqual([value_range['range'] for value_range in data], ['Log 0!A1', 'Log 1!A1', 'Log 2!A1'])
+    self.assertEqual(self.sheets.get_rows('spreadsheet', 'Log 2'), 1)
+
+  def test_appended_rows_follow_each_other_with_one_read(self):
+    writer = SheetBatchWriter(self.sheet_helper, 'spreadsheet')
+    self.assertEqual(writer.append_rows([[1], [2]], 'All logs'), 5)
+    self.assertEqual(writer.append_rows([[3]], 'All logs'), 7)
+    writer.flush()
+    self.assertEqual(writer.append_rows([[4]], 'All logs'), 8)
+    writer.flush()
+    self.assertEqual(self.get_methods(), ['values.get', 'values.batchUpdate', 'values.batchUpdate'])
+    self.assertEqual(self.sheets.get_rows('spreadsheet', 'All logs'), 8)
+
+  def test_rows_reserved_on_a_new_tab_survive_its_creation(self):
+    writer = SheetBatchWriter(self.sheet_helper, 'spreadsheet')
+    writer.new_worksheet('Log 1')
+    self.assertEqual(writer.append_rows([[1], [2]], 'Log 1'), 1)
+    writer.flush()
+    self.assertEqual(writer.append_rows([[3]], 'Log 1'), 3)
+    writer.flush()
+    self.assertEqual(self.sheets.get_rows('spreadsheet', 'Log 1'), 3)
+    self.assertNotIn('values.get', self.get_methods())
+
+  def test_structural_requests_and_values_keep_their_order(self):
+    writer = SheetBatchWriter(self.sheet_helper, 'spreadsheet')
+    writer.update_sheet({'values': [[1]]}, 'Summary!A1')
+    sheet_id = self.sheet_helper.get_sheet_id('Summary', 'spreadsheet')
+    writer.add_request({'updateSheetProperties': {'properties': {'sheetId': sheet_id, 'title': 'Totals'},
+                                                  'fields': 'title'}})
+    writer.update_sheet({'values': [[2]]}, 'Totals!A2')
+    writer.flush()
+    self.assertEqual(self.get_methods(), ['get', 'values.batchUpdate', 'batchUpdate', 'values.batchUpdate'])
+    self.assertEqual(self.sheets.get_rows('spreadsheet', 'Totals'), 2)
+
+  def test_flushes_when_a_size_threshold_is_passed(self):
+    writer = SheetBatchWriter(self.sheet_helper, 'spreadsheet', max_ranges=2)
+    writer.update_sheet({'values': [[1]]}, 'Summary!A1')
+    self.assertEqual(self.sheets.calls, [])
+    writer.update_sheet({'values': [[2]]}, 'Summary!A2')
+    self.assertEqual(self.get_methods(), ['values.batchUpdate'])
+    self.assertFalse(writer.batches)
+
+  def test_flush_interval_is_checked_on_write_and_by_flush_if_due(self):
+    with mock.patch('google_apis.sheet_batch_writer.time.monotonic', return_value=0.0) as monotonic:
+      writer = SheetBatchWriter(self.sheet_helper, 'spreadsheet', flush_interval=10.0)
+      writer.update_sheet({'values': [[1]]}, 'Summary!A1')
+      monotonic.return_value = 11.0
+      # nothing is written, so nothing is flushed until the loop polls
+      self.assertEqual(self.sheets.calls, [])
+      self.assertEqual(len(writer.flush_if_due()), 1)
+      self.assertEqual(writer.flush_if_due(), [])
+    self.assertEqual(self.get_methods(), ['values.batchUpdate'])
+
+  def test_writes_to_another_spreadsheet_are_refused(self):
+    writer = SheetBatchWriter(self.sheet_helper, 'spreadsheet')
+    with self.assertRaises(ValueError):
+      writer.update_sheet({'values': [[1]]}, 'Summary!A1', 'another spreadsheet')
+
+
+if __name__ == '__main__':
+  unittest.main()
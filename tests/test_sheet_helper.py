@@ -0,0 +1,91 @@
+"""Checks the sheet id and next row caches of SheetHelper on a local fake of the Sheets discovery client.
+
+To use:
+  python -m unittest discover -s tests
+"""
+import unittest
+
+from fake_sheets_client import FakeDrive, FakeSpreadsheets, get_fake_scheduler
+
+try:
+  from google_apis.sheet_helper import SheetHelper
+except ImportError:
+  SheetHelper = None
+
+
+@unittest.skipIf(SheetHelper is None, 'the Google API client libraries are not installed')
+class TestSheetHelperCache(unittest.TestCase):
+
+  def setUp(self):
+    self.sheets = FakeSpreadsheets({'spreadsheet': {'Log': 4, 'My tab': 2}})
+    self.sheet_helper = SheetHelper(sheet_interface=self.sheets, drive_interface=FakeDrive(),
+                                    scheduler=get_fake_scheduler())
+
+  def count(self, method):
+    return len(self.sheets.get_calls(method))
+
+  def test_appends_read_the_column_once(self):
+    rows = [self.sheet_helper.append_rows([[append]], 'Log', 'spreadsheet') for append in range(5)]
+    self.assertEqual(rows, [5, 6, 7, 8, 9])
+    self.assertEqual(self.count('values.get'), 1)
+    self.assertEqual(self.count('values.update'), 5)
+    self.assertEqual(self.sheets.get_rows('spreadsheet', 'Log'), 9)
+
+  def test_rename_then_append_keeps_the_next_row(self):
+    self.sheet_helper.append_rows([[1]], 'Log', 'spreadsheet')
+    self.sheet_helper.rename_sheet('Log', 'Old log', 'spreadsheet')
+    self.assertEqual(self.sheet_helper.append_rows([[2]], 'Old log', 'spreadsheet'), 6)
+    self.assertEqual(self.sheets.get_calls('values.update')[-1]['range'], 'Old log!A6')
+    self.assertEqual(self.count('values.get'), 1)
+    self.assertNotIn(('spreadsheet', 'Log'), self.sheet_helper.next_rows)
+
+  def test_delete_then_add_again_starts_at_the_first_row(self):
+    self.sheet_helper.append_rows([[1]], 'Log', 'spreadsheet')
+    self.sheet_helper.delete_worksheet('Log', 'spreadsheet')
+    self.sheet_helper.new_worksheet('Log', 'spreadsheet')
+    self.assertEqual(self.sheet_helper.append_rows([[2]], 'Log', 'spreadsheet'), 1)
+    self.assertEqual(self.count('values.get'), 1)
+    self.assertEqual(self.sheet_helper.get_sheet_id('Log', 'spreadsheet'),
+                     self.sheets.tabs['spreadsheet']['Log'])
+
+  def test_delete_without_cached_sheet_ids_forgets_the_next_rows(self):
+    self.sheet_helper.append_rows([[1]], 'Log', 'spreadsheet')
+    sheet_id = self.sheets.tabs['spreadsheet']['Log']
+    self.sheet_helper.batch_update({'requests': [{'deleteSheet': {'sheetId': sheet_id}}]}, 'spreadsheet')
+    self.assertEqual(self.sheet_helper.next_rows, {})
+    self.sheet_helper.batch_update({'requests': [{'addSheet': {'properties': {'title': 'Log'}}}]},
+                                   'spreadsheet')
+    self.assertEqual(self.sheet_helper.append_rows([[2]], 'Log', 'spreadsheet'), 1)
+
+  def test_whole_column_write_clears_the_next_row(self):
+    self.sheet_helper.append_rows([[1]], 'Log', 'spreadsheet')
+    self.sheet_helper.update_sheet({'values': [[1], [2]]}, 'Log!A:A', 'spreadsheet')
+    self.assertEqual(self.sheet_helper.append_rows([[3]], 'Log', 'spreadsheet'), 3)
+    self.assertEqual(self.count('values.get'), 2)
+
+  def test_write_to_a_quoted_title_moves_the_next_row(self):
+    self.assertEqual(self.sheet_helper.append_rows([[1]], 'My tab', 'spreadsheet'), 3)
+    self.sheet_helper.update_sheet({'values': [[2], [3]]}, "'My tab'!A4:A5", 'spreadsheet')
+    self.assertEqual(self.sheet_helper.append_rows([[4]], 'My tab', 'spreadsheet'), 6)
+    self.assertEqual(self.count('values.get'), 1)
+
+  def test_row_changing_request_clears_the_next_rows(self):
+    self.sheet_helper.append_rows([[1]], 'Log', 'spreadsheet')
+    sheet_id = self.sheets.tabs['spreadsheet']['Log']
+    self.sheet_helper.batch_update({'requests': [{'insertDimension': {
+        'range': {'sheetId': sheet_id, 'dimension': 'ROWS', 'startIndex': 0, 'endIndex': 2}}}]},
+                                   'spreadsheet')
+    self.assertEqual(self.sheet_helper.append_rows([[2]], 'Log', 'spreadsheet'), 8)
+    self.assertEqual(self.count('values.get'), 2)
+
+  def test_sheet_ids_are_fetched_once(self):
+    self.sheet_helper.get_sheet_id('Log', 'spreadsheet')
+    self.sheet_helper.get_sheet_id('My tab', 'spreadsheet')
+    self.assertEqual(self.count('get'), 1)
+    self.sheet_helper.new_worksheet('New', 'spreadsheet')
+    self.assertEqual(self.sheet_helper.get_sheet_id('New', 'spreadsheet'), self.sheets.tabs['spreadsheet']['New'])
+    self.assertEqual(self.count('get'), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()